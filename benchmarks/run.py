@@ -0,0 +1,296 @@
+"""End-to-end benchmarks for the report entry points.
+
+Each target's main() runs in a fresh child process against utils.fake_redash,
+with SlackBot replaced by a stub that only records the upload, so runs need no
+credentials and are comparable across changes to the client or the writers.
+Per run the results file records:
+
+  wall_s            main() wall time (imports excluded, see import_s)
+  requests          HTTP requests served, in total and by route
+  bytes_downloaded  response bytes served to the client
+  peak_rss_mb       the child's peak resident memory
+  stages            wall time per stage, see benchmarks/stages.py
+  busy              summed call time per stage
+  uploaded_bytes    size of the file handed to Slack
+
+  python -m benchmarks.run                          # every target
+  python -m benchmarks.run kpi weekly.vn --repeat 3 --runtime 1.0 --rows 500
+  python -m benchmarks.run --baseline benchmarks/results/<earlier>.json
+  python -m benchmarks.run kpi --replay recordings/ --replay-speed 10
+
+With --replay, each target answers from DIR/<target>.jsonl.gz, a run recorded
+with REDASH_RECORD (see utils/replay.py), instead of the fake server, so job
+runtimes and result sizes are the real ones.
+
+Results go to benchmarks/results/<UTC time>.json (or --out). With --baseline,
+the medians are compared target by target against an earlier results file.
+"""
+import argparse
+import ast
+import importlib
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime, timezone
+
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# name -> dotted module, or a path under the repo for "kpi tracking/"
+TARGETS = {
+  "monthly.sg": "monthly.sg",
+  "monthly.th": "monthly.th",
+  "monthly.vn": "monthly.vn",
+  "monthly.all_j": "monthly.all_j",
+  "weekly.ny": "weekly.ny",
+  "weekly.vn": "weekly.vn",
+  "kpi": "kpi tracking/kpi.py",
+  "regional_od": "kpi tracking/regional_od.py",
+}
+# module-level writers timed as render when a script has them
+RENDER_FUNCTIONS = ["write_sheet", "build_workbook"]
+SUMMARY = ["wall_s", "requests", "bytes_downloaded", "peak_rss_mb"]
+# how the scripts name the frames get_result returns (df1, bq3, ...)
+RESULT_FRAME = re.compile(r"^(df|bq)\d+$")
+
+
+def load_target(name):
+  target = TARGETS[name]
+  if target.endswith(".py"):
+    from monthly.all_reports import load
+    return load(target)
+  return importlib.import_module(target)
+
+
+def result_columns(name):
+  """Columns a target reads off its result frames (df1.completed, df3["unique"],
+  Col(3106, "completed")), so the fake server's generated results carry them."""
+  target = TARGETS[name]
+  path = target if target.endswith(".py") else target.replace(".", os.sep) + ".py"
+  with open(os.path.join(ROOT, path)) as f:
+    tree = ast.parse(f.read())
+  columns = set()
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and RESULT_FRAME.match(node.value.id):
+      columns.add(node.attr)
+    elif (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and RESULT_FRAME.match(node.value.id)
+          and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)):
+      columns.add(node.slice.value)
+    elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "Col"
+          and len(node.args) == 2 and isinstance(node.args[1], ast.Constant) and isinstance(node.args[1].value, str)):
+      columns.add(node.args[1].value)
+  return sorted(column for column in columns if not hasattr(pd.DataFrame, column))
+
+
+def instrument(module, stages, uploads):
+  import openpyxl
+  import xlsxwriter
+
+  from utils.helpers import AsyncRedash, Redash
+
+  stages.wrap(Redash, "_Redash__submit", "submit")
+  stages.wrap(Redash, "data_source", "submit")
+  stages.wrap(Redash, "poll_job", "poll")
+  stages.wrap(Redash, "get_result", "download")
+  for client in (Redash, AsyncRedash):
+    stages.wrap(client, "run_queries", "wait")
+    client.run_blocks = stages.timed("wait", stages.blocks(client.run_blocks))
+
+  stages.wrap(pd.DataFrame, "to_csv", "render")
+  stages.wrap(pd.DataFrame, "to_excel", "render")
+  stages.wrap(xlsxwriter.Workbook, "close", "render")
+  stages.wrap(openpyxl.Workbook, "save", "render")
+  for name in RENDER_FUNCTIONS:
+    stages.wrap(module, name, "render")
+
+  class SlackBot:
+    def __init__(self, *args, **kwargs):
+      pass
+
+    def uploadFile(self, file, channel, comment):
+      uploads.append(os.path.getsize(file))
+
+  SlackBot.uploadFile = stages.timed("upload", SlackBot.uploadFile)
+  module.SlackBot = SlackBot
+
+
+def child(name, out):
+  """Run one target's main() in this process and write its measurements to `out`."""
+  from benchmarks.stages import Stages
+  from utils import replay as replays
+
+  started = time.perf_counter()
+  module = load_target(name)
+  import_s = time.perf_counter() - started
+
+  stages, uploads = Stages(), []
+  instrument(module, stages, uploads)
+  sys.argv = [name]
+  error = None
+  start = time.perf_counter()
+  try:
+    module.main()
+  except BaseException as e:
+    traceback.print_exc()
+    error = f"{type(e).__name__}: {e}"
+  end = time.perf_counter()
+
+  attributed, busy = stages.summary(start, end)
+  with open(out, "w") as f:
+    json.dump({
+      "ok": error is None,
+      "error": error,
+      "import_s": round(import_s, 4),
+      "wall_s": round(end - start, 4),
+      "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+      "stages": attributed,
+      "busy": busy,
+      "uploaded_bytes": sum(uploads),
+      "replayed": replays.stats() if os.getenv("REDASH_REPLAY") else None,
+    }, f)
+
+
+def run_target(server, name, quiet, replay=None, replay_speed=1.0):
+  with tempfile.TemporaryDirectory() as workdir:
+    out = os.path.join(workdir, "result.json")
+    env = dict(os.environ)
+    for var in ("REDASH_CACHE_DIR", "REDASH_MAX_AGE"):
+      env.pop(var, None)
+    env.update(
+      REDASH_BASE_URL=server.url,
+      REDASH_API_KEY="benchmark",
+      METRICS_DB=os.path.join(workdir, "metrics.sqlite"),
+      PYTHONPATH=os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")])),
+    )
+    if replay:
+      env.update(REDASH_REPLAY=os.path.abspath(replay), REDASH_REPLAY_SPEED=str(replay_speed))
+    with server.lock:
+      server.stats.clear()
+      server.columns = result_columns(name)
+    output = subprocess.DEVNULL if quiet else None
+    code = subprocess.call([sys.executable, "-m", "benchmarks.run", "--child", name, "--child-out", out],
+                           cwd=workdir, env=env, stdout=output, stderr=output)
+    if os.path.exists(out):
+      with open(out) as f:
+        result = json.load(f)
+    else:
+      result = {"ok": False, "error": f"child exited with {code}"}
+
+  replayed = result.pop("replayed", None)
+  if replayed is not None:
+    result.update(requests=replayed.get("requests", 0), bytes_downloaded=replayed.get("bytes", 0), requests_by_route={})
+    return result
+  with server.lock:
+    stats = dict(server.stats)
+  result["requests"] = stats.pop("requests", 0)
+  result["bytes_downloaded"] = stats.pop("bytes_sent", 0)
+  result["requests_by_route"] = {route: n for route, n in stats.items() if ":" not in route}
+  return result
+
+
+def recording(directory, name):
+  return os.path.join(directory, f"{name}.jsonl.gz")
+
+
+def summarise(runs):
+  summary = {}
+  for name in dict.fromkeys(run["target"] for run in runs):
+    done = [run for run in runs if run["target"] == name and run["ok"]]
+    summary[name] = {key: statistics.median(run[key] for run in done) for key in SUMMARY} if done else None
+  return summary
+
+
+def compare(summary, baseline):
+  print(f"\n{'target':<16}" + "".join(f"{key:>26}" for key in SUMMARY))
+  for name, current in summary.items():
+    before = baseline.get(name)
+    cells = []
+    for key in SUMMARY:
+      if not current or not before:
+        cells.append("-")
+        continue
+      change = f" ({(current[key] - before[key]) / before[key]:+.0%})" if before[key] else ""
+      cells.append(f"{before[key]:g} -> {current[key]:g}{change}")
+    print(f"{name:<16}" + "".join(f"{cell:>26}" for cell in cells))
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the report entry points against a fake Redash.")
+  parser.add_argument("targets", nargs="*", help=f"targets to run (default: all): {', '.join(TARGETS)}")
+  parser.add_argument("--repeat", type=int, default=1)
+  parser.add_argument("--runtime", type=float, default=0.3, help="seconds each fake job runs")
+  parser.add_argument("--rows", type=int, default=1, help="rows in each generated result (the monthly scripts expect 1)")
+  parser.add_argument("--throttle", type=float, default=0.0, help="fraction of requests answered with 429")
+  parser.add_argument("--fixtures", help="directory of {query_id}.csv results")
+  parser.add_argument("--replay", metavar="DIR", help="replay DIR/<target>.jsonl.gz recordings instead")
+  parser.add_argument("--replay-speed", type=float, default=1.0, help="replay speed-up, 0 for no waiting")
+  parser.add_argument("--out", help="results file (default: benchmarks/results/<UTC time>.json)")
+  parser.add_argument("--baseline", help="earlier results file to compare against")
+  parser.add_argument("--verbose", action="store_true", help="show the scripts' own output")
+  parser.add_argument("--child", help=argparse.SUPPRESS)
+  parser.add_argument("--child-out", help=argparse.SUPPRESS)
+  options = parser.parse_args()
+
+  if options.child:
+    return child(options.child, options.child_out)
+  unknown = [name for name in options.targets if name not in TARGETS]
+  if unknown:
+    parser.error(f"unknown targets: {', '.join(unknown)}")
+
+  from utils.fake_redash import FakeRedash
+
+  config = dict(runtime=options.runtime, rows=options.rows, throttle=options.throttle, fixtures=options.fixtures,
+                replay=options.replay, replay_speed=options.replay_speed)
+  targets = options.targets or list(TARGETS)
+  if options.replay:
+    missing = [name for name in targets if not os.path.exists(recording(options.replay, name))]
+    for name in missing:
+      print(f"{name:<16} skipped: no {recording(options.replay, name)}")
+    targets = [name for name in targets if name not in missing]
+  runs = []
+  with FakeRedash(default_runtime=options.runtime, rows=options.rows, throttle=options.throttle, fixtures=options.fixtures) as server:
+    for name in targets:
+      for repeat in range(options.repeat):
+        replay = recording(options.replay, name) if options.replay else None
+        result = run_target(server, name, not options.verbose, replay, options.replay_speed)
+        runs.append({"target": name, "repeat": repeat, **result})
+        status = "ok" if result["ok"] else f"FAILED ({result['error']})"
+        print(f"{name:<16} {result.get('wall_s', 0):8.2f}s {result['requests']:6d} requests  {status}")
+
+  summary = summarise(runs)
+  out = options.out or os.path.join(ROOT, "benchmarks", "results", datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ.json"))
+  os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+  with open(out, "w") as f:
+    json.dump({
+      "created": datetime.now(timezone.utc).isoformat(),
+      "commit": git_commit(),
+      "python": platform.python_version(),
+      "config": config,
+      "summary": summary,
+      "runs": runs,
+    }, f, indent=2)
+  print(f"Results written to {out}")
+
+  if options.baseline:
+    with open(options.baseline) as f:
+      compare(summary, json.load(f)["summary"])
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,105 @@
+"""Per-stage timing for one report run.
+
+The Redash client, the writers and the Slack upload are wrapped in place so
+each call records a (start, end) interval under its stage. Calls overlap (the
+clients poll and download on worker threads, kpi.py builds regions in
+parallel), so every moment of the run's wall time is attributed to the
+highest-priority stage active then, and whatever is left over is extract:
+
+  upload > render > download > submit > poll > extract
+
+`poll` covers the status requests and the time run_queries/run_blocks spend
+waiting on jobs; block functions running inside run_blocks count as extract.
+The attributed stages sum to the wall time. `busy` is the plain sum of call
+durations per stage, which can exceed the wall time when calls run in parallel.
+"""
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from functools import wraps
+
+# interval name -> reported stage, in priority order
+PRIORITY = [
+  ("upload", "upload"),
+  ("render", "render"),
+  ("download", "download"),
+  ("submit", "submit"),
+  ("poll", "poll"),
+  ("block", "extract"),
+  ("wait", "poll"),
+]
+STAGES = ["submit", "poll", "download", "extract", "render", "upload"]
+
+
+class Stages:
+  def __init__(self):
+    self.intervals = defaultdict(list)
+    self.lock = threading.Lock()
+
+  def record(self, name, start, end):
+    with self.lock:
+      self.intervals[name].append((start, end))
+
+  def timed(self, name, fn):
+    @wraps(fn)
+    def call(*args, **kwargs):
+      start = time.perf_counter()
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        self.record(name, start, time.perf_counter())
+    return call
+
+  def wrap(self, owner, attr, name):
+    """Time every call of owner.attr (a class method or module function) as `name`."""
+    fn = getattr(owner, attr, None)
+    if fn is not None:
+      setattr(owner, attr, self.timed(name, fn))
+
+  def blocks(self, fn):
+    # run_blocks waits like run_queries, but the block functions it calls are
+    # the script's own work.
+    @wraps(fn)
+    def call(client, blocks):
+      blocks = {name: (needs, self.timed("block", block)) for name, (needs, block) in blocks.items()}
+      return fn(client, blocks)
+    return call
+
+  def summary(self, start, end):
+    """({stage: attributed seconds}, {stage: busy seconds}) for the run from start to end."""
+    merged = {name: merge(self.intervals.get(name, []), start, end) for name, _ in PRIORITY}
+    points = sorted({start, end, *(t for spans in merged.values() for span in spans for t in span)})
+    stages = dict.fromkeys(STAGES, 0.0)
+    for a, b in zip(points, points[1:]):
+      middle = (a + b) / 2
+      stage = next((stage for name, stage in PRIORITY if active(merged[name], middle)), "extract")
+      stages[stage] += b - a
+
+    busy = {stage: 0.0 for stage in STAGES if stage != "extract"}
+    for name, stage in PRIORITY:
+      if name not in ("block", "wait"):
+        busy[stage] += sum(e - s for s, e in self.intervals.get(name, []))
+    return round_values(stages), round_values(busy)
+
+
+def merge(spans, start, end):
+  """Sorted, non-overlapping spans clipped to [start, end]."""
+  out = []
+  for s, e in sorted((max(s, start), min(e, end)) for s, e in spans):
+    if e <= s:
+      continue
+    if out and s <= out[-1][1]:
+      out[-1] = (out[-1][0], max(out[-1][1], e))
+    else:
+      out.append((s, e))
+  return out
+
+
+def active(spans, t):
+  i = bisect_right(spans, (t, float("inf"))) - 1
+  return i >= 0 and spans[i][0] <= t < spans[i][1]
+
+
+def round_values(values):
+  return {key: round(value, 4) for key, value in values.items()}
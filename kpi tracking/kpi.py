@@ -4,6 +4,7 @@ Sheets: SG, HK, NY, TH, VN-HCMC, VN-Hanoi, KH-PNH, KH-OTHERS
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import sys
 
@@ -11,12 +12,13 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 
 import pandas as pd
 from dotenv import load_dotenv
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
 
 from utils.constants import IDS, TIMEZONES
-from utils.helpers import Query, Redash
+from utils.frames import IndexedResult
+from utils.helpers import AsyncRedash, Query, once
 from utils.slack import SlackBot
+from utils.tracing import traced
+from utils.workbook import WorkbookWriter
 
 
 # ---------------------------------------------------------------------------
@@ -82,6 +84,8 @@ def safe_val(df, col, default=None):
 
 def filter_rows(df, **kwargs):
     """Filter df by col==val (case-insensitive). Returns first matching row."""
+    if isinstance(df, IndexedResult):
+        return df.first(**kwargs)
     if df is None or not hasattr(df, "empty") or df.empty:
         return pd.DataFrame()
     mask = pd.Series([True] * len(df), index=df.index)
@@ -153,6 +157,8 @@ def filter_city_if_possible(df, city):
     return df
 
 def filter_all(df, **kwargs):
+    if isinstance(df, IndexedResult):
+        return df.rows(**kwargs)
     if df is None or not hasattr(df, "empty") or df.empty:
         return pd.DataFrame()
     mask = pd.Series(True, index=df.index)
@@ -165,45 +171,33 @@ def filter_all(df, **kwargs):
 # Excel output
 # ---------------------------------------------------------------------------
 
-HEADER_FILL  = PatternFill("solid", fgColor="1F3864")
-SECTION_FILL = PatternFill("solid", fgColor="D9E1F2")
-HEADER_FONT  = Font(name="Calibri", bold=True, color="FFFFFF", size=10)
-SECTION_FONT = Font(name="Calibri", bold=True, size=10)
-KPI_FONT     = Font(name="Calibri", size=10)
-VAL_FONT     = Font(name="Calibri", size=10)
+HEADER_STYLE  = {"bold": True, "bg": "#1F3864", "color": "#FFFFFF"}
+SECTION_STYLE = {"bold": True, "bg": "#D9E1F2"}
 
 
-def write_sheet(ws, month_label, sections):
-    ws.column_dimensions["A"].width = 10
-    ws.column_dimensions["B"].width = 18
-    ws.column_dimensions["C"].width = 45
-    ws.column_dimensions["D"].width = 22
+@traced(args=("name",))
+def write_sheet(book, name, month_label, sections):
+    ws = book.add_sheet(name, widths=[10, 18, 45, 22], freeze=(1, 3))
+    header = book.format(align="center", **HEADER_STYLE)
+    section = book.format(**SECTION_STYLE)
+    kpi = book.format()
 
-    for c, txt in enumerate(["Type", "Section", "KPI", month_label], 1):
-        cell = ws.cell(row=1, column=c, value=txt)
-        cell.font = HEADER_FONT
-        cell.fill = HEADER_FILL
-        cell.alignment = Alignment(horizontal="center")
+    for c, txt in enumerate(["Type", "Section", "KPI", month_label]):
+        ws.write(0, c, txt, header)
 
-    row = 2
+    row = 1
     for vehicle_type, section_name, kpi_label, value in sections:
-        if section_name is not None and row > 2:
+        if section_name is not None and row > 1:
             row += 1
-        c_vehicle = ws.cell(row=row, column=1, value=vehicle_type or "")
-        c_section = ws.cell(row=row, column=2, value=section_name or "")
-        c_kpi     = ws.cell(row=row, column=3, value=kpi_label)
-        c_val     = ws.cell(row=row, column=4, value=value)
         if section_name:
-            for c in (c_vehicle, c_section, c_kpi, c_val):
-                c.fill = SECTION_FILL
-                c.font = SECTION_FONT
+            for c, v in enumerate((vehicle_type or "", section_name, kpi_label, value)):
+                ws.write(row, c, v, section)
         else:
-            c_kpi.font = KPI_FONT
-            c_val.font = VAL_FONT
+            ws.write(row, 0, vehicle_type or "")
+            ws.write(row, 2, kpi_label, kpi)
+            ws.write(row, 3, value, kpi)
         row += 1
 
-    ws.freeze_panes = "D2"
-
 
 # ---------------------------------------------------------------------------
 # Row templates
@@ -354,11 +348,11 @@ def rows_ny(d):
 # SG — confirmed working
 # ---------------------------------------------------------------------------
 
-def fetch_sg(redash, date, start_date, end_date, churn_start):
+def sg_queries(date, start_date, end_date):
     region    = "SG"
     region_id = IDS["SG"]
 
-    queries = [
+    return [
         Query(2183, params={"date": date}),
         Query(2189, params={"date": date}),   # rider activated
         Query(2194, params={"date": date}),
@@ -377,25 +371,30 @@ def fetch_sg(redash, date, start_date, end_date, churn_start):
         Query(6030, params={"Date Range": dr(start_date, end_date), "region": region}),
         Query(6189, params={"Date Range": dr(start_date, end_date), "region": region}),
     ]
-    redash.run_queries(queries)
-
-    df23  = redash.get_result(4819)
-    df1   = redash.get_result(2183)
-    df5   = redash.get_result(2189)
-    df6   = redash.get_result(2194)
-    bq4   = redash.get_result(2198)
-    df14  = redash.get_result(2204)
-    df15  = redash.get_result(2206)
-    bq5   = redash.get_result(2208)
-    df16  = redash.get_result(2209)
-    df8   = redash.get_result(2210)
-    df19  = redash.get_result(4691)
-    df22  = redash.get_result(4814)
-    df2   = redash.get_result(6139)
-    q6152 = redash.get_result(6152)
-    q6138 = redash.get_result(6138)
-    q6030 = redash.get_result(6030)
-    q6189 = redash.get_result(6189)
+
+
+@traced()
+def fetch_sg(redash, date, start_date, end_date, churn_start):
+    queries = {query.id: query for query in sg_queries(date, start_date, end_date)}
+    redash.run_queries(list(queries.values()))
+
+    df23  = redash.get_result(queries[4819])
+    df1   = redash.get_result(queries[2183])
+    df5   = redash.get_result(queries[2189])
+    df6   = redash.get_result(queries[2194])
+    bq4   = redash.get_result(queries[2198])
+    df14  = redash.get_result(queries[2204])
+    df15  = redash.get_result(queries[2206])
+    bq5   = redash.get_result(queries[2208])
+    df16  = redash.get_result(queries[2209])
+    df8   = redash.get_result(queries[2210])
+    df19  = redash.get_result(queries[4691])
+    df22  = redash.get_result(queries[4814])
+    df2   = redash.get_result(queries[6139])
+    q6152 = redash.get_result(queries[6152])
+    q6138 = redash.get_result(queries[6138])
+    q6030 = redash.get_result(queries[6030])
+    q6189 = redash.get_result(queries[6189])
 
     days = int(date.split("-")[2])
 
@@ -438,11 +437,11 @@ def fetch_sg(redash, date, start_date, end_date, churn_start):
 # HK — confirmed working
 # ---------------------------------------------------------------------------
 
-def fetch_hk(redash, date, start_date, end_date, churn_start):
+def hk_queries(start_date, end_date):
     region    = "HK"
     region_id = IDS["HK"]
 
-    queries = [
+    return [
         Query(3771, params={"date_range": dr(start_date, end_date)}),
         Query(3774, params={"date_range": dr(start_date, end_date)}),
         Query(3779, params={"date_range": dr(start_date, end_date)}),
@@ -460,24 +459,29 @@ def fetch_hk(redash, date, start_date, end_date, churn_start):
         Query(6030, params={"Date Range": dr(start_date, end_date), "region": region}),
         Query(6189, params={"Date Range": dr(start_date, end_date), "region": region}),
     ]
-    redash.run_queries(queries)
-
-    df1   = redash.get_result(3771)
-    df3   = redash.get_result(3774)
-    bq3   = redash.get_result(3779)
-    df5   = redash.get_result(3780)
-    df6   = redash.get_result(3781)
-    bq4   = redash.get_result(3782)
-    df7   = redash.get_result(3783)
-    df11  = redash.get_result(3787)
-    df14  = redash.get_result(4753)
-    df15  = redash.get_result(4814)
-    df16  = redash.get_result(4819)
-    df2   = redash.get_result(6139)
-    q6152 = redash.get_result(6152)
-    q6138 = redash.get_result(6138)
-    q6030 = redash.get_result(6030)
-    q6189 = redash.get_result(6189)
+
+
+@traced()
+def fetch_hk(redash, date, start_date, end_date, churn_start):
+    queries = {query.id: query for query in hk_queries(start_date, end_date)}
+    redash.run_queries(list(queries.values()))
+
+    df1   = redash.get_result(queries[3771])
+    df3   = redash.get_result(queries[3774])
+    bq3   = redash.get_result(queries[3779])
+    df5   = redash.get_result(queries[3780])
+    df6   = redash.get_result(queries[3781])
+    bq4   = redash.get_result(queries[3782])
+    df7   = redash.get_result(queries[3783])
+    df11  = redash.get_result(queries[3787])
+    df14  = redash.get_result(queries[4753])
+    df15  = redash.get_result(queries[4814])
+    df16  = redash.get_result(queries[4819])
+    df2   = redash.get_result(queries[6139])
+    q6152 = redash.get_result(queries[6152])
+    q6138 = redash.get_result(queries[6138])
+    q6030 = redash.get_result(queries[6030])
+    q6189 = redash.get_result(queries[6189])
 
     days = int(date.split("-")[2])
 
@@ -520,22 +524,9 @@ def fetch_hk(redash, date, start_date, end_date, churn_start):
 # NY — single car type (one vehicle class only, no 2W/3W/4W split)
 # ---------------------------------------------------------------------------
 
-def fetch_ny(redash, date, start_date, end_date, churn_start):
-    """
-    New York KPI fetch.
-
-    NY operates a SINGLE car type, so — unlike TH/VN/KH — there is no vehicle
-    split here: every metric maps straight into one flat dict (same shape as
-    fetch_sg / fetch_hk). The result is rendered with rows_ny().
-
-    Timezone: the NY Redash queries (7578-7637) are NY-dedicated and already
-    aggregate on New York local time (America/New_York) internally, exactly as
-    the SG/HK dedicated queries bake in their own locale. We therefore pass only
-    {"date": date} (the report month's last day) — the same parameter convention
-    used by the SG dedicated queries — and do not forward a timezone param.
-    """
+def ny_queries(date, start_date, end_date):
     # All NY queries are dedicated monthly queries -> {"date": date}, mirroring SG.
-    queries = [
+    return [
         Query(7578, params={"date": date}),   # Trips numbers (demand/matched/completed/drivers)
         Query(7579, params={"date": date}),   # Monthly rides (incl. unique rider metrics)
         Query(7590, params={"date": date}),   # Rider sign up
@@ -567,31 +558,49 @@ def fetch_ny(redash, date, start_date, end_date, churn_start):
         Query(7654, params={"Date Range": dr(start_date, end_date)}),  # Rider promo
         Query(7655, params={"Date Range": dr(start_date, end_date)}),  # System fee (UNCONFIRMED)
     ]
-    redash.run_queries(queries)
-
-    df_trips         = redash.get_result(7578)
-    df_rides         = redash.get_result(7579)
-    df_rider_signup  = redash.get_result(7590)
-    df_rider_atsm    = redash.get_result(7591)
-    df_search        = redash.get_result(7622)
-    df_book          = redash.get_result(7592)
-    df_wait          = redash.get_result(7624)
-    df_online        = redash.get_result(7586)
-    df_drivers_daily = redash.get_result(7585)
-    df_driver_signup = redash.get_result(7584)
-    df_driver_atsm   = redash.get_result(7625)
-    df_eta           = redash.get_result(7583)
-    df_res_rider     = redash.get_result(7632)
-    df_res_driver    = redash.get_result(7634)
-    df_pinged        = redash.get_result(7636)
-    df_fac           = redash.get_result(7594)
-    df_rider_car     = redash.get_result(7593)
-    df_driver_car    = redash.get_result(7588)
-    df_match_expire  = redash.get_result(7595)
-    df_bsr           = redash.get_result(7637)
-    df_fares         = redash.get_result(7646)   # UNCONFIRMED (NY fare calc complex)
-    df_promo         = redash.get_result(7654)
-    df_fee           = redash.get_result(7655)   # UNCONFIRMED (driver software fee in separate table)
+
+
+@traced()
+def fetch_ny(redash, date, start_date, end_date, churn_start):
+    """
+    New York KPI fetch.
+
+    NY operates a SINGLE car type, so — unlike TH/VN/KH — there is no vehicle
+    split here: every metric maps straight into one flat dict (same shape as
+    fetch_sg / fetch_hk). The result is rendered with rows_ny().
+
+    Timezone: the NY Redash queries (7578-7637) are NY-dedicated and already
+    aggregate on New York local time (America/New_York) internally, exactly as
+    the SG/HK dedicated queries bake in their own locale. We therefore pass only
+    {"date": date} (the report month's last day) — the same parameter convention
+    used by the SG dedicated queries — and do not forward a timezone param.
+    """
+    queries = {query.id: query for query in ny_queries(date, start_date, end_date)}
+    redash.run_queries(list(queries.values()))
+
+    df_trips         = redash.get_result(queries[7578])
+    df_rides         = redash.get_result(queries[7579])
+    df_rider_signup  = redash.get_result(queries[7590])
+    df_rider_atsm    = redash.get_result(queries[7591])
+    df_search        = redash.get_result(queries[7622])
+    df_book          = redash.get_result(queries[7592])
+    df_wait          = redash.get_result(queries[7624])
+    df_online        = redash.get_result(queries[7586])
+    df_drivers_daily = redash.get_result(queries[7585])
+    df_driver_signup = redash.get_result(queries[7584])
+    df_driver_atsm   = redash.get_result(queries[7625])
+    df_eta           = redash.get_result(queries[7583])
+    df_res_rider     = redash.get_result(queries[7632])
+    df_res_driver    = redash.get_result(queries[7634])
+    df_pinged        = redash.get_result(queries[7636])
+    df_fac           = redash.get_result(queries[7594])
+    df_rider_car     = redash.get_result(queries[7593])
+    df_driver_car    = redash.get_result(queries[7588])
+    df_match_expire  = redash.get_result(queries[7595])
+    df_bsr           = redash.get_result(queries[7637])
+    df_fares         = redash.get_result(queries[7646])   # UNCONFIRMED (NY fare calc complex)
+    df_promo         = redash.get_result(queries[7654])
+    df_fee           = redash.get_result(queries[7655])   # UNCONFIRMED (driver software fee in separate table)
 
     days = int(date.split("-")[2])
 
@@ -653,12 +662,17 @@ def fetch_ny(redash, date, start_date, end_date, churn_start):
 # TH
 # ---------------------------------------------------------------------------
 
-def fetch_th(redash, date, start_date, end_date, churn_start):
+# 6143 (churn) spans the whole churn range for every city and vehicle type;
+# read the repeated labels as categoricals.
+CHURN_DTYPES = {"city": "category", "vehicle_type": "category", "w_type": "category"}
+
+
+def th_queries(date, start_date, end_date, churn_start):
     region    = "TH"
     region_id = IDS["TH"]
     timezone  = TIMEZONES["TH"]
 
-    queries = [
+    return [
         Query(3106, params={"date": date}),
         Query(3117, params={"region": region, "timezone": timezone, "date": date}),   # driver activated
         Query(3122, params={"region": region,    "timezone": timezone, "date": date}),
@@ -680,30 +694,35 @@ def fetch_th(redash, date, start_date, end_date, churn_start):
         Query(6030, params={"Date Range": dr(start_date, end_date), "region": region}),
         Query(6189, params={"Date Range": dr(start_date, end_date), "region": region}),
         Query(6366, params={"Date Range": dr(start_date, end_date), "region": region, "city": "BKK"}),  # median searched fare
-        Query(6143, params={"Date Range": dr(churn_start, end_date)}),                # churn
+        Query(6143, params={"Date Range": dr(churn_start, end_date)}, dtypes=CHURN_DTYPES),  # churn
     ]
-    redash.run_queries(queries)
-
-    df1    = redash.get_result(3106)
-    df_act = redash.get_result(3117)
-    df17   = redash.get_result(3122)
-    df18   = redash.get_result(3123)
-    bq7    = redash.get_result(3125)
-    bq8    = redash.get_result(3126)
-    df19   = redash.get_result(3127)
-    df20   = redash.get_result(3128)
-    bq10   = redash.get_result(3130)
-    bq11   = redash.get_result(3131)
-    q6145  = redash.get_result(6145)
-    q6152  = redash.get_result(6152)
-    q6144  = redash.get_result(6144)
-    q4509  = redash.get_result(4509)
-    q6148  = redash.get_result(6148)
-    q6138  = redash.get_result(6138)
-    q6030  = redash.get_result(6030)
-    q6189  = redash.get_result(6189)
-    q6366  = redash.get_result(6366)
-    q6143  = redash.get_result(6143)
+
+
+@traced()
+def fetch_th(redash, date, start_date, end_date, churn_start):
+    queries = {query.id: query for query in th_queries(date, start_date, end_date, churn_start)}
+    redash.run_queries(list(queries.values()))
+
+    df1    = redash.get_result(queries[3106])
+    df_act = redash.get_result(queries[3117])
+    df17   = redash.get_result(queries[3122])
+    df18   = redash.get_result(queries[3123])
+    bq7    = redash.get_result(queries[3125])
+    bq8    = redash.get_result(queries[3126])
+    df19   = redash.get_result(queries[3127])
+    df20   = redash.get_result(queries[3128])
+    bq10   = redash.get_result(queries[3130])
+    bq11   = redash.get_result(queries[3131])
+    q6145  = redash.get_result(queries[6145])
+    q6152  = IndexedResult(redash.get_result(queries[6152]))
+    q6144  = IndexedResult(redash.get_result(queries[6144]))
+    q4509  = IndexedResult(redash.get_result(queries[4509]))
+    q6148  = IndexedResult(redash.get_result(queries[6148]))
+    q6138  = IndexedResult(redash.get_result(queries[6138]))
+    q6030  = IndexedResult(redash.get_result(queries[6030]))
+    q6189  = IndexedResult(redash.get_result(queries[6189]))
+    q6366  = redash.get_result(queries[6366])
+    q6143  = IndexedResult(redash.get_result(queries[6143]))
 
     # split by vehicle_type
     q6152_2w = vt(q6152, "2W");  q6152_4w = vt(q6152, "4W")
@@ -790,10 +809,31 @@ def fetch_th(redash, date, start_date, end_date, churn_start):
 # VN (HCM / HAN)
 # ---------------------------------------------------------------------------
 
-def fetch_vn(redash, start_date, end_date, churn_start, city_code):
+# Region-wide VN queries (filtered by city afterwards) run once for both cities;
+# only the city-parameterised ones run per city.
+VN_CITIES = ["HCM", "HAN"]
+
+
+def vn_region_queries(start_date, end_date, churn_start):
     region = "VN"
 
-    queries = [
+    return [
+        Query(6152, params={"Date Range": dr(start_date, end_date), "region": region}),                     # region-only -> filter by city+vtype
+        Query(6144, params={"Date Range": dr(start_date, end_date), "region": region}),                     # region-only -> filter by city+vtype
+        Query(4509, params={"Date Range": dr(start_date, end_date), "region": region}),                     # region-only -> filter by city+vtype
+        Query(6148, params={"Date Range": dr(start_date, end_date), "region": region}),                     # region-only -> filter by city+vtype
+        Query(6030, params={"Date Range": dr(start_date, end_date), "region": region}),                     # promo region-only -> filter by city(+vtype)
+        Query(6189, params={"Date Range": dr(start_date, end_date), "region": region}),                     # fee region-only -> filter by city(+vtype)
+
+        # churn (same logic as TH)
+        Query(6143, params={"Date Range": dr(churn_start, end_date)}, dtypes=CHURN_DTYPES),                 # churn table
+    ]
+
+
+def vn_city_queries(start_date, end_date, city_code):
+    region = "VN"
+
+    return [
         # old-style (city scoped)
         Query(4562, params={"date_range": dr(start_date, end_date), "city": city_code}),  # rides
         Query(4566, params={"date_range": dr(start_date, end_date), "city": city_code}),  # ETA (kept, but not used for median_eta)
@@ -805,43 +845,43 @@ def fetch_vn(redash, start_date, end_date, churn_start, city_code):
         Query(4580, params={"date_range": dr(start_date, end_date), "city": city_code}),  # rider FT
         Query(4581, params={"date_range": dr(start_date, end_date), "city": city_code}),  # rider daily
 
-        # new-style
-        Query(6145, params={"Date Range": dr(start_date, end_date), "region": region, "city": city_code}),  # searches + BSR (city param)
-        Query(6152, params={"Date Range": dr(start_date, end_date), "region": region}),                     # region-only -> filter by city+vtype
-        Query(6144, params={"Date Range": dr(start_date, end_date), "region": region}),                     # region-only -> filter by city+vtype
-        Query(4509, params={"Date Range": dr(start_date, end_date), "region": region}),                     # region-only -> filter by city+vtype
-        Query(6148, params={"Date Range": dr(start_date, end_date), "region": region}),                     # region-only -> filter by city+vtype
-        Query(6138, params={"Date Range": dr(start_date, end_date), "region": region, "city": city_code}),  # fares (city param)
-        Query(6030, params={"Date Range": dr(start_date, end_date), "region": region}),                     # promo region-only -> filter by city(+vtype)
-        Query(6189, params={"Date Range": dr(start_date, end_date), "region": region}),                     # fee region-only -> filter by city(+vtype)
-        Query(6366, params={"Date Range": dr(start_date, end_date), "region": region, "city": city_code}),  # searched fare (city param)
-
-        # churn (same logic as TH)
-        Query(6143, params={"Date Range": dr(churn_start, end_date)}),                                      # churn table
+        # new-style, city param
+        Query(6145, params={"Date Range": dr(start_date, end_date), "region": region, "city": city_code}),  # searches + BSR
+        Query(6138, params={"Date Range": dr(start_date, end_date), "region": region, "city": city_code}),  # fares
+        Query(6366, params={"Date Range": dr(start_date, end_date), "region": region, "city": city_code}),  # searched fare
     ]
-    redash.run_queries(queries)
 
+
+@traced()
+def fetch_vn(redash, start_date, end_date, churn_start):
+    """{city: (general, d2w, d4w)} for every VN city, from one batch."""
+    region = {query.id: query for query in vn_region_queries(start_date, end_date, churn_start)}
+    cities = {city: {query.id: query for query in vn_city_queries(start_date, end_date, city)} for city in VN_CITIES}
+    redash.run_queries(list(region.values()) + [query for queries in cities.values() for query in queries.values()])
+
+    # region-wide results: downloaded and indexed once, shared by every city
+    shared = {qid: IndexedResult(redash.get_result(query)) for qid, query in region.items()}
+    return {city: vn_city(redash, queries, shared, start_date, city) for city, queries in cities.items()}
+
+
+@traced(args=("city_code",))
+def vn_city(redash, queries, shared, start_date, city_code):
     # old results
-    df1    = redash.get_result(4562)
-    bq3    = redash.get_result(4570)
-    df5    = redash.get_result(4571)
-    df6    = redash.get_result(4572)
-    bq4    = redash.get_result(4574)
-    df7    = redash.get_result(4576)
-    df11   = redash.get_result(4580)
-    df12   = redash.get_result(4581)
+    df1    = redash.get_result(queries[4562])
+    bq3    = redash.get_result(queries[4570])
+    df5    = redash.get_result(queries[4571])
+    df6    = redash.get_result(queries[4572])
+    bq4    = redash.get_result(queries[4574])
+    df7    = redash.get_result(queries[4576])
+    df11   = redash.get_result(queries[4580])
+    df12   = redash.get_result(queries[4581])
 
     # new results
-    q6145  = redash.get_result(6145)
-    q6152  = redash.get_result(6152)
-    q6144  = redash.get_result(6144)
-    q4509  = redash.get_result(4509)
-    q6148  = redash.get_result(6148)
-    q6138  = redash.get_result(6138)
-    q6030  = redash.get_result(6030)
-    q6189  = redash.get_result(6189)
-    q6366  = redash.get_result(6366)
-    q6143  = redash.get_result(6143)
+    q6145  = redash.get_result(queries[6145])
+    q6138  = IndexedResult(redash.get_result(queries[6138]))
+    q6366  = redash.get_result(queries[6366])
+    q6152, q6144, q4509, q6148 = shared[6152], shared[6144], shared[4509], shared[6148]
+    q6030, q6189, q6143 = shared[6030], shared[6189], shared[6143]
 
     # IMPORTANT: region-only tables -> filter by city + vehicle_type
     q6152_2w = vt(q6152, "2W", city=city_code)
@@ -962,10 +1002,10 @@ def fetch_vn(redash, start_date, end_date, churn_start, city_code):
 # KH (PNH and KH-OTHERS)
 # ---------------------------------------------------------------------------
 
-def fetch_kh_city(redash, start_date, end_date, churn_start, city):
+def kh_queries(start_date, end_date, churn_start, city):
     region = "KH"
 
-    queries = [
+    return [
         Query(6145, params={"Date Range": dr(start_date, end_date), "region": region, "city": city}),
         Query(6366, params={"Date Range": dr(start_date, end_date), "region": region, "city": city}),
 
@@ -988,24 +1028,29 @@ def fetch_kh_city(redash, start_date, end_date, churn_start, city):
         Query(4659, params={"Date Range": dr(churn_start, end_date)}),
         Query(6150, params={"Date Range": dr(churn_start, end_date)}),
     ]
-    redash.run_queries(queries)
-
-    q6145 = redash.get_result(6145)
-    q6366 = redash.get_result(6366)
-    q6152 = redash.get_result(6152)
-    q6151 = redash.get_result(6151)
-    q6157 = redash.get_result(6157)
-    q6149 = redash.get_result(6149)
-    q6161 = redash.get_result(6161)
-    q6147 = redash.get_result(6147)
-    q6144 = redash.get_result(6144)
-    q4509 = redash.get_result(4509)
-    q6148 = redash.get_result(6148)
-    q6138 = redash.get_result(6138)
-    q6030 = redash.get_result(6030)
-    q6189 = redash.get_result(6189)
-    q4659 = redash.get_result(4659)
-    q6150 = redash.get_result(6150)
+
+
+@traced(args=("city",))
+def fetch_kh_city(redash, start_date, end_date, churn_start, city):
+    queries = {query.id: query for query in kh_queries(start_date, end_date, churn_start, city)}
+    redash.run_queries(list(queries.values()))
+
+    q6145 = redash.get_result(queries[6145])
+    q6366 = redash.get_result(queries[6366])
+    q6152 = IndexedResult(redash.get_result(queries[6152]))
+    q6151 = IndexedResult(redash.get_result(queries[6151]))
+    q6157 = IndexedResult(redash.get_result(queries[6157]))
+    q6149 = IndexedResult(redash.get_result(queries[6149]))
+    q6161 = IndexedResult(redash.get_result(queries[6161]))
+    q6147 = IndexedResult(redash.get_result(queries[6147]))
+    q6144 = IndexedResult(redash.get_result(queries[6144]))
+    q4509 = IndexedResult(redash.get_result(queries[4509]))
+    q6148 = IndexedResult(redash.get_result(queries[6148]))
+    q6138 = IndexedResult(redash.get_result(queries[6138]))
+    q6030 = IndexedResult(redash.get_result(queries[6030]))
+    q6189 = IndexedResult(redash.get_result(queries[6189]))
+    q4659 = IndexedResult(redash.get_result(queries[4659]))
+    q6150 = IndexedResult(redash.get_result(queries[6150]))
 
     # ----- has_2w MUST be city-scoped -----
     # q6152_city = filter_city_if_possible(q6152, city)
@@ -1014,7 +1059,7 @@ def fetch_kh_city(redash, start_date, end_date, churn_start, city):
     #     avail = set(q6152_city["vehicle_type"].astype(str).str.upper().unique())
     # has_2w = "2W" in avail 
 
-    q6152_city = filter_rows(q6152, city=city) if has_col(q6152, "city") else q6152
+    q6152_city = filter_rows(q6152, city=city) if has_col(q6152, "city") else q6152.df
     avail = set(q6152_city["vehicle_type"].astype(str).str.upper().unique()) if has_col(q6152_city, "vehicle_type") else set()
     has_2w = "2W" in avail
 
@@ -1039,8 +1084,7 @@ def fetch_kh_city(redash, start_date, end_date, churn_start, city):
 
         # DEMAND: region-only -> MUST filter by city + vtype if city column exists
         # 6152 output has: month, city, vehicle_type
-        dem = filter_all(q6152, city=city)          # keep only the city
-        dem = vt(dem, v)                           # then pick vehicle_type
+        dem = vt(q6152, v, city=city)              # city + vehicle_type, one lookup
         dem = pick_month_row(dem, start_date)      # then pick report month (YYYY-MM-01)
 
         # SUPPLY/EFFICIENCY: filter city when possible
@@ -1112,12 +1156,35 @@ def fetch_kh_city(redash, start_date, end_date, churn_start, city):
 # Main
 # ---------------------------------------------------------------------------
 
-def main():
+# Regions fetched at once. Each runs its own batch of up to 8 jobs, so Redash
+# sees at most REGION_WORKERS * 8 in flight.
+REGION_WORKERS = 4
+
+
+def queries():
+    """Every query the tracker runs for the previous month, in run order."""
+    date, start_date, end_date, churn_start, _ = prev_month_info()
+    return (
+        sg_queries(date, start_date, end_date)
+        + hk_queries(start_date, end_date)
+        + ny_queries(date, start_date, end_date)
+        + th_queries(date, start_date, end_date, churn_start)
+        + vn_region_queries(start_date, end_date, churn_start)
+        + vn_city_queries(start_date, end_date, "HCM")
+        + vn_city_queries(start_date, end_date, "HAN")
+        + kh_queries(start_date, end_date, churn_start, "PNH")
+        + kh_queries(start_date, end_date, churn_start, "KH-OTHERS")
+    )
+
+
+def main(redash=None):
+    """`redash` lets a caller that already ran queries() share its client."""
     load_dotenv()
 
-    redash = Redash(
+    redash = redash or AsyncRedash(
         key=os.getenv("REDASH_API_KEY"),
-        base_url=os.getenv("REDASH_BASE_URL")
+        base_url=os.getenv("REDASH_BASE_URL"),
+        pool_size=REGION_WORKERS * 8,
     )
 
     date, start_date, end_date, churn_start, label = prev_month_info()
@@ -1126,41 +1193,44 @@ def main():
     print(f"  Period      : {start_date} -> {end_date}")
     print(f"  Churn range : {churn_start} -> {end_date}\n")
 
-    wb = Workbook()
-    temp_ws = wb.active
-    temp_ws.title = "TEMP"
+    output_file = f"KPI_Data_{label}.xlsx"
+    book = WorkbookWriter(output_file, constant_memory=True)
 
+    vn = once(lambda: fetch_vn(redash, start_date, end_date, churn_start))
     tasks = [
         ("SG",        lambda: (fetch_sg(redash, date, start_date, end_date, churn_start),              "sg_hk")),
         ("HK",        lambda: (fetch_hk(redash, date, start_date, end_date, churn_start),              "sg_hk")),
         ("NY",        lambda: (fetch_ny(redash, date, start_date, end_date, churn_start),              "ny")),
         ("TH",        lambda: (fetch_th(redash, date, start_date, end_date, churn_start),              "th_vn")),
-        ("VN-HCMC",   lambda: (fetch_vn(redash, start_date, end_date, churn_start, "HCM"),             "th_vn")),
-        ("VN-Hanoi",  lambda: (fetch_vn(redash, start_date, end_date, churn_start, "HAN"),             "th_vn")),
+        ("VN-HCMC",   lambda: (vn()["HCM"],                                                            "th_vn")),
+        ("VN-Hanoi",  lambda: (vn()["HAN"],                                                            "th_vn")),
         ("KH-PNH",    lambda: (fetch_kh_city(redash, start_date, end_date, churn_start, "PNH"),        "kh")),
         ("KH-OTHERS", lambda: (fetch_kh_city(redash, start_date, end_date, churn_start, "KH-OTHERS"),  "kh")),
     ]
 
+    # Fetch concurrently, then write sheets in task order as results arrive.
+    pool = ThreadPoolExecutor(max_workers=REGION_WORKERS)
+    futures = [(name, pool.submit(fn)) for name, fn in tasks]
+
     created = []
-    for name, fn in tasks:
+    for name, future in futures:
         print(f"-> {name}")
         try:
-            result, layout = fn()
-            ws = wb.create_sheet(name)
+            result, layout = future.result()
 
             if layout == "sg_hk":
-                write_sheet(ws, label, rows_sg_hk(result))
+                write_sheet(book, name, label, rows_sg_hk(result))
 
             elif layout == "ny":
-                write_sheet(ws, label, rows_ny(result))
+                write_sheet(book, name, label, rows_ny(result))
 
             elif layout == "th_vn":
                 gen, d2w, d4w = result
-                write_sheet(ws, label, rows_th_vn(gen, d2w, d4w))
+                write_sheet(book, name, label, rows_th_vn(gen, d2w, d4w))
 
             else:
                 gen, d2w, d3w, d4w, has_2w = result
-                write_sheet(ws, label, rows_kh(gen, d2w, d3w, d4w, has_2w=has_2w))
+                write_sheet(book, name, label, rows_kh(gen, d2w, d3w, d4w, has_2w=has_2w))
 
             created.append(name)
             print("   done")
@@ -1169,15 +1239,12 @@ def main():
             import traceback
             print(f"   FAILED: {e}")
             traceback.print_exc()
+    pool.shutdown()
 
-    if created:
-        wb.remove(temp_ws)
-    else:
-        temp_ws.title = "ERROR"
-        temp_ws["A1"] = "All regions failed - check logs above."
+    if not created:
+        book.add_sheet("ERROR").write(0, 0, "All regions failed - check logs above.")
 
-    output_file = f"KPI_Data_{label}.xlsx"
-    wb.save(output_file)
+    book.close()
     print(f"\nSaved: {output_file}")
 
     slack = SlackBot()
@@ -13,21 +13,26 @@ compared to "Regional Operational Data.xlsx" (May-2026 matched ~exactly).
 Run:
     python regional_operational_data.py            # previous month
     python regional_operational_data.py 2026-05    # a specific month (YYYY-MM)
+    python regional_operational_data.py 2026-01 2026-03   # every month in a range,
+                                                           # one column per month
 """
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 import pandas as pd
 from dotenv import load_dotenv
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
 
-from utils.helpers import Query, Redash
+from utils.dates import month_starts
+from utils.frames import IndexedResult
+from utils.helpers import AsyncRedash, Query, once
 from utils.slack import SlackBot
+from utils.tracing import traced
+from utils.workbook import WorkbookWriter
 
 
 # ---------------------------------------------------------------------------
@@ -67,6 +72,8 @@ def dr(start, end):
 def pull(df, column=None, num=None, den=None, filters=None,
          agg="first", scale=None, month=None):
     """
+    df:      a result DataFrame, or an IndexedResult (see result()) so repeated
+             pulls from one result reuse its normalised key columns.
     filters: {col: value}  -- keep rows where col == value (case-insensitive).
              value "__MONTH__" matches rows whose date column == `month` (YYYY-MM).
     num/den: return num/den ratio (first row after filtering).
@@ -75,18 +82,16 @@ def pull(df, column=None, num=None, den=None, filters=None,
     """
     if df is None or not hasattr(df, "empty") or df.empty:
         return None
+    if not isinstance(df, IndexedResult):
+        df = IndexedResult(df)
 
-    d = df
-    for col, val in (filters or {}).items():
-        if col not in d.columns:
-            return None
-        if val == "__MONTH__":
-            s = pd.to_datetime(d[col], errors="coerce").dt.strftime("%Y-%m")
-            d = d[s == month]
-        else:
-            d = d[d[col].astype(str).str.upper() == str(val).upper()]
-        if d.empty:
-            return None
+    filters = filters or {}
+    if any(col not in df.columns for col in filters):
+        return None
+    months = {col: month for col, val in filters.items() if val == "__MONTH__"}
+    d = df.rows(months=months, **{col: val for col, val in filters.items() if val != "__MONTH__"})
+    if d.empty:
+        return None
 
     try:
         if num and den:
@@ -108,6 +113,11 @@ def pull(df, column=None, num=None, den=None, filters=None,
         return None
 
 
+def result(redash, query):
+    """A downloaded result, indexed once for every pull() made from it."""
+    return IndexedResult(redash.get_result(query))
+
+
 def block(completed, promo, match, gmv, fee, avg_fare):
     """Ordered (metric_label, value) rows for one vehicle / region."""
     non_promo = (1 - promo) if promo is not None else None
@@ -126,58 +136,65 @@ def block(completed, promo, match, gmv, fee, avg_fare):
 # Excel output
 # ---------------------------------------------------------------------------
 
-HEADER_FILL  = PatternFill("solid", fgColor="1F3864")
-VEHICLE_FILL = PatternFill("solid", fgColor="D9E1F2")
-HEADER_FONT  = Font(name="Calibri", bold=True, color="FFFFFF", size=10)
-VEHICLE_FONT = Font(name="Calibri", bold=True, size=10)
-KPI_FONT     = Font(name="Calibri", size=10)
+HEADER_STYLE  = {"bold": True, "bg": "#1F3864", "color": "#FFFFFF"}
+VEHICLE_STYLE = {"bold": True, "bg": "#D9E1F2"}
 
 
-def write_sheet(ws, label, blocks):
+@traced(args=("name",))
+def write_sheet(book, name, labels, periods):
     """
-    blocks: list of (vehicle_label_or_None, [(metric_label, value), ...]).
+    labels:  one column header per period (e.g. Jun_2026).
+    periods: per label, a list of (vehicle_label_or_None, [(metric_label, value), ...]),
+             or None for a period that failed (its column is left empty).
     Single-vehicle regions pass vehicle_label = None.
     """
-    ws.column_dimensions["A"].width = 26
-    ws.column_dimensions["B"].width = 22
-
-    for c, txt in enumerate(["Metric", label], 1):
-        cell = ws.cell(row=1, column=c, value=txt)
-        cell.font = HEADER_FONT
-        cell.fill = HEADER_FILL
-        cell.alignment = Alignment(horizontal="center" if c == 2 else "left")
-
-    row = 2
-    for vehicle, metrics in blocks:
-        if vehicle:
-            hc = ws.cell(row=row, column=1, value=vehicle)
-            hc.font = VEHICLE_FONT
-            hc.fill = VEHICLE_FILL
-            ws.cell(row=row, column=2).fill = VEHICLE_FILL
+    ws = book.add_sheet(name, widths=[26] + [22] * len(labels), freeze=(1, 1))
+    vehicle = book.format(**VEHICLE_STYLE)
+    vehicle_fill = book.format(bg=VEHICLE_STYLE["bg"])
+    kpi = book.format()
+
+    ws.write(0, 0, "Metric", book.format(align="left", **HEADER_STYLE))
+    for c, txt in enumerate(labels, 1):
+        ws.write(0, c, txt, book.format(align="center", **HEADER_STYLE))
+
+    # Every period has the same vehicles and metrics; lay rows out from the first that ran.
+    layout = next(blocks for blocks in periods if blocks is not None)
+    row = 1
+    for b, (vehicle_label, metrics) in enumerate(layout):
+        if vehicle_label:
+            ws.write(row, 0, vehicle_label, vehicle)
+            for c in range(1, len(labels) + 1):
+                ws.write_blank(row, c, None, vehicle_fill)
             row += 1
-        for label_, value in metrics:
-            ws.cell(row=row, column=1, value=label_).font = KPI_FONT
-            ws.cell(row=row, column=2, value=value).font = KPI_FONT
+        for m, (label_, _) in enumerate(metrics):
+            ws.write(row, 0, label_, kpi)
+            for c, blocks in enumerate(periods, 1):
+                value = blocks[b][1][m][1] if blocks is not None else None
+                ws.write(row, c, value, kpi)
             row += 1
         row += 1   # blank line between vehicle blocks
 
-    ws.freeze_panes = "B2"
-
 
 # ---------------------------------------------------------------------------
 # Region fetchers  (return list of (vehicle_or_None, block))
 # ---------------------------------------------------------------------------
 
-def fetch_sg(redash, date, s, e):
-    redash.run_queries([
+def sg_queries(date, s, e):
+    return [
         Query(2183, params={"date": date}),
         Query(5382, params={"Date Range": dr(s, e)}),
         Query(6561, params={"date_range": dr(s, e), "region": "SG"}),
         Query(6189, params={"Date Range": dr(s, e), "region": "SG"}),
         Query(6708, params={"Date Range": dr(s, e), "region": "SG"}),
-    ])
-    q2183, q5382 = redash.get_result(2183), redash.get_result(5382)
-    q6561, q6189, q6708 = redash.get_result(6561), redash.get_result(6189), redash.get_result(6708)
+    ]
+
+
+@traced(args=("date",))
+def fetch_sg(redash, date, s, e):
+    queries = {query.id: query for query in sg_queries(date, s, e)}
+    redash.run_queries(list(queries.values()))
+    q2183, q5382 = result(redash, queries[2183]), result(redash, queries[5382])
+    q6561, q6189, q6708 = result(redash, queries[6561]), result(redash, queries[6189]), result(redash, queries[6708])
     return [(None, block(
         pull(q2183, column="completed"),
         pull(q5382, column="pct_of_promo_trips", filters={"region": "SG"}, scale=0.01),
@@ -188,16 +205,22 @@ def fetch_sg(redash, date, s, e):
     ))]
 
 
-def fetch_hk(redash, date, s, e):
-    redash.run_queries([
+def hk_queries(date, s, e):
+    return [
         Query(3771, params={"date_range": dr(s, e)}),
         Query(5382, params={"Date Range": dr(s, e)}),
         Query(6561, params={"date_range": dr(s, e), "region": "HK"}),
         Query(6189, params={"Date Range": dr(s, e), "region": "HK"}),
         Query(6708, params={"Date Range": dr(s, e), "region": "HK"}),
-    ])
-    q3771, q5382 = redash.get_result(3771), redash.get_result(5382)
-    q6561, q6189, q6708 = redash.get_result(6561), redash.get_result(6189), redash.get_result(6708)
+    ]
+
+
+@traced(args=("date",))
+def fetch_hk(redash, date, s, e):
+    queries = {query.id: query for query in hk_queries(date, s, e)}
+    redash.run_queries(list(queries.values()))
+    q3771, q5382 = result(redash, queries[3771]), result(redash, queries[5382])
+    q6561, q6189, q6708 = result(redash, queries[6561]), result(redash, queries[6189]), result(redash, queries[6708])
     return [(None, block(
         pull(q3771, column="completed"),
         pull(q5382, column="pct_of_promo_trips", filters={"region": "HK"}, scale=0.01),
@@ -208,20 +231,26 @@ def fetch_hk(redash, date, s, e):
     ))]
 
 
-def fetch_ny(redash, date, s, e):
+def ny_queries(date, s, e):
     # NY data lags ~1 day; run on/after the 2nd of the month for a full month.
     # NOTE: 7644 (GMV) filters on the month-START date, so it takes `s`, not `date`.
-    redash.run_queries([
+    return [
         Query(7579, params={"date": date}),            # nyc_completed
         Query(7578, params={"date": date}),            # matched / demand
         Query(7670, params={"Date Range": dr(s, e)}),  # promo %
         Query(7655, params={"Date Range": dr(s, e)}),  # system fee
         Query(7665, params={"Date Range": dr(s, e)}),  # average fare
         Query(7644, params={"date": s}),               # GMV (month-start date)
-    ])
-    q7579, q7578 = redash.get_result(7579), redash.get_result(7578)
-    q7670, q7655, q7665 = redash.get_result(7670), redash.get_result(7655), redash.get_result(7665)
-    q7644 = redash.get_result(7644)
+    ]
+
+
+@traced(args=("date",))
+def fetch_ny(redash, date, s, e):
+    queries = {query.id: query for query in ny_queries(date, s, e)}
+    redash.run_queries(list(queries.values()))
+    q7579, q7578 = result(redash, queries[7579]), result(redash, queries[7578])
+    q7670, q7655, q7665 = result(redash, queries[7670]), result(redash, queries[7655]), result(redash, queries[7665])
+    q7644 = result(redash, queries[7644])
     return [(None, block(
         pull(q7579, column="nyc_completed"),
         pull(q7670, column="pct_of_promo_trips", filters={"region": "NY"}, scale=0.01),
@@ -232,18 +261,24 @@ def fetch_ny(redash, date, s, e):
     ))]
 
 
-def fetch_th(redash, date, s, e):
-    redash.run_queries([
+def th_queries(date, s, e):
+    return [
         Query(6577, params={"Date Range": dr(s, e), "region": "TH"}),
         Query(3106, params={"date": date}),
         Query(6565, params={"Date Range": dr(s, e), "Region": "TH"}),
         Query(6561, params={"date_range": dr(s, e), "region": "TH"}),
         Query(6189, params={"Date Range": dr(s, e), "region": "TH"}),
         Query(6564, params={"date": dr(s, e)}),
-    ])
-    q6577, q3106 = redash.get_result(6577), redash.get_result(3106)
-    q6565, q6561 = redash.get_result(6565), redash.get_result(6561)
-    q6189, q6564 = redash.get_result(6189), redash.get_result(6564)
+    ]
+
+
+@traced(args=("date",))
+def fetch_th(redash, date, s, e):
+    queries = {query.id: query for query in th_queries(date, s, e)}
+    redash.run_queries(list(queries.values()))
+    q6577, q3106 = result(redash, queries[6577]), result(redash, queries[3106])
+    q6565, q6561 = result(redash, queries[6565]), result(redash, queries[6561])
+    q6189, q6564 = result(redash, queries[6189]), result(redash, queries[6564])
 
     blocks = []
     for veh, wheel, grp, fare_col, num, den in [
@@ -261,18 +296,24 @@ def fetch_th(redash, date, s, e):
     return blocks
 
 
-def fetch_kh(redash, date, s, e):
-    redash.run_queries([
+def kh_queries(date, s, e):
+    return [
         Query(6577, params={"Date Range": dr(s, e), "region": "KH"}),
         Query(6640, params={"Date Range": dr(s, e), "region": "KH"}),
         Query(6565, params={"Date Range": dr(s, e), "Region": "KH"}),
         Query(6561, params={"date_range": dr(s, e), "region": "KH"}),
         Query(6189, params={"Date Range": dr(s, e), "region": "KH"}),
         Query(6708, params={"Date Range": dr(s, e), "region": "KH"}),
-    ])
-    q6577, q6640 = redash.get_result(6577), redash.get_result(6640)
-    q6565, q6561 = redash.get_result(6565), redash.get_result(6561)
-    q6189, q6708 = redash.get_result(6189), redash.get_result(6708)
+    ]
+
+
+@traced(args=("date",))
+def fetch_kh(redash, date, s, e):
+    queries = {query.id: query for query in kh_queries(date, s, e)}
+    redash.run_queries(list(queries.values()))
+    q6577, q6640 = result(redash, queries[6577]), result(redash, queries[6640])
+    q6565, q6561 = result(redash, queries[6565]), result(redash, queries[6561])
+    q6189, q6708 = result(redash, queries[6189]), result(redash, queries[6708])
 
     blocks = []
     for veh, wheel, grp in [
@@ -291,80 +332,148 @@ def fetch_kh(redash, date, s, e):
     return blocks
 
 
-def fetch_vn_city(redash, date, s, e, month, city):
-    """Vietnam city (HCM / HAN). region param = VN; rows filtered by city."""
-    redash.run_queries([
-        Query(7666, params={"date_range": dr(s, e)}),
+# 7666 is one row per month x city x car group; the labels repeat a lot.
+VN_GMV_DTYPES = {"city": "category", "car_group": "category",
+                 "completed_rides": "float64", "total_gmv": "float64"}
+
+
+# VN cities: every query is region-wide (no city param); rows are filtered by city.
+VN_CITIES = ["HCM", "HAN"]
+
+
+def vn_queries(date, s, e):
+    return [
+        Query(7666, params={"date_range": dr(s, e)}, dtypes=VN_GMV_DTYPES),
         Query(6562, params={"Date Range": dr(s, e)}),
         Query(6640, params={"Date Range": dr(s, e), "region": "VN"}),
         Query(6189, params={"Date Range": dr(s, e), "region": "VN"}),
         Query(6708, params={"Date Range": dr(s, e), "region": "VN"}),
-    ])
-    q7666, q6562 = redash.get_result(7666), redash.get_result(6562)
-    q6640, q6189, q6708 = redash.get_result(6640), redash.get_result(6189), redash.get_result(6708)
+    ]
 
-    blocks = []
-    for veh, wheel, grp in [("BIKE (2W)", "2W", "BIKE"), ("CAR (4W)", "4W", "CAR")]:
-        gmv_f = {"ride_month": "__MONTH__", "city": city, "car_group": grp}
-        blocks.append((veh, block(
-            pull(q7666, column="completed_rides", filters=gmv_f, month=month),
-            pull(q6562, column="pct_of_promo_trips", filters={"city": city, "car_group": grp}, scale=0.01),
-            pull(q6640, column="match_rate", filters={"city": city, "vehicle_type": wheel}),
-            pull(q7666, column="total_gmv", filters=gmv_f, month=month),
-            pull(q6189, column="total_system_fee", filters={"city": city, "vehicle_type": wheel}, agg="sum"),
-            pull(q6708, column="average_fare", filters={"city": city, "vehicle_type": wheel}),
-        )))
-    return blocks
+
+@traced(args=("date",))
+def fetch_vn(redash, date, s, e, month):
+    """Vietnam, {city: blocks} for HCM / HAN. The region results are fetched and
+    indexed once; each city's rows are picked from them."""
+    queries = {query.id: query for query in vn_queries(date, s, e)}
+    redash.run_queries(list(queries.values()))
+    q7666, q6562 = result(redash, queries[7666]), result(redash, queries[6562])
+    q6640, q6189, q6708 = result(redash, queries[6640]), result(redash, queries[6189]), result(redash, queries[6708])
+
+    cities = {}
+    for city in VN_CITIES:
+        blocks = []
+        for veh, wheel, grp in [("BIKE (2W)", "2W", "BIKE"), ("CAR (4W)", "4W", "CAR")]:
+            gmv_f = {"ride_month": "__MONTH__", "city": city, "car_group": grp}
+            blocks.append((veh, block(
+                pull(q7666, column="completed_rides", filters=gmv_f, month=month),
+                pull(q6562, column="pct_of_promo_trips", filters={"city": city, "car_group": grp}, scale=0.01),
+                pull(q6640, column="match_rate", filters={"city": city, "vehicle_type": wheel}),
+                pull(q7666, column="total_gmv", filters=gmv_f, month=month),
+                pull(q6189, column="total_system_fee", filters={"city": city, "vehicle_type": wheel}, agg="sum"),
+                pull(q6708, column="average_fare", filters={"city": city, "vehicle_type": wheel}),
+            )))
+        cities[city] = blocks
+    return cities
 
 
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 
-def main():
+# Regions built at once. Every month's queries run first as one batch of at
+# most REGION_WORKERS * 8 jobs in flight.
+REGION_WORKERS = 4
+
+
+def queries(month=None):
+    """Every query the report runs for `month` (see month_info), in run order."""
+    date, start_date, end_date, _ = month_info(month)
+    return (
+        sg_queries(date, start_date, end_date)
+        + hk_queries(date, start_date, end_date)
+        + ny_queries(date, start_date, end_date)
+        + th_queries(date, start_date, end_date)
+        + kh_queries(date, start_date, end_date)
+        + vn_queries(date, start_date, end_date)
+    )
+
+
+def region_tasks(redash, month=None):
+    """(sheet name, fetch) per region for `month` (see month_info)."""
+    date, start_date, end_date, _ = month_info(month)
+    month = start_date[:7]
+    vn = once(lambda: fetch_vn(redash, date, start_date, end_date, month))
+    return [
+        ("SG",   lambda: fetch_sg(redash, date, start_date, end_date)),
+        ("HK",   lambda: fetch_hk(redash, date, start_date, end_date)),
+        ("NY",   lambda: fetch_ny(redash, date, start_date, end_date)),
+        ("TH",   lambda: fetch_th(redash, date, start_date, end_date)),
+        ("KH",   lambda: fetch_kh(redash, date, start_date, end_date)),
+        ("HCMC", lambda: vn()["HCM"]),
+        ("HAN",  lambda: vn()["HAN"]),
+    ]
+
+
+def main(redash=None):
+    """`redash` lets a caller that already ran queries() share its client."""
     load_dotenv()
 
-    redash = Redash(
+    # With reuse, the per-region run_queries calls below are served from the
+    # batch that runs every month's queries up front.
+    redash = redash or AsyncRedash(
         key=os.getenv("REDASH_API_KEY"),
         base_url=os.getenv("REDASH_BASE_URL"),
+        max_concurrency=REGION_WORKERS * 8,
+        pool_size=REGION_WORKERS * 8,
+        reuse=True,
     )
 
-    month_arg = sys.argv[1] if len(sys.argv) > 1 else None     # optional YYYY-MM
-    date, start_date, end_date, label = month_info(month_arg)
-    month = start_date[:7]
+    # optional YYYY-MM, or a YYYY-MM YYYY-MM range
+    if len(sys.argv) > 2:
+        months = month_starts(sys.argv[1], sys.argv[2])
+    else:
+        months = [sys.argv[1] if len(sys.argv) > 1 else None]
+    labels = [month_info(month)[3] for month in months]
+    _, start_date, _, _ = month_info(months[0])
+    _, _, end_date, _ = month_info(months[-1])
+    label = labels[0] if len(months) == 1 else f"{labels[0]}_to_{labels[-1]}"
 
     print(f"Regional Operational Data - {label}")
     print(f"  Period : {start_date} -> {end_date}\n")
 
-    tasks = [
-        ("SG",   lambda: fetch_sg(redash, date, start_date, end_date)),
-        ("HK",   lambda: fetch_hk(redash, date, start_date, end_date)),
-        ("NY",   lambda: fetch_ny(redash, date, start_date, end_date)),
-        ("TH",   lambda: fetch_th(redash, date, start_date, end_date)),
-        ("KH",   lambda: fetch_kh(redash, date, start_date, end_date)),
-        ("HCMC", lambda: fetch_vn_city(redash, date, start_date, end_date, month, "HCM")),
-        ("HAN",  lambda: fetch_vn_city(redash, date, start_date, end_date, month, "HAN")),
-    ]
+    redash.run_queries([query for month in months for query in queries(month)])
 
-    wb = Workbook()
-    wb.remove(wb.active)
+    output_file = f"Regional_Operational_Data_{label}.xlsx"
+    book = WorkbookWriter(output_file, constant_memory=True)
+
+    # Fetch concurrently, then write sheets in task order as results arrive.
+    pool = ThreadPoolExecutor(max_workers=REGION_WORKERS)
+    futures = {}
+    for month in months:
+        for name, fn in region_tasks(redash, month):
+            futures.setdefault(name, []).append(pool.submit(fn))
 
-    for name, fn in tasks:
+    for name, region_futures in futures.items():
         print(f"-> {name}")
-        try:
-            blocks = fn()
-            ws = wb.create_sheet(name)
-            write_sheet(ws, label, blocks)
+        periods, error = [], None
+        for month_label, future in zip(labels, region_futures):
+            try:
+                periods.append(future.result())
+            except Exception as e:
+                import traceback
+                print(f"   FAILED ({month_label}): {e}")
+                traceback.print_exc()
+                periods.append(None)
+                error = e
+        if any(blocks is not None for blocks in periods):
+            write_sheet(book, name, labels, periods)
             print("   done")
-        except Exception as e:
-            import traceback
-            print(f"   FAILED: {e}")
-            traceback.print_exc()
-            ws = wb.create_sheet(name)
-            ws["A1"] = f"FAILED: {e}"
+        else:
+            book.add_sheet(name).write(0, 0, f"FAILED: {error}")
+    pool.shutdown()
 
-    output_file = f"Regional_Operational_Data_{label}.xlsx"
-    wb.save(output_file)
+    book.close()
     print(f"\nSaved: {output_file}")
 
     slack = SlackBot()
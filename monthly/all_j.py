@@ -1,32 +1,16 @@
 import os
-from datetime import datetime, timedelta
 
 import pandas as pd
 from dotenv import load_dotenv
 
 from utils.constants import REGIONS, TIMEZONES
-from utils.helpers import Query, Redash
+from utils.dates import previous_month
+from utils.helpers import AsyncRedash, Query
 from utils.slack import SlackBot
 
 
-def main():
-  load_dotenv()
-
-  redash = Redash(
-    key=os.getenv("REDASH_API_KEY"),
-    base_url=os.getenv("REDASH_BASE_URL")
-  )
-
-  dt_format = "%Y-%m-%d"
-  start_date = (datetime.today().replace(day=1) - timedelta(days=1)).replace(day=1).strftime(dt_format)
-  end_date = (datetime.today().replace(day=1) - timedelta(days=1)).strftime(dt_format)
-
-  DAYS_IN_MONTH = int(end_date.split("-")[2])
-
-  output_date = datetime.strptime(start_date, dt_format).strftime("%b_%Y")
-
-  # SG
-  sg_queries = [[
+def sg_queries(start_date):
+  return [
     Query(2183, params={"date": start_date}),
     Query(2187, params={"date": start_date}),
     Query(2189, params={"date": start_date}),
@@ -37,11 +21,107 @@ def main():
     Query(2247, params={"date": start_date}),
     Query(2353, params={"date": start_date}),
     Query(2354, params={"date": start_date}),
-  ]]
+  ]
+
+
+def kh_queries(start_date, end_date):
+  return [
+    Query(1625, params={"date": start_date}),
+    Query(2377, params={"date": start_date}),
+    Query(2383, params={"date": start_date}),
+    Query(5349, params={"date": start_date}),
+    Query(2385, params={"date": start_date}),
+    Query(2386, params={"date": start_date}),
+    Query(2545, params={"date_range": {"start": start_date, "end": end_date}}),
+    Query(2547, params={"date": start_date}),
+    Query(2549, params={"date": start_date}),
+    Query(2550, params={"date": start_date}),
+    Query(2664, params={"date": start_date}),
+  ]
+
+
+def vn_queries(start_date, end_date):
+  return [
+    Query(4562, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
+    Query(4563, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
+    Query(4565, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
+    Query(4566, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
+    Query(4578, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
+    Query(4582, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
+  ]
+
+
+def th_queries(start_date):
+  region = "TH"
+
+  timezone = TIMEZONES[region]
+  region_str = REGIONS[region]
+
+  return [
+    Query(2667, params={"region": region_str, "timezone": timezone, "date": start_date}),
+    Query(3106, params={"date": start_date}),
+    Query(3113, params={"region": region, "timezone": timezone, "date": start_date}),
+    Query(3119, params={"region": region, "timezone": timezone, "date": start_date}),
+    Query(3120, params={"region": region, "timezone": timezone, "date": start_date}),
+    Query(3121, params={"region": region, "timezone": timezone, "date": start_date}),
+  ]
+
+
+def hk_queries(start_date, end_date):
+  return [
+    Query(3771, params={"date_range": {"start": start_date, "end": end_date}}),
+    Query(3772, params={"date_range": {"start": start_date, "end": end_date}}),
+    Query(3773, params={"date_range": {"start": start_date, "end": end_date}}),
+    Query(3774, params={"date_range": {"start": start_date, "end": end_date}}),
+    Query(3785, params={"date_range": {"start": start_date, "end": end_date}}),
+    Query(3790, params={"date_range": {"start": start_date, "end": end_date}}),
+  ]
+
+
+def ny_queries(start_date):
+  return [
+    Query(7578, params={"date": start_date}),  # NY - Trips numbers
+    Query(7583, params={"date": start_date}),  # NY - ETA
+    Query(7579, params={"date": start_date}),  # NY - Monthly rides / Unique Trips
+    Query(7621, params={"date": start_date}),  # NY - Active users
+    Query(7591, params={"date": start_date}),  # NY - Rider all time / same month
+    Query(7632, params={"date": start_date}),  # NY - Monthly Resurrected Riders
+    Query(7633, params={"date": start_date}),  # NY - Monthly Churned Riders
+    Query(7625, params={"date": start_date}),  # NY - Driver all time / same month
+    Query(7634, params={"date": start_date}),  # NY - Monthly Resurrected Drivers
+    Query(7635, params={"date": start_date}),  # NY - Monthly Churned Drivers
+  ]
+
+
+def queries():
+  """Every query the report runs for the previous month, in run order."""
+  start_date, end_date, _, _ = previous_month()
+  return (
+    sg_queries(start_date)
+    + kh_queries(start_date, end_date)
+    + vn_queries(start_date, end_date)
+    + th_queries(start_date)
+    + hk_queries(start_date, end_date)
+    + ny_queries(start_date)
+  )
+
+
+def main(redash=None):
+  load_dotenv()
+
+  # A caller that already ran queries() can pass its client to share results
+  redash = redash or AsyncRedash(
+    key=os.getenv("REDASH_API_KEY"),
+    base_url=os.getenv("REDASH_BASE_URL"),
+    max_concurrency=16
+  )
+
+  start_date, end_date, DAYS_IN_MONTH, output_date = previous_month()
 
-  for query_list in sg_queries:
-    redash.run_queries(query_list)
+  # All six regions go out as one batch; each block below only assembles
+  redash.run_queries(queries())
 
+  # SG
   sg = pd.DataFrame()
 
   df1 = redash.get_result(2183)   # SG - All trips
@@ -76,23 +156,6 @@ def main():
   sg.columns = [f"{output_date}"]
 
   # KH
-  kh_queries = [[
-    Query(1625, params={"date": start_date}),
-    Query(2377, params={"date": start_date}),
-    Query(2383, params={"date": start_date}),
-    Query(5349, params={"date": start_date}),
-    Query(2385, params={"date": start_date}),
-    Query(2386, params={"date": start_date}),
-    Query(2545, params={"date_range": {"start": start_date, "end": end_date}}),
-    Query(2547, params={"date": start_date}),
-    Query(2549, params={"date": start_date}),
-    Query(2550, params={"date": start_date}),
-    Query(2664, params={"date": start_date}),
-  ]]
-
-  for query_list in kh_queries:
-    redash.run_queries(query_list)
-
   kh = pd.DataFrame()
 
   df1 = redash.get_result(1625)   # KH - All trips
@@ -128,18 +191,6 @@ def main():
   kh.columns = [f"{output_date}"]
 
   # VN
-  vn_queries = [[
-    Query(4562, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
-    Query(4563, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
-    Query(4565, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
-    Query(4566, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
-    Query(4578, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
-    Query(4582, params={"date_range": {"start": start_date, "end": end_date}, "city": "ALL"}),
-  ]]
-
-  for query_list in vn_queries:
-    redash.run_queries(query_list)
-
   vn = pd.DataFrame()
 
   df1 = redash.get_result(4562)   # VN - All trips
@@ -170,23 +221,6 @@ def main():
   vn.columns = [f"{output_date}"]
 
   # TH
-  region = "TH"
-
-  timezone = TIMEZONES[region]
-  region_str = REGIONS[region]
-
-  th_queries = [[
-    Query(2667, params={"region": region_str, "timezone": timezone, "date": start_date}),
-    Query(3106, params={"date": start_date}),
-    Query(3113, params={"region": region, "timezone": timezone, "date": start_date}),
-    Query(3119, params={"region": region, "timezone": timezone, "date": start_date}),
-    Query(3120, params={"region": region, "timezone": timezone, "date": start_date}),
-    Query(3121, params={"region": region, "timezone": timezone, "date": start_date}),
-  ]]
-
-  for query_list in th_queries:
-    redash.run_queries(query_list)
-
   th = pd.DataFrame()
 
   df1 = redash.get_result(3106)   # TH - All trips
@@ -217,18 +251,6 @@ def main():
   th.columns = [f"{output_date}"]
 
   # HK
-  hk_queries = [[
-    Query(3771, params={"date_range": {"start": start_date, "end": end_date}}),
-    Query(3772, params={"date_range": {"start": start_date, "end": end_date}}),
-    Query(3773, params={"date_range": {"start": start_date, "end": end_date}}),
-    Query(3774, params={"date_range": {"start": start_date, "end": end_date}}),
-    Query(3785, params={"date_range": {"start": start_date, "end": end_date}}),
-    Query(3790, params={"date_range": {"start": start_date, "end": end_date}}),
-  ]]
-
-  for query_list in hk_queries:
-    redash.run_queries(query_list)
-
   hk = pd.DataFrame()
 
   df1 = redash.get_result(3771)   # HK - Completed trips
@@ -259,22 +281,6 @@ def main():
   hk.columns = [f"{output_date}"]
 
   # NY
-  ny_queries = [[
-    Query(7578, params={"date": start_date}),  # NY - Trips numbers
-    Query(7583, params={"date": start_date}),  # NY - ETA
-    Query(7579, params={"date": start_date}),  # NY - Monthly rides / Unique Trips
-    Query(7621, params={"date": start_date}),  # NY - Active users
-    Query(7591, params={"date": start_date}),  # NY - Rider all time / same month
-    Query(7632, params={"date": start_date}),  # NY - Monthly Resurrected Riders
-    Query(7633, params={"date": start_date}),  # NY - Monthly Churned Riders
-    Query(7625, params={"date": start_date}),  # NY - Driver all time / same month
-    Query(7634, params={"date": start_date}),  # NY - Monthly Resurrected Drivers
-    Query(7635, params={"date": start_date}),  # NY - Monthly Churned Drivers
-  ]]
-
-  for query_list in ny_queries:
-    redash.run_queries(query_list)
-
   ny = pd.DataFrame()
 
   df1 = redash.get_result(7578)   # NY - Trips numbers
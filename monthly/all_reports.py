@@ -0,0 +1,68 @@
+"""Run the monthly reports from one process on one Redash client.
+
+monthly.sg, monthly.all_j, monthly.all_s, kpi.py and regional_od.py declare
+many of the same query instances (2183, 3771, 3106, 7578, 7579, 6189, ...).
+Run separately, each one executes them again. Here every report's queries()
+is collected and the deduplicated union runs as a single concurrent batch;
+then each report's main() is handed the shared client, which already holds
+every result, so the reports only download and build.
+
+  python -m monthly.all_reports
+"""
+import importlib.util
+import os
+import traceback
+
+from dotenv import load_dotenv
+
+from monthly import all_j, all_s, sg
+from utils.helpers import AsyncRedash
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def load(path):
+  # "kpi tracking" is not importable as a package, so load its scripts by path
+  name = os.path.splitext(os.path.basename(path))[0]
+  spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+
+def main():
+  load_dotenv()
+
+  redash = AsyncRedash(
+    key=os.getenv("REDASH_API_KEY"),
+    base_url=os.getenv("REDASH_BASE_URL"),
+    reuse=True
+  )
+
+  reports = [
+    ("SG", sg),
+    ("J", all_j),
+    ("S", all_s),
+    ("KPI", load("kpi tracking/kpi.py")),
+    ("Regional Ops", load("kpi tracking/regional_od.py")),
+  ]
+
+  queries = [query for _, report in reports for query in report.queries()]
+  print(f"Running {len({query.key for query in queries})} unique queries ({len(queries)} declared by {len(reports)} reports)")
+  redash.run_queries(queries)
+
+  failed = []
+  for name, report in reports:
+    print(f"\n== {name}")
+    try:
+      report.main(redash)
+    except Exception:
+      traceback.print_exc()
+      failed.append(name)
+
+  if failed:
+    raise SystemExit(f"Failed reports: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+  main()
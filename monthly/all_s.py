@@ -1,35 +1,36 @@
 import os
-from datetime import datetime, timedelta
 
 import pandas as pd
 from dotenv import load_dotenv
 
-from utils.helpers import Query, Redash
+from utils.dates import previous_month
+from utils.helpers import AsyncRedash, Query
 from utils.slack import SlackBot
 
 
-def main():
-  load_dotenv()
-
-  redash = Redash(key=os.getenv('REDASH_API_KEY'), base_url=os.getenv('REDASH_BASE_URL'))
-
-  dt_format = '%Y-%m-%d'
-  start_date = (datetime.today().replace(day=1) - timedelta(days=1)).replace(day=1).strftime(dt_format)
-
-  output_date = datetime.strptime(start_date, dt_format).strftime('%b_%Y')
-
-  queries = [[
+def queries():
+  """Every query the report runs for the previous month."""
+  start_date, _, _, _ = previous_month()
+  return [
     Query(2856, params={'date': start_date}),
-    Query(2857, params={'date': start_date}),
+    Query(2857, params={'date': start_date}, dtypes={'region': 'category', 'car_type': 'category'}),
     Query(3001, params={'date': start_date}),
     Query(3004, params={'date': start_date}),
     Query(1581),
     Query(7644, params={'date': start_date}),
     Query(7680, params={'date': start_date}),
-  ]]
+  ]
+
+
+def main(redash=None):
+  load_dotenv()
+
+  # A caller that already ran queries() can pass its client to share results
+  redash = redash or AsyncRedash(key=os.getenv('REDASH_API_KEY'), base_url=os.getenv('REDASH_BASE_URL'))
+
+  _, _, _, output_date = previous_month()
 
-  for query_list in queries:
-    redash.run_queries(query_list)
+  redash.run_queries(queries())
 
   df1 = redash.get_result(2856)  # SG - All trips breakdown by product
   df2 = redash.get_result(2857)  # KH/TH/VN - All trips breakdown by type
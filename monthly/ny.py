@@ -8,7 +8,8 @@ from dotenv import load_dotenv
 
 # Make `utils` importable whether run as a module (python -m monthly.ny) or directly.
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.helpers import Query, Redash  # noqa: E402
+from utils.dates import month_starts       # noqa: E402
+from utils.helpers import AsyncRedash, Query  # noqa: E402
 from utils.slack import SlackBot          # noqa: E402
 
 
@@ -48,35 +49,31 @@ QIDS = {
 RIDER_MAU_QID = 7621
 
 
-def main():
-    load_dotenv()
-    redash = Redash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
+def month_args(arg):
+    """(YEAR, MONTH) from "2026-06" or "2026-06-01"."""
+    try:
+        d = datetime.strptime(arg, "%Y-%m-%d")
+    except ValueError:
+        d = datetime.strptime(arg, "%Y-%m")
+    return d.year, d.month
 
-    # Optional override: `python -m monthly.ny 2026-06` (or 2026-06-01) to run a specific month.
-    # With no argument, defaults to the last COMPLETED month.
-    if len(sys.argv) > 1:
-        try:
-            d = datetime.strptime(sys.argv[1], "%Y-%m-%d")
-        except ValueError:
-            d = datetime.strptime(sys.argv[1], "%Y-%m")
-        YEAR, MONTH = d.year, d.month
-    else:
-        first_day_this_month = datetime.today().replace(day=1)
-        last_month_date = first_day_this_month - timedelta(days=1)
-        YEAR, MONTH = last_month_date.year, last_month_date.month
 
+def month_queries(YEAR, MONTH):
+    """Logical name -> Query for the month."""
     query_date = datetime(YEAR, MONTH, 1).strftime("%Y-%m-%d")
+    queries = {name: Query(qid, params={"date": query_date}) for name, qid in QIDS.items()}
+    if RIDER_MAU_QID:
+        queries["rider_mau"] = Query(RIDER_MAU_QID, params={"date": query_date})
+    return queries
+
+
+def month_report(redash, YEAR, MONTH):
+    """The month's metric column (its queries must already have run)."""
     DAYS_IN_MONTH = calendar.monthrange(YEAR, MONTH)[1]
     output_date = datetime(YEAR, MONTH, 1).strftime("%b_%Y")
 
-    # Batch-run all queries.
-    query_list = [Query(qid, params={"date": query_date}) for qid in QIDS.values()]
-    if RIDER_MAU_QID:
-        query_list.append(Query(RIDER_MAU_QID, params={"date": query_date}))
-    redash.run_queries(query_list)
-
-    r = {name: redash.get_result(qid) for name, qid in QIDS.items()}
-    rider_mau_df = redash.get_result(RIDER_MAU_QID) if RIDER_MAU_QID else None
+    r = {name: redash.get_result(query) for name, query in month_queries(YEAR, MONTH).items()}
+    rider_mau_df = r.pop("rider_mau", None)
 
     trips        = r["trips"]
     rides        = r["rides"]
@@ -212,7 +209,31 @@ def main():
 
     df = df.T
     df.columns = [f"{output_date}"]
+    return df
+
+
+def main():
+    load_dotenv()
+    redash = AsyncRedash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
+
+    # Optional override: `python -m monthly.ny 2026-06` (or 2026-06-01) to run a specific month,
+    # or `python -m monthly.ny 2026-01 2026-03` for every month in a range (a column per month).
+    # With no argument, defaults to the last COMPLETED month.
+    if len(sys.argv) > 2:
+        months = [month_args(m) for m in month_starts(sys.argv[1], sys.argv[2])]
+    elif len(sys.argv) > 1:
+        months = [month_args(sys.argv[1])]
+    else:
+        first_day_this_month = datetime.today().replace(day=1)
+        last_month_date = first_day_this_month - timedelta(days=1)
+        months = [(last_month_date.year, last_month_date.month)]
+
+    # Batch-run every month's queries at once.
+    redash.run_queries([query for YEAR, MONTH in months for query in month_queries(YEAR, MONTH).values()])
+
+    df = pd.concat([month_report(redash, YEAR, MONTH) for YEAR, MONTH in months], axis=1)
 
+    output_date = df.columns[0] if len(months) == 1 else f"{df.columns[0]}_to_{df.columns[-1]}"
     output_file = f"NY_{output_date}.csv"
     df.to_csv(output_file)
 
@@ -1,25 +1,23 @@
 import os
+from functools import partial
 
 import pandas as pd
 from dotenv import load_dotenv
 
 from utils.dates import previous_month
-from utils.helpers import Query, Redash
+from utils.helpers import AsyncRedash, Query
 from utils.slack import SlackBot
 
 
-def main():
-  load_dotenv()
-
-  redash = Redash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
-
-  start_date, end_date, DAYS_IN_MONTH, output_date = previous_month()
+def queries():
+  """Every query the report runs for the previous month."""
+  start_date, end_date, _, _ = previous_month()
   query_date = start_date
 
   region = 'SG'
   region_id = 1
 
-  queries = [
+  return [
     Query(2183, params={"date": query_date}),
     Query(2184, params={"date": query_date}),
     Query(2187, params={"date": query_date}),
@@ -50,42 +48,14 @@ def main():
     Query(5000, params={"date_range": {"start": start_date, "end": end_date}})
   ]
 
-  redash.run_queries(queries)
-
-  bq1 = redash.get_result(2187) # active users - rider
-  bq2 = redash.get_result(2192) # search and open
-  bq3 = redash.get_result(2203) # online driver
-  bq4 = redash.get_result(2198) # ping driver daily
-  bq5 = redash.get_result(2208) # driver avg online hour
-
-  df1 = redash.get_result(2183) # completed & others
-  df2 = redash.get_result(2184) # trip booking
-  df3 = redash.get_result(2214) # approved
-  df4 = redash.get_result(2188) # rider sign up
-  df5 = redash.get_result(2189) # all-time / same mth rider
-  df6 = redash.get_result(2194) # book / completed monthly
-  df7 = redash.get_result(2195) # unique
-  df8 = redash.get_result(2210) # median ETA
-  df9 = redash.get_result(2246) # resurrect rider
-  df10 = redash.get_result(2247) # churned
-  df11 = redash.get_result(2197) # rider wait before cxl
-  df12 = redash.get_result(2203) # online driver daily / count
-  df13 = redash.get_result(2205) # driver
-  df14 = redash.get_result(2204) # driver completed / ride per
-  df15 = redash.get_result(2206) # driver all-time / same mth
-  df16 = redash.get_result(2209) # driver avg util hrs
-  df17 = redash.get_result(2353) # resurrect driver
-  # df18 = redash.get_result(2354) # churned driver - old query
-  df19 = redash.get_result(4691) # monthly ps - first try
-  df20 = redash.get_result(4724) # rider act, resurrect, churn
-  df21 = redash.get_result(4727) # rider act, resurrect, churn
-  df22 = redash.get_result(4814) # median time to match, expire
-  df23 = redash.get_result(4819) # new book search logic
-  df24 = redash.get_result(5000) # driver approved
-
-  df = pd.DataFrame()
 
+def trip_metrics(DAYS_IN_MONTH, df1, df2, df3, df7, df8, df19, df22):
   # total summaries
+  #   df1 (2183) completed & others   df2 (2184) trip booking
+  #   df3 (2214) approved             df7 (2195) unique
+  #   df8 (2210) median ETA           df19 (4691) monthly ps - first try
+  #   df22 (4814) median time to match, expire
+  df = pd.DataFrame()
 
   df['rides'] = df1.completed
   df['demand'] = df1.demand
@@ -111,9 +81,20 @@ def main():
   df['completed_riders_taxi'] = df2.taxi_driver_completed
   df['taxi_approved_drivers'] = df3.approved_taxi
 
-  df = df.copy()
+  return df
 
-  # driver starting here
+
+def driver_metrics(DAYS_IN_MONTH, df1, bq3, bq4, bq5, df11, df13, df14, df15, df16, df17, df21, df24):
+  # driver
+  #   df1 (2183) completed & others   bq3 (2203) online driver
+  #   bq4 (2198) ping driver daily    bq5 (2208) driver avg online hour
+  #   df11 (2197) wait before cxl     df13 (2205) driver
+  #   df14 (2204) driver completed / ride per
+  #   df15 (2206) driver all-time / same mth
+  #   df16 (2209) driver avg util hrs df17 (2353) resurrect driver
+  #   df21 (4727) act, resurrect, churn
+  #   df24 (5000) driver approved
+  df = pd.DataFrame()
 
   df['driver_mau'] = bq3.online_driver_count
   df['completed_driver'] = df1.completed_drivers
@@ -156,14 +137,24 @@ def main():
   df['driver_churned_rate'] = None
   df['driver_inflow'] = df21.activated + df21.resurrected - df21.churned
 
-  df = df.copy()
+  return df
 
-  # rider start here
+
+def rider_metrics(DAYS_IN_MONTH, df1, bq1, bq2, bq3, df4, df5, df6, df7, df9, df11, df20, df23):
+  # rider
+  #   df1 (2183) completed & others   bq1 (2187) active users - rider
+  #   bq2 (2192) search and open      bq3 (2203) online driver
+  #   df4 (2188) rider sign up        df5 (2189) all-time / same mth rider
+  #   df6 (2194) book / completed monthly
+  #   df7 (2195) unique               df9 (2246) resurrect rider
+  #   df11 (2197) wait before cxl     df20 (4724) act, resurrect, churn
+  #   df23 (4819) new book search logic
+  df = pd.DataFrame()
 
   df['rider_mau'] = bq1.active_users
-  df['rider_mau_demand'] = df.demand/df.rider_mau
-  df['rider_mau_rides'] = df.rides/df.rider_mau
-  df['r_d_ratio'] = df.rider_mau/df.driver_mau
+  df['rider_mau_demand'] = df1.demand/df.rider_mau
+  df['rider_mau_rides'] = df1.completed/df.rider_mau
+  df['r_d_ratio'] = df.rider_mau/bq3.online_driver_count
   df['rider_downloads'] = None
   df['rider_signup'] = df4.rider_signup
   df['rider_signup_daily'] = df4.rider_signup/DAYS_IN_MONTH
@@ -179,11 +170,11 @@ def main():
   df['rider_unique_book_daily'] = df23.rider_unique_book_daily_avg
   df['rider_unique_complete_daily'] = df6.completed_daily
   df['book_search_ratio_daily'] = df23.book_search_ratio_daily
-  df['booking_per_user'] = df.demand/df.rider_unique_book_monthly
-  df['complete_per_user'] = df.rides/df.rider_unique_complete_monthly
-  df['duplicate_ratio'] = df.demand/df7.unique
+  df['booking_per_user'] = df1.demand/df.rider_unique_book_monthly
+  df['complete_per_user'] = df1.completed/df.rider_unique_complete_monthly
+  df['duplicate_ratio'] = df1.demand/df7.unique
   df['rider_waiting_before_cancel'] = df11.avg_waiting_time_rider_cxl
-  df['rider_cancellation_rate'] = df1.rider_cancel/df.demand*100
+  df['rider_cancellation_rate'] = df1.rider_cancel/df1.demand*100
   df['riders_ft_unique'] = df.rider_ft_all_time/df.rider_unique_complete_monthly
   df['riders_repeated'] = df20.repeated
   df['resurrect_2_month'] = df9.resurrect_2_month
@@ -201,7 +192,33 @@ def main():
   df['rider_churned_rate'] = None
   df['rider_inflow'] = df20.activated + df20.resurrected - df20.churned
 
-  df = df.copy()
+  return df
+
+
+def main(redash=None):
+  load_dotenv()
+
+  # A caller that already ran queries() can pass its client to share results
+  redash = redash or AsyncRedash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
+
+  start_date, end_date, DAYS_IN_MONTH, output_date = previous_month()
+
+  # Each block starts as soon as its own queries have landed; the ids are
+  # listed in the order of the block function's frame arguments.
+  declared = {query.id: query for query in queries()}
+  def needs(*ids):
+    return [declared[qid] for qid in ids]
+
+  blocks = redash.run_blocks({
+    'trips': (needs(2183, 2184, 2214, 2195, 2210, 4691, 4814),
+              partial(trip_metrics, DAYS_IN_MONTH)),
+    'driver': (needs(2183, 2203, 2198, 2208, 2197, 2205, 2204, 2206, 2209, 2353, 4727, 5000),
+               partial(driver_metrics, DAYS_IN_MONTH)),
+    'rider': (needs(2183, 2187, 2192, 2203, 2188, 2189, 2194, 2195, 2246, 2197, 4724, 4819),
+              partial(rider_metrics, DAYS_IN_MONTH)),
+  })
+
+  df = pd.concat([blocks['trips'], blocks['driver'], blocks['rider']], axis=1)
 
   df = df.T
   df.columns = [f"{output_date}"]
@@ -1,17 +1,206 @@
 import os
 
-import pandas as pd
 from dotenv import load_dotenv
 
 from utils.constants import IDS, REGIONS, TIMEZONES
 from utils.dates import previous_month
-from utils.helpers import Query, Redash
+from utils.helpers import AsyncRedash, Query
 from utils.slack import SlackBot
+from utils.spec import Col, Spec
+
+# 3106 Rides (totals, 4W, bike)          3108 Approved Drivers
+# 3110 Rider Signup                      3111 Rider FT
+# 3112 Rider Daily                       3113 Rider Unique Bookings
+# 3114 Waiting Before Cancel             3115 Drivers Daily
+# 3116 Driver Signup / Approved          3117 Driver FT
+# 3118 Driver Utilisation                3120 Rider Repeated / Resurrected / Churned
+# 3121 Driver Repeated / Resurrected / Churned
+# 3122 / 3127 Bike / 4W Drivers Daily    3123 / 3128 Bike / 4W Utilisation
+# 2667 Active Riders                     2668 Rider Opens
+# 2669 / 3124 / 3129 Online Drivers (all, bike, 4W)
+# 2670 / 3125 / 3130 Pinged Drivers (all, bike, 4W)
+# 2671 / 3126 / 3131 Online Hours (all, bike, 4W)
+# 4754 First Try Cater Rate              4814 Time to Match / Expire
+# 4411 Daily Median ETA                  4819 Search / Book Users
+# 4981 Unique Riders                     4985 Median ETA by Ride Type
+
+# Result columns the formulas read without reporting them as rows
+INPUTS = {
+  "matched": Col(3106, "matched"),
+  "matched_4w": Col(3106, "_4w_matched"),
+  "matched_bike": Col(3106, "bike_matched"),
+  "driver_cancel": Col(3106, "driver_cancel"),
+  "cancel_4w": Col(3106, "_4w_cancel"),
+  "cancel_bike": Col(3106, "bike_cancel"),
+  "rider_cancel": Col(3106, "rider_cancel"),
+  "unique_riders": Col(4981, "unique"),
+  "unique_riders_4w": Col(4981, "unique_4w"),
+  "unique_riders_bike": Col(4981, "unique_bike"),
+  "unique_bookings": Col(3113, "unique"),
+  "driver_activated": Col(3121, "activated"),
+  "activated_4w": Col(3121, "activated_4w"),
+  "activated_bike": Col(3121, "activated_bike"),
+  "rider_activated": Col(3120, "activated"),
+}
+
+
+def monthly_spec(days):
+  """The TH monthly sheet for a month of `days` days."""
+  # Driver metrics per vehicle: row prefix (_4w_x / bike_x), column suffix
+  # (x_4w / x_bike) and the query ids of its online, pinged, daily,
+  # online-hours and utilisation results.
+  vehicles = [
+    ("_4w", "4w", 3129, 3130, 3127, 3131, 3128),
+    ("bike", "bike", 3124, 3125, 3122, 3126, 3123),
+  ]
+  return Spec([
+    # totals
+    ("rides", Col(3106, "completed")),
+    ("demand", Col(3106, "demand")),
+    ("match_rate", lambda m: m["matched"] / m["demand"]),
+    ("completion_rate", lambda m: m["rides"] / m["demand"]),
+    ("daily_rides", lambda m: m["rides"] / days),
+    ("uncompleted", lambda m: m["demand"] - m["rides"]),
+    ("cater_rate", lambda m: m["rides"] / m["unique_riders"]),
+    ("first_try_cater_rate", Col(4754, "first_try_cater_rate")),
+    ("retry_initiation_rate", Col(4754, "retry_initiation_rate")),
+    ("retry_success_rate", Col(4754, "retry_success_rate")),
+    ("booked_riders", Col(3106, "booked_riders")),
+    ("completed_riders", Col(3106, "completed_riders")),
+    ("daily_median_eta", Col(4411, "avg_daily_median_eta")),
+    ("median_time_to_match_sec", Col(4814, "median_time_to_match_sec")),
+    ("median_time_to_expire_sec", Col(4814, "median_time_to_expire_sec")),
+
+    # broken down by ride type - 4w vs bike
+    ("rides_4w", Col(3106, "_4w_completed")),
+    ("demand_4w", Col(3106, "_4w_demand")),
+    ("match_rate_4w", lambda m: m["matched_4w"] / m["demand_4w"]),
+    ("completion_rate_4w", lambda m: m["rides_4w"] / m["demand_4w"]),
+    ("daily_rides_4w", lambda m: m["rides_4w"] / days),
+    ("uncompleted_4w", lambda m: m["demand_4w"] - m["rides_4w"]),
+    ("cater_rate_4w", lambda m: m["rides_4w"] / m["unique_riders_4w"]),
+    ("daily_median_eta_4w", Col(4985, "median_eta_4w")),
+    ("phv_completed_drivers", Col(3106, "_4w_completed_drivers")),
+    ("phv_approved_drivers", Col(3108, "approved_4w")),
+
+    ("rides_bike", Col(3106, "bike_completed")),
+    ("demand_bike", Col(3106, "bike_demand")),
+    ("match_rate_bike", lambda m: m["matched_bike"] / m["demand_bike"]),
+    ("completion_rate_bike", lambda m: m["rides_bike"] / m["demand_bike"]),
+    ("daily_rides_bike", lambda m: m["rides_bike"] / days),
+    ("uncompleted_bike", lambda m: m["demand_bike"] - m["rides_bike"]),
+    ("cater_rate_bike", lambda m: m["rides_bike"] / m["unique_riders_bike"]),
+    ("daily_median_eta_bike", Col(4985, "median_eta_bike")),
+    ("bike_completed_drivers", Col(3106, "bike_completed_drivers")),
+    ("bike_approved_drivers", Col(3108, "approved_bike")),
+
+    # start of driver section here
+    ("driver_mau", Col(2669, "online_driver_count")),
+    ("completed_driver", Col(3106, "completed_drivers")),
+    ("total_approved_drivers", Col(3108, "total_approved")),
+    ("driver_online_daily", Col(2669, "online_driver_daily")),
+    ("pinged_drivers_daily", Col(2670, "pinged_drivers_daily")),
+    ("completed_driver_daily", Col(3115, "completed_driver_daily")),
+    ("online_mau", lambda m: m["driver_online_daily"] / m["driver_mau"]),
+    ("completed_online", lambda m: m["completed_driver_daily"] / m["driver_online_daily"]),
+    ("online_no_complete", lambda m: m["driver_online_daily"] - m["completed_driver_daily"]),
+    ("ride_per_driver", Col(3115, "ride_per_driver")),
+    ("driver_downloads", None),
+    ("driver_sign_up", Col(3116, "driver_sign_up")),
+    ("driver_sign_up_daily", lambda m: m["driver_sign_up"] / days),
+    ("driver_ft_all_time", Col(3117, "all_time")),
+    ("driver_ft_same_month", Col(3117, "same_month")),
+    ("driver_sign_up_activation_rate", lambda m: m["driver_ft_same_month"] / m["driver_sign_up"]),
+    ("driver_approved_activation_rate", lambda m: m["driver_ft_same_month"] / m["driver_same_month_approved"]),
+    ("driver_approved", Col(3116, "driver_approved")),
+    ("driver_same_month_approved", Col(3116, "driver_same_month_approved")),
+    ("driver_average_online_hours", Col(2671, "avg_online_hour")),
+    ("driver_average_utilisation_hours", Col(3118, "avg_utilisation_hours")),
+    ("ping_per_driver_daily", Col(2670, "ping_per_driver_daily")),
+    ("driver_waiting_before_cancel", Col(3114, "avg_waiting_time_driver_cxl")),
+    ("driver_cancellation_rate", lambda m: m["driver_cancel"] / m["matched"] * 100),
+    ("drivers_ft_unique", lambda m: m["driver_ft_all_time"] / m["completed_driver"]),
+    ("driver_repeated", Col(3121, "repeated")),
+    ("driver_resurrected", Col(3121, "resurrected")),
+    ("driver_resurrected_%", None),
+    ("driver_churned", Col(3121, "churned")),
+    ("driver_churned_%", None),
+    ("driver_inflow", lambda m: m["driver_activated"] + m["driver_resurrected"] - m["driver_churned"]),
+  ] + [
+    # ------------- 4W / BIKE METRICS -------------
+    metric
+    for p, v, online, pinged, daily, hours, utilisation in vehicles
+    for metric in [
+      (f"{p}_mau", Col(online, f"online_{v}_count")),
+      (f"completed_{v}", Col(3106, f"{p}_completed_drivers")),
+      (f"{p}_approved", Col(3116, f"{p}_approved")),
+      (f"{p}_online_daily", Col(online, f"online_{v}_daily")),
+      (f"pinged_{v}_daily", Col(pinged, f"pinged_{v}_daily")),
+      (f"completed_{v}_daily", Col(daily, f"completed_{v}_daily")),
+      (f"{p}_online_mau", lambda m, p=p: m[f"{p}_online_daily"] / m[f"{p}_mau"]),
+      (f"{p}_completed_online", lambda m, p=p, v=v: m[f"completed_{v}_daily"] / m[f"{p}_online_daily"]),
+      (f"{p}_online_no_complete", lambda m, p=p, v=v: m[f"{p}_online_daily"] - m[f"completed_{v}_daily"]),
+      (f"ride_per_{v}", Col(daily, f"ride_per_{v}")),
+      (f"{p}_sign_up", Col(3116, f"{p}_sign_up")),
+      (f"{p}_sign_up_daily", lambda m, p=p: m[f"{p}_sign_up"] / days),
+      (f"{p}_ft_all_time", Col(3117, f"{p}_all_time")),
+      (f"{p}_ft_same_month", Col(3117, f"{p}_same_month")),
+      (f"{p}_sign_up_activation_rate", lambda m, p=p: m[f"{p}_ft_same_month"] / m[f"{p}_sign_up"]),
+      (f"{p}_approved_activation_rate", lambda m, p=p: m[f"{p}_ft_same_month"] / m[f"{p}_same_month_approved"]),
+      (f"{p}_same_month_approved", Col(3116, f"{p}_same_month_approved")),
+      (f"{p}_average_online_hours", Col(hours, "avg_online_hour")),
+      (f"{p}_average_utilisation_hours", Col(utilisation, "avg_utilisation_hours")),
+      (f"ping_per_{v}_daily", Col(pinged, f"ping_per_{v}_daily")),
+      (f"{p}_waiting_before_cancel", Col(3114, f"avg_waiting_time_{v}_cxl")),
+      (f"{p}_cancellation_rate", lambda m, v=v: m[f"cancel_{v}"] / m[f"matched_{v}"] * 100),
+      (f"{p}_ft_unique", lambda m, p=p, v=v: m[f"{p}_ft_all_time"] / m[f"completed_{v}"]),
+      (f"{p}_repeated", Col(3121, f"repeated_{v}")),
+      (f"{p}_resurrected", Col(3121, f"resurrected_{v}")),
+      (f"{p}_resurrected_%", None),
+      (f"{p}_churned", Col(3121, f"churned_{v}")),
+      (f"{p}_churned_%", None),
+      (f"{p}_inflow", lambda m, p=p, v=v: m[f"activated_{v}"] + m[f"{p}_resurrected"] - m[f"{p}_churned"]),
+    ]
+  ] + [
+    # ---------------- RIDER METRICS ----------------
+    ("rider_mau", Col(2667, "active_users")),
+    ("rider_mau_demand", lambda m: m["demand"] / m["rider_mau"]),
+    ("rider_mau_rides", lambda m: m["rides"] / m["rider_mau"]),
+    ("r_d_ratio", lambda m: m["rider_mau"] / m["driver_mau"]),  # MAUR:MAUD Ratio
+    ("rider_downloads", None),
+    ("rider_signup", Col(3110, "rider_signup")),
+    ("rider_signup_daily", lambda m: m["rider_signup"] / days),
+    ("rider_ft_all_time", Col(3111, "all_time")),
+    ("rider_ft_same_month", Col(3111, "same_month")),
+    ("rider_same_month_activation", lambda m: m["rider_ft_same_month"] / m["rider_signup"]),
+    ("rider_unique_open_monthly", Col(2668, "open_monthly")),
+    ("rider_unique_search_monthly", Col(4819, "unique_search_users")),
+    ("rider_unique_book_monthly", Col(4819, "unique_order_users")),
+    ("rider_unique_complete_monthly", Col(3112, "completed_monthly")),
+    ("rider_unique_open_daily", Col(2668, "open_daily")),
+    ("rider_unique_search_daily", Col(4819, "rider_unique_search_daily_avg")),
+    ("rider_unique_book_daily", Col(4819, "rider_unique_book_daily_avg")),
+    ("rider_unique_complete_daily", Col(3112, "completed_daily")),
+    ("book_search_ratio_daily", Col(4819, "book_search_ratio_daily")),
+    ("booking_per_user", lambda m: m["demand"] / m["rider_unique_book_monthly"]),
+    ("complete_per_user", lambda m: m["rides"] / m["rider_unique_complete_monthly"]),
+    ("duplicate_ratio", lambda m: m["demand"] / m["unique_bookings"]),
+    ("rider_waiting_before_cancel", Col(3114, "avg_waiting_time_rider_cxl")),
+    ("rider_cancellation_rate", lambda m: m["rider_cancel"] / m["demand"]),
+    ("riders_ft_unique", lambda m: m["rider_ft_all_time"] / m["rider_unique_complete_monthly"]),
+    ("riders_repeated", Col(3120, "repeated")),
+    ("rider_resurrected", Col(3120, "resurrected")),
+    ("rider_resurrected_%", None),
+    ("rider_churned", Col(3120, "churned")),
+    ("rider_churned_%", None),
+    ("rider_inflow", lambda m: m["rider_activated"] + m["rider_resurrected"] - m["rider_churned"]),
+  ], inputs=INPUTS)
+
 
 def main():
   load_dotenv()
 
-  redash = Redash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
+  redash = AsyncRedash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
 
   # Previous full calendar month
   start_date, end_date, DAYS_IN_MONTH, output_date = previous_month()
@@ -71,268 +260,9 @@ def main():
   for query_list in queries:
     redash.run_queries(query_list)
 
-  bq1 = redash.get_result(2667)
-  bq2 = redash.get_result(2668)
-  bq3 = redash.get_result(2669)
-  bq4 = redash.get_result(2670)
-  bq5 = redash.get_result(2671)
-  bq6 = redash.get_result(3124)
-  bq7 = redash.get_result(3125)
-  bq8 = redash.get_result(3126)
-  bq9 = redash.get_result(3129)
-  bq10 = redash.get_result(3130)
-  bq11 = redash.get_result(3131)
-
-  df1 = redash.get_result(3106)
-  df2 = redash.get_result(3107)
-  df3 = redash.get_result(3108)
-  df4 = redash.get_result(3109)
-  df5 = redash.get_result(3110)
-  df6 = redash.get_result(3111)
-  df7 = redash.get_result(3112)
-  df8 = redash.get_result(3113)
-  df9 = redash.get_result(3114)
-  df10 = redash.get_result(3115)
-  df11 = redash.get_result(3116)
-  df12 = redash.get_result(3117)
-  df13 = redash.get_result(3118)
-  df14 = redash.get_result(3119)
-  df15 = redash.get_result(3120)
-  df16 = redash.get_result(3121)
-  df17 = redash.get_result(3122)
-  df18 = redash.get_result(3123)
-  df19 = redash.get_result(3127)
-  df20 = redash.get_result(3128)
-  df21 = redash.get_result(3132)
-  df22 = redash.get_result(3133)
-  df23 = redash.get_result(4754)
-  df24 = redash.get_result(4814)
-  df25 = redash.get_result(4411)
-  df26 = redash.get_result(4819)
-  df27 = redash.get_result(4981)
-  df28 = redash.get_result(4985)
-
-  df = pd.DataFrame()
-
-  # totals
-
-  df['rides'] = df1.completed
-  df['demand'] = df1.demand
-  df['match_rate'] = df1.matched/df.demand
-  df['completion_rate'] = df.rides/df.demand
-  df['daily_rides'] = df.rides/DAYS_IN_MONTH
-  df['uncompleted'] = df.demand - df.rides
-  df['cater_rate'] = df.rides/df27.unique
-  df['first_try_cater_rate'] = df23.first_try_cater_rate
-  df['retry_initiation_rate'] = df23.retry_initiation_rate
-  df['retry_success_rate'] = df23.retry_success_rate
-  df['daily_rides'] = df.rides/DAYS_IN_MONTH
-  df['booked_riders'] = df1.booked_riders
-  df['completed_riders'] = df1.completed_riders
-  df['daily_median_eta'] = df25.avg_daily_median_eta
-  df['median_time_to_match_sec'] = df24.median_time_to_match_sec
-  df['median_time_to_expire_sec'] = df24.median_time_to_expire_sec
-
-  df = df.copy()
-
-  # broken down by ride type - 4w vs bike
-
-  df['rides_4w'] = df1._4w_completed
-  df['demand_4w'] = df1._4w_demand
-  df['match_rate_4w'] = df1._4w_matched/df.demand_4w
-  df['completion_rate_4w'] = df.rides_4w/df.demand_4w
-  df['daily_rides_4w'] = df.rides_4w/DAYS_IN_MONTH
-  df['uncompleted_4w'] = df.demand_4w - df.rides_4w
-  df['cater_rate_4w'] = df.rides_4w/df27.unique_4w
-  # df['booked_riders_4w'] = df1.booked_riders_4w
-  # df['completed_riders_4w'] = df1._4w_completed_riders
-  df['daily_median_eta_4w'] = df28.median_eta_4w
-  df['phv_completed_drivers'] = df1._4w_completed_drivers
-  df['phv_approved_drivers'] = df3.approved_4w
-
-  df['rides_bike'] = df1.bike_completed
-  df['demand_bike'] = df1.bike_demand
-  df['match_rate_bike'] = df1.bike_matched/df.demand_bike
-  df['completion_rate_bike'] = df.rides_bike/df.demand_bike
-  df['daily_rides_bike'] = df.rides_bike/DAYS_IN_MONTH
-  df['uncompleted_bike'] = df1.bike_demand - df.rides_bike
-  df['cater_rate_bike'] = df.rides_bike/df27.unique_bike
-  # df['booked_riders_bike'] = df1.booked_riders_bike
-  # df['completed_riders_bike'] = df1.bike_completed_riders
-  df['daily_median_eta_bike'] = df28.median_eta_bike
-  df['bike_completed_drivers'] = df1.bike_completed_drivers
-  df['bike_approved_drivers'] = df3.approved_bike
-
-  df = df.copy()
-
-  # start of driver section here
-
-  df['driver_mau'] = bq3.online_driver_count
-  df['completed_driver'] = df1.completed_drivers
-  df['total_approved_drivers'] = df3.total_approved
-  df['driver_online_daily'] = bq3.online_driver_daily
-  df['pinged_drivers_daily'] = bq4.pinged_drivers_daily
-  df['completed_driver_daily'] = df10.completed_driver_daily
-  df['online_mau'] = df.driver_online_daily/df.driver_mau
-  df['completed_online'] = df.completed_driver_daily/df.driver_online_daily
-  df['online_no_complete'] = df.driver_online_daily-df.completed_driver_daily
-  df['ride_per_driver'] = df10.ride_per_driver
-  df['driver_downloads'] = None
-  df['driver_sign_up'] = df11.driver_sign_up
-  df['driver_sign_up_daily'] = df.driver_sign_up/DAYS_IN_MONTH
-  df['driver_ft_all_time'] = df12.all_time
-  df['driver_ft_same_month'] = df12.same_month
-  df['driver_sign_up_activation_rate'] = df.driver_ft_same_month/df.driver_sign_up
-  df['driver_approved_activation_rate'] = df.driver_ft_same_month/df11.driver_same_month_approved
-
-  df = df.copy()
-
-  df['driver_approved'] = df11.driver_approved
-  df['driver_same_month_approved'] = df11.driver_same_month_approved
-  df['driver_average_online_hours'] = bq5.avg_online_hour
-  df['driver_average_utilisation_hours'] = df13.avg_utilisation_hours
-  df['ping_per_driver_daily'] = bq4.ping_per_driver_daily
-  df['driver_waiting_before_cancel'] = df9.avg_waiting_time_driver_cxl
-  df['driver_cancellation_rate'] = df1.driver_cancel/df1.matched*100
-  df['drivers_ft_unique'] = df.driver_ft_all_time/df.completed_driver
-  df['driver_repeated'] = df16.repeated
-  df['driver_resurrected'] = df16.resurrected
-  df['driver_resurrected_%'] = None
-  df['driver_churned'] = df16.churned
-  df['driver_churned_%'] = None
-  df['driver_inflow'] = df16.activated + df16.resurrected - df16.churned
-
-  # start of driver phv and taxi
-
-  df = df.copy()
-
-  # ------------- 4W METRICS -------------
-  df['_4w_mau'] = bq9.online_4w_count
-  df['completed_4w'] = df1._4w_completed_drivers
-  df['_4w_approved'] = df11._4w_approved
-
-  df['_4w_online_daily'] = bq9.online_4w_daily
-  df['pinged_4w_daily'] = bq10.pinged_4w_daily
-  df['completed_4w_daily'] = df19.completed_4w_daily
-
-  df['_4w_online_mau'] = df._4w_online_daily / df._4w_mau
-  df['_4w_completed_online'] = df.completed_4w_daily / df._4w_online_daily
-  df['_4w_online_no_complete'] = df._4w_online_daily - df.completed_4w_daily
-
-  df['ride_per_4w'] = df19.ride_per_4w
-  df['_4w_sign_up'] = df11._4w_sign_up
-  df['_4w_sign_up_daily'] = df._4w_sign_up/DAYS_IN_MONTH
-  df['_4w_ft_all_time'] = df12._4w_all_time
-  df['_4w_ft_same_month'] = df12._4w_same_month
-  df['_4w_sign_up_activation_rate'] = df._4w_ft_same_month / df._4w_sign_up
-  df['_4w_approved_activation_rate'] = df._4w_ft_same_month / df11._4w_same_month_approved
-
-  df['_4w_same_month_approved'] = df11._4w_same_month_approved
-
-  df['_4w_average_online_hours'] = bq11.avg_online_hour
-  df['_4w_average_utilisation_hours'] = df20.avg_utilisation_hours
-  df['ping_per_4w_daily'] = bq10.ping_per_4w_daily
-
-  df['_4w_waiting_before_cancel'] = df9.avg_waiting_time_4w_cxl
-  df['_4w_cancellation_rate'] = df1._4w_cancel / df1._4w_matched * 100
-
-  df['_4w_ft_unique'] = df._4w_ft_all_time / df.completed_4w
-  df['_4w_repeated'] = df16.repeated_4w
-  df['_4w_resurrected'] = df16.resurrected_4w
-  df['_4w_resurrected_%'] = None  # added placeholder
-  df['_4w_churned'] = df16.churned_4w
-  df['_4w_churned_%'] = None  # added placeholder
-  df['_4w_inflow'] = df16.activated_4w + df16.resurrected_4w - df16.churned_4w
-
-  df = df.copy()
-
-  # ------------- BIKE METRICS -------------
-  df['bike_mau'] = bq6.online_bike_count
-  df['completed_bike'] = df1.bike_completed_drivers
-  df['bike_approved'] = df11.bike_approved
-
-  df['bike_online_daily'] = bq6.online_bike_daily
-  df['pinged_bike_daily'] = bq7.pinged_bike_daily
-  df['completed_bike_daily'] = df17.completed_bike_daily
-
-  df['bike_online_mau'] = df.bike_online_daily / df.bike_mau
-  df['bike_completed_online'] = df.completed_bike_daily / df.bike_online_daily
-  df['bike_online_no_complete'] = df.bike_online_daily - df.completed_bike_daily
-
-  df['ride_per_bike'] = df17.ride_per_bike
-  df['bike_sign_up'] = df11.bike_sign_up
-  df['bike_sign_up_daily'] = df.bike_sign_up/DAYS_IN_MONTH
-
-  df['bike_ft_all_time'] = df12.bike_all_time
-  df['bike_ft_same_month'] = df12.bike_same_month
-  df['bike_sign_up_activation_rate'] = df.bike_ft_same_month / df.bike_sign_up
-  df['bike_approved_activation_rate'] = df.bike_ft_same_month / df11.bike_same_month_approved
-
-  df['bike_same_month_approved'] = df11.bike_same_month_approved
-
-  df['bike_average_online_hours'] = bq8.avg_online_hour
-  df['bike_average_utilisation_hours'] = df18.avg_utilisation_hours
-  df['ping_per_bike_daily'] = bq7.ping_per_bike_daily
-
-  df['bike_waiting_before_cancel'] = df9.avg_waiting_time_bike_cxl
-  df['bike_cancellation_rate'] = (df1.bike_cancel / df1.bike_matched) * 100
-
-  df['bike_ft_unique'] = df.bike_ft_all_time / df.completed_bike
-  df['bike_repeated'] = df16.repeated_bike
-  df['bike_resurrected'] = df16.resurrected_bike
-  df['bike_resurrected_%'] = None  # added placeholder
-  df['bike_churned'] = df16.churned_bike
-  df['bike_churned_%'] = None  # added placeholder
-  df['bike_inflow'] = df16.activated_bike + df16.resurrected_bike - df16.churned_bike
-
-  df = df.copy()
-
-  # ---------------- RIDER METRICS ----------------
-  df['rider_mau'] = bq1.active_users
-  df['rider_mau_demand'] = df.demand / df.rider_mau
-  df['rider_mau_rides'] = df.rides / df.rider_mau
-  df['r_d_ratio'] = df.rider_mau / df.driver_mau  # MAUR:MAUD Ratio
-
-  df['rider_downloads'] = None
-
-  df['rider_signup'] = df5.rider_signup
-  df['rider_signup_daily'] = df.rider_signup / DAYS_IN_MONTH
-
-  df['rider_ft_all_time'] = df6.all_time
-  df['rider_ft_same_month'] = df6.same_month
-  df['rider_same_month_activation'] = df.rider_ft_same_month / df.rider_signup
-
-  df['rider_unique_open_monthly'] = bq2.open_monthly
-  df['rider_unique_search_monthly'] = df26.unique_search_users
-  df['rider_unique_book_monthly'] = df26.unique_order_users
-  df['rider_unique_complete_monthly'] = df7.completed_monthly
-
-  df['rider_unique_open_daily'] = bq2.open_daily
-  df['rider_unique_search_daily'] = df26.rider_unique_search_daily_avg
-  df['rider_unique_book_daily'] = df26.rider_unique_book_daily_avg
-  df['rider_unique_complete_daily'] = df7.completed_daily
-
-  df['book_search_ratio_daily'] = df26.book_search_ratio_daily
-  df['booking_per_user'] = df.demand / df.rider_unique_book_monthly
-  df['complete_per_user'] = df.rides / df.rider_unique_complete_monthly
-
-  df['duplicate_ratio'] = df.demand / df8.unique
-
-  df['rider_waiting_before_cancel'] = df9.avg_waiting_time_rider_cxl
-  df['rider_cancellation_rate'] = df1.rider_cancel / df.demand
-
-  df['riders_ft_unique'] = df.rider_ft_all_time / df.rider_unique_complete_monthly
-  df['riders_repeated'] = df15.repeated
-  df['rider_resurrected'] = df15.resurrected
-  df['rider_resurrected_%'] = None  # Placeholder – needs logic if desired
-  df['rider_churned'] = df15.churned
-  df['rider_churned_%'] = None  # Placeholder – needs logic if desired
-  df['rider_inflow'] = df15.activated + df15.resurrected - df15.churned
-
-  # df['cater_rate'] = df.rides / df8.unique
-  # df['average_eta'] = df14.daily_median_eta
-
-  df = df.T
+  # Only the results the sheet reads are downloaded, each read once
+  spec = monthly_spec(DAYS_IN_MONTH)
+  df = spec.evaluate({region: {qid: redash.get_result(qid) for qid in spec.query_ids}})
   df.columns = [f"{output_date}"]
 
   output_file = f"{region}_{output_date}.csv"
@@ -4,348 +4,233 @@ import pandas as pd
 from dotenv import load_dotenv
 
 from utils.dates import previous_month
-from utils.helpers import Query, Redash
+from utils.helpers import AsyncRedash, Query
 from utils.slack import SlackBot
+from utils.spec import Col, Spec
 
 
-def process_city_data(redash, start_date, end_date, DAYS_IN_MONTH, output_date, city):
-    """Process data for a specific city"""
-    
-    # Common queries that need city parameter (except 4579)
-    common_queries = [
-        Query(4562, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4563, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4565, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4566, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4568, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4569, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4570, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4571, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4572, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4574, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4576, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4577, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4578, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4580, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4581, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4582, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4594, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4598, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(4750, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        # Updated queries: 4814 -> 6077, 4819 -> 6078 (no region param, just city)
-        Query(6077, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-        Query(6078, params={"date_range": {"start": start_date, "end": end_date}, "city": city}),
-    ]
-    
+# Queries that take the city parameter (4579 doesn't, see city_queries)
+CITY_QIDS = [4562, 4563, 4565, 4566, 4568, 4569, 4570, 4571, 4572, 4574, 4576, 4577, 4578, 4580, 4581, 4582, 4594, 4598, 4750, 6077, 6078]
+
+
+def city_queries(start_date, end_date, city):
+    """Queries for a specific city, keyed by query id"""
+    date_range = {"start": start_date, "end": end_date}
+    queries = {qid: Query(qid, params={"date_range": date_range, "city": city}) for qid in CITY_QIDS}
+
     # Query 4579 doesn't have city param - only run for ALL city
     if city == "ALL":
-        common_queries.append(Query(4579, params={"date_range": {"start": start_date, "end": end_date}}))
-    
-    redash.run_queries(common_queries)
-
-    # Fetch results
-    bq1 = redash.get_result(4565) # active riders
-    bq2 = redash.get_result(4568) # active drivers
-    bq3 = redash.get_result(4570) # drivers ping
-    bq4 = redash.get_result(4574) # driver avg hours
-
-    df1 = redash.get_result(4562) # rides
-    df2 = redash.get_result(4563) # Rider Unique
-    df3 = redash.get_result(4566) # Drivers ETA
-    df4 = redash.get_result(4569) # Drivers Signup
-    df5 = redash.get_result(4571) # Drivers Daily
-    df6 = redash.get_result(4572) # Drivers FT
-    df7 = redash.get_result(4576) # Drivers Utilisation
-    df8 = redash.get_result(4577) # Rides Cancel
-    df9 = redash.get_result(4578) # Drivers CAR
-    df10 = redash.get_result(4579) if city == "ALL" else pd.DataFrame() # Rider Signup (only for ALL)
-    df11 = redash.get_result(4580) # Rider FT
-    df12 = redash.get_result(4581) # Rider Daily
-    df13 = redash.get_result(4582) # Riders CAR
-    df14 = redash.get_result(4594) # Monthly Resurrected Riders
-    df15 = redash.get_result(4598) # Monthly Resurrected Drivers
-    df16 = redash.get_result(4750) # monthly ps - first try
-    df17 = redash.get_result(6077) # median ttm / expire (was 4814)
-    df18 = redash.get_result(6078) # book search book logic (was 4819)
-
-    # Helper function to safely get column values
-    def safe_get(df, column_name, default=0):
-        if not df.empty and column_name in df.columns and len(df) > 0:
-            return df[column_name].iloc[0]
-        return default
-
-    # Construct monthly DataFrame
-    df = pd.DataFrame()
+        queries[4579] = Query(4579, params={"date_range": date_range})
+
+    return queries
+
+
+def ratio(a, b):
+    """a / b, or 0 where b is 0 (as the sheet has always shown an undefined rate)"""
+    return (a / b).where(b != 0, 0)
+
+
+# Result columns the formulas read without reporting them as rows
+INPUTS = {
+    f'{name}{s}': Col(qid, f'{column}{s}')
+    for s in ('', '_phv', '_bike')
+    for name, qid, column in (
+        ('matched', 4562, 'matched'),
+        ('driver_cancel', 4562, 'driver_cancel'),
+        ('rider_cancel', 4562, 'rider_cancel'),
+        ('unique', 4563, 'unique'),
+        ('same_month_approved', 4569, 'same_month_approved'),
+        ('driver_activated', 4578, 'activated'),
+        ('rider_activated', 4582, 'activated'),
+    )
+}
+
+
+def monthly_spec(days):
+    """The VN monthly sheet for a month of `days` days, one column per city.
+
+    Evaluated with missing values as 0, like the sheet's old per-cell reads.
+    """
+    # 4562 rides            4563 Rider Unique        4565 active riders
+    # 4566 Drivers ETA      4568 active drivers      4569 Drivers Signup
+    # 4570 drivers ping     4571 Drivers Daily       4572 Drivers FT
+    # 4574 driver avg hours 4576 Drivers Utilisation 4577 Rides Cancel
+    # 4578 Drivers CAR      4579 Rider Signup (ALL only)
+    # 4580 Rider FT         4581 Rider Daily         4582 Riders CAR
+    # 4594 Monthly Resurrected Riders               4598 Monthly Resurrected Drivers
+    # 4750 monthly ps - first try                   6077 median ttm / expire (was 4814)
+    # 6078 book search book logic (was 4819)
+    def drivers(s):
+        """Driver rows; s is '' for the totals, or the ride type suffix"""
+        return [
+            (f'driver_mau{s}', Col(4568, f'online{s}')),
+            (f'completed_driver{s}', Col(4562, f'completed_drivers{s}')),
+            (f'total_approved{s}', Col(4569, f'total_approved{s}')),
+            (f'driver_online_daily{s}', Col(4568, f'online_daily{s}')),
+            (f'pinged_drivers_daily{s}', Col(4570, f'pinged_drivers_daily{s}')),
+            (f'completed_driver_daily{s}', Col(4571, f'completed_driver_daily{s}')),
+            (f'online_mau{s}', lambda m: ratio(m[f'driver_online_daily{s}'], m[f'driver_mau{s}'])),
+            (f'completed_online{s}', lambda m: ratio(m[f'completed_driver_daily{s}'], m[f'driver_online_daily{s}'])),
+            (f'online_no_complete{s}', lambda m: m[f'driver_online_daily{s}'] - m[f'completed_driver_daily{s}']),
+            (f'ride_per_driver{s}', Col(4571, f'ride_per_driver{s}')),
+        ] + ([('driver_downloads', None)] if not s else []) + [
+            (f'driver_sign_up{s}', Col(4569, f'sign_up{s}')),
+            (f'driver_sign_up_daily{s}', lambda m: m[f'driver_sign_up{s}'] / days),
+            (f'driver_ft_all_time{s}', Col(4572, f'all_time{s}')),
+            (f'driver_ft_same_month{s}', Col(4572, f'same_month{s}')),
+            (f'driver_sign_up_activation_rate{s}', lambda m: ratio(m[f'driver_ft_same_month{s}'], m[f'driver_sign_up{s}'])),
+            (f'driver_approved_activation_rate{s}', lambda m: ratio(m[f'driver_ft_same_month{s}'], m[f'same_month_approved{s}'])),
+            (f'driver_approved{s}', Col(4569, f'approved{s}')),
+            (f'driver_same_month_approved{s}', Col(4569, f'same_month_approved{s}')),
+            (f'driver_average_online_hours{s}', Col(4574, f'avg_online_hour{s}')),
+            (f'driver_average_utilisation_hours{s}', Col(4576, f'avg_utilisation_hours{s}')),
+            (f'ping_per_driver_daily{s}', Col(4570, f'ping_per_driver_daily{s}')),
+            (f'driver_waiting_before_cancel{s}', Col(4577, f'avg_waiting_time_cxl{s}')),
+            (f'driver_cancellation_rate{s}', lambda m: ratio(m[f'driver_cancel{s}'], m[f'matched{s}']) * 100),
+            (f'drivers_ft_unique{s}', lambda m: ratio(m[f'driver_ft_all_time{s}'], m[f'completed_driver{s}'])),
+            (f'drivers_repeated{s}', Col(4578, f'repeated{s}')),
+            (f'resurrect_2_month_driver{s}', Col(4598, f'resurrect_2_month{s}')),
+            (f'resurrect_3_4_month_driver{s}', Col(4598, f'resurrect_3_4_month{s}')),
+            (f'resurrect_5_12_month_driver{s}', Col(4598, f'resurrect_5_12_month{s}')),
+            (f'driver_resurrected{s}', Col(4578, f'resurrected{s}')),
+            (f'driver_resurrected_rate{s}', None),
+            (f'driver_churned{s}', Col(4578, f'churned{s}')),
+            (f'driver_churned_rate{s}', None),
+            (f'driver_inflow{s}', lambda m: m[f'driver_activated{s}'] + m[f'driver_resurrected{s}'] - m[f'driver_churned{s}']),
+        ]
+
+    def rides(s):
+        """Performance rows shared by the totals and each ride type"""
+        return [
+            (f'rides{s}', Col(4562, f'completed{s}')),
+            (f'demand{s}', Col(4562, f'demand{s}')),
+            (f'match_rate{s}', lambda m: ratio(m[f'matched{s}'], m[f'demand{s}'])),
+            (f'completion_rate{s}', lambda m: ratio(m[f'rides{s}'], m[f'demand{s}'])),
+            (f'daily_rides{s}', lambda m: m[f'rides{s}'] / days),
+            (f'uncompleted{s}', lambda m: m[f'demand{s}'] - m[f'rides{s}']),
+            (f'cater_rate{s}', lambda m: ratio(m[f'rides{s}'], m[f'unique{s}'])),
+            (f'booked_riders{s}', Col(4562, f'booked_riders{s}')),
+            (f'completed_riders{s}', Col(4562, f'completed_riders{s}')),
+        ]
 
     # Performance Sheet
-    df['rides'] = [safe_get(df1, 'completed')]
-    df['demand'] = [safe_get(df1, 'demand')]
-    df['match_rate'] = [safe_get(df1, 'matched', 1) / df['demand'].iloc[0] if df['demand'].iloc[0] != 0 else 0]
-    df['completion_rate'] = [df['rides'].iloc[0] / df['demand'].iloc[0] if df['demand'].iloc[0] != 0 else 0]
-    df['daily_rides'] = [df['rides'].iloc[0] / DAYS_IN_MONTH]
-    df['uncompleted'] = [df['demand'].iloc[0] - df['rides'].iloc[0]]
-    df['cater_rate'] = [df['rides'].iloc[0] / safe_get(df2, 'unique', 1) if safe_get(df2, 'unique', 1) != 0 else 0]
-    df['booked_riders'] = [safe_get(df1, 'booked_riders')]
-    df['completed_riders'] = [safe_get(df1, 'completed_riders')]
-    df['first_try_cater_rate'] = [safe_get(df16, 'first_try_cater_rate')]
-    df['retry_initiation_rate'] = [safe_get(df16, 'retry_initiation_rate')]
-    df['retry_success_rate'] = [safe_get(df16, 'retry_success_rate')]
-    df['daily_median_eta'] = [safe_get(df3, 'median_eta')]
-    df['median_time_to_match_sec'] = [safe_get(df17, 'median_time_to_match_sec')]
-    df['median_time_to_expire_sec'] = [safe_get(df17, 'median_time_to_expire_sec')]
-
-    df['driver_mau'] = [safe_get(bq2, 'online')]
-    df['completed_driver'] = [safe_get(df1, 'completed_drivers')]
-    df['total_approved'] = [safe_get(df4, 'total_approved')]
-    df['driver_online_daily'] = [safe_get(bq2, 'online_daily')]
-    df['pinged_drivers_daily'] = [safe_get(bq3, 'pinged_drivers_daily')]
-    df['completed_driver_daily'] = [safe_get(df5, 'completed_driver_daily')]
-    df['online_mau'] = [df['driver_online_daily'].iloc[0] / df['driver_mau'].iloc[0] if df['driver_mau'].iloc[0] != 0 else 0]
-    df['completed_online'] = [df['completed_driver_daily'].iloc[0] / df['driver_online_daily'].iloc[0] if df['driver_online_daily'].iloc[0] != 0 else 0]
-    df['online_no_complete'] = [df['driver_online_daily'].iloc[0] - df['completed_driver_daily'].iloc[0]]
-    df['ride_per_driver'] = [safe_get(df5, 'ride_per_driver')]
-    df['driver_downloads'] = [None]
-    df['driver_sign_up'] = [safe_get(df4, 'sign_up')]
-    df['driver_sign_up_daily'] = [df['driver_sign_up'].iloc[0] / DAYS_IN_MONTH]
-    df['driver_ft_all_time'] = [safe_get(df6, 'all_time')]
-    df['driver_ft_same_month'] = [safe_get(df6, 'same_month')]
-    df['driver_sign_up_activation_rate'] = [df['driver_ft_same_month'].iloc[0] / df['driver_sign_up'].iloc[0] if df['driver_sign_up'].iloc[0] != 0 else 0]
-    df['driver_approved_activation_rate'] = [df['driver_ft_same_month'].iloc[0] / safe_get(df4, 'same_month_approved', 1) if safe_get(df4, 'same_month_approved', 1) != 0 else 0]
-    df['driver_approved'] = [safe_get(df4, 'approved')]
-    df['driver_same_month_approved'] = [safe_get(df4, 'same_month_approved')]
-    df['driver_average_online_hours'] = [safe_get(bq4, 'avg_online_hour')]
-    df['driver_average_utilisation_hours'] = [safe_get(df7, 'avg_utilisation_hours')]
-    df['ping_per_driver_daily'] = [safe_get(bq3, 'ping_per_driver_daily')]
-    df['driver_waiting_before_cancel'] = [safe_get(df8, 'avg_waiting_time_cxl')]
-    df['driver_cancellation_rate'] = [safe_get(df1, 'driver_cancel', 0) / safe_get(df1, 'matched', 1) * 100 if safe_get(df1, 'matched', 1) != 0 else 0]
-    df['drivers_ft_unique'] = [df['driver_ft_all_time'].iloc[0] / df['completed_driver'].iloc[0] if df['completed_driver'].iloc[0] != 0 else 0]
-    df['drivers_repeated'] = [safe_get(df9, 'repeated')]
-    df['resurrect_2_month_driver'] = [safe_get(df15, 'resurrect_2_month')]
-    df['resurrect_3_4_month_driver'] = [safe_get(df15, 'resurrect_3_4_month')]
-    df['resurrect_5_12_month_driver'] = [safe_get(df15, 'resurrect_5_12_month')]
-    df['driver_resurrected'] = [safe_get(df9, 'resurrected')]
-    df['driver_resurrected_rate'] = [None]
-    df['driver_churned'] = [safe_get(df9, 'churned')]
-    df['driver_churned_rate'] = [None]
-    df['driver_inflow'] = [safe_get(df9, 'activated', 0) + safe_get(df9, 'resurrected', 0) - safe_get(df9, 'churned', 0)]
-
-    df = df.copy()
-
-    df['rider_mau'] = [safe_get(bq1, 'active_users')]
-    df['rider_mau_demand'] = [df['demand'].iloc[0] / df['rider_mau'].iloc[0] if df['rider_mau'].iloc[0] != 0 else 0]
-    df['rider_mau_rides'] = [df['rides'].iloc[0] / df['rider_mau'].iloc[0] if df['rider_mau'].iloc[0] != 0 else 0]
-    df['r_d_ratio'] = [df['rider_mau'].iloc[0] / df['driver_mau'].iloc[0] if df['driver_mau'].iloc[0] != 0 else 0]
-    df['rider_downloads'] = [None]
-    df['rider_signup'] = [safe_get(df10, 'rider_signup')] if city == "ALL" else [0]
-    df['rider_signup_daily'] = [df['rider_signup'].iloc[0] / DAYS_IN_MONTH] if city == "ALL" else [0]
-    df['rider_ft_all_time'] = [safe_get(df11, 'all_time')]
-    df['rider_ft_same_month'] = [safe_get(df11, 'same_month')]
-    df['rider_same_month_activation'] = [df['rider_ft_same_month'].iloc[0] / df['rider_signup'].iloc[0] if city == "ALL" and df['rider_signup'].iloc[0] != 0 else 0]
-    df['rider_unique_open_monthly'] = [safe_get(bq1, 'active_users')]
-    df['rider_unique_search_monthly'] = [safe_get(df18, 'unique_search_users')]
-    df['rider_unique_book_monthly'] = [safe_get(df18, 'unique_order_users')]
-    df['rider_unique_complete_monthly'] = [safe_get(df12, 'completed_monthly_all')]
-    df['rider_unique_open_daily'] = [safe_get(bq1, 'open_daily')]
-    df['rider_unique_search_daily'] = [safe_get(df18, 'rider_unique_search_daily_avg')]
-    df['rider_unique_book_daily'] = [safe_get(df18, 'rider_unique_book_daily_avg')]
-    df['rider_unique_complete_daily'] = [safe_get(df12, 'completed_daily_all')]
-    df['book_search_ratio_daily'] = [safe_get(df18, 'book_search_ratio_daily')]
-    df['booking_per_user'] = [df['demand'].iloc[0] / df['rider_unique_book_monthly'].iloc[0] if df['rider_unique_book_monthly'].iloc[0] != 0 else 0]
-    df['complete_per_user'] = [df['rides'].iloc[0] / df['rider_unique_complete_monthly'].iloc[0] if df['rider_unique_complete_monthly'].iloc[0] != 0 else 0]
-    df['duplicate_ratio'] = [df['demand'].iloc[0] / safe_get(df2, 'unique', 1) if safe_get(df2, 'unique', 1) != 0 else 0]
-    df['rider_waiting_before_cancel'] = [safe_get(df8, 'avg_waiting_time_cxl_rider')]
-    df['rider_cancellation_rate'] = [safe_get(df1, 'rider_cancel', 0) / df['demand'].iloc[0] if df['demand'].iloc[0] != 0 else 0]
-    df['riders_ft_unique'] = [df['rider_ft_all_time'].iloc[0] / df['rider_unique_complete_monthly'].iloc[0] if df['rider_unique_complete_monthly'].iloc[0] != 0 else 0]
-    df['riders_repeated'] = [safe_get(df13, 'repeated')]
-    df['resurrect_2_month_rider'] = [safe_get(df14, 'resurrect_2_month')]
-    df['resurrect_3_4_month_rider'] = [safe_get(df14, 'resurrect_3_4_month')]
-    df['resurrect_5_12_month_rider'] = [safe_get(df14, 'resurrect_5_12_month')]
-    df['rider_resurrected'] = [safe_get(df13, 'resurrected')]
-    df['rider_resurrected_rate'] = [None]
-    df['rider_churned'] = [safe_get(df13, 'churned')]
-    df['rider_churned_rate'] = [None]
-    df['rider_inflow'] = [safe_get(df13, 'activated', 0) + safe_get(df13, 'resurrected', 0) - safe_get(df13, 'churned', 0)]
-
-    df = df.copy()
-
-    # Start of Car Sheet here
-    df['rides_phv'] = [safe_get(df1, 'completed_phv')]
-    df['demand_phv'] = [safe_get(df1, 'demand_phv')]
-    df['match_rate_phv'] = [safe_get(df1, 'matched_phv', 1) / df['demand_phv'].iloc[0] if df['demand_phv'].iloc[0] != 0 else 0]
-    df['completion_rate_phv'] = [df['rides_phv'].iloc[0] / df['demand_phv'].iloc[0] if df['demand_phv'].iloc[0] != 0 else 0]
-    df['daily_rides_phv'] = [df['rides_phv'].iloc[0] / DAYS_IN_MONTH]
-    df['uncompleted_phv'] = [df['demand_phv'].iloc[0] - df['rides_phv'].iloc[0]]
-    df['cater_rate_phv'] = [df['rides_phv'].iloc[0] / safe_get(df2, 'unique_phv', 1) if safe_get(df2, 'unique_phv', 1) != 0 else 0]
-    df['booked_riders_phv'] = [safe_get(df1, 'booked_riders_phv')]
-    df['completed_riders_phv'] = [safe_get(df1, 'completed_riders_phv')]
-    df['daily_median_eta_phv'] = [safe_get(df3, 'median_eta_phv')]
-
-    df['driver_mau_phv'] = [safe_get(bq2, 'online_phv')]
-    df['completed_driver_phv'] = [safe_get(df1, 'completed_drivers_phv')]
-    df['total_approved_phv'] = [safe_get(df4, 'total_approved_phv')]
-    df['driver_online_daily_phv'] = [safe_get(bq2, 'online_daily_phv')]
-    df['pinged_drivers_daily_phv'] = [safe_get(bq3, 'pinged_drivers_daily_phv')]
-    df['completed_driver_daily_phv'] = [safe_get(df5, 'completed_driver_daily_phv')]
-    df['online_mau_phv'] = [df['driver_online_daily_phv'].iloc[0] / df['driver_mau_phv'].iloc[0] if df['driver_mau_phv'].iloc[0] != 0 else 0]
-    df['completed_online_phv'] = [df['completed_driver_daily_phv'].iloc[0] / df['driver_online_daily_phv'].iloc[0] if df['driver_online_daily_phv'].iloc[0] != 0 else 0]
-    df['online_no_complete_phv'] = [df['driver_online_daily_phv'].iloc[0] - df['completed_driver_daily_phv'].iloc[0]]
-    df['ride_per_driver_phv'] = [safe_get(df5, 'ride_per_driver_phv')]
-    df['driver_sign_up_phv'] = [safe_get(df4, 'sign_up_phv')]
-    df['driver_sign_up_daily_phv'] = [df['driver_sign_up_phv'].iloc[0] / DAYS_IN_MONTH]
-    df['driver_ft_all_time_phv'] = [safe_get(df6, 'all_time_phv')]
-    df['driver_ft_same_month_phv'] = [safe_get(df6, 'same_month_phv')]
-    df['driver_sign_up_activation_rate_phv'] = [df['driver_ft_same_month_phv'].iloc[0] / df['driver_sign_up_phv'].iloc[0] if df['driver_sign_up_phv'].iloc[0] != 0 else 0]
-    df['driver_approved_activation_rate_phv'] = [df['driver_ft_same_month_phv'].iloc[0] / safe_get(df4, 'same_month_approved_phv', 1) if safe_get(df4, 'same_month_approved_phv', 1) != 0 else 0]
-    df['driver_approved_phv'] = [safe_get(df4, 'approved_phv')]
-    df['driver_same_month_approved_phv'] = [safe_get(df4, 'same_month_approved_phv')]
-    df['driver_average_online_hours_phv'] = [safe_get(bq4, 'avg_online_hour_phv')]
-    df['driver_average_utilisation_hours_phv'] = [safe_get(df7, 'avg_utilisation_hours_phv')]
-    df['ping_per_driver_daily_phv'] = [safe_get(bq3, 'ping_per_driver_daily_phv')]
-    df['driver_waiting_before_cancel_phv'] = [safe_get(df8, 'avg_waiting_time_cxl_phv')]
-    df['driver_cancellation_rate_phv'] = [safe_get(df1, 'driver_cancel_phv', 0) / safe_get(df1, 'matched_phv', 1) * 100 if safe_get(df1, 'matched_phv', 1) != 0 else 0]
-    df['drivers_ft_unique_phv'] = [df['driver_ft_all_time_phv'].iloc[0] / df['completed_driver_phv'].iloc[0] if df['completed_driver_phv'].iloc[0] != 0 else 0]
-    df['drivers_repeated_phv'] = [safe_get(df9, 'repeated_phv')]
-    df['resurrect_2_month_driver_phv'] = [safe_get(df15, 'resurrect_2_month_phv')]
-    df['resurrect_3_4_month_driver_phv'] = [safe_get(df15, 'resurrect_3_4_month_phv')]
-    df['resurrect_5_12_month_driver_phv'] = [safe_get(df15, 'resurrect_5_12_month_phv')]
-    df['driver_resurrected_phv'] = [safe_get(df9, 'resurrected_phv')]
-    df['driver_resurrected_rate_phv'] = [None]
-    df['driver_churned_phv'] = [safe_get(df9, 'churned_phv')]
-    df['driver_churned_rate_phv'] = [None]
-    df['driver_inflow_phv'] = [safe_get(df9, 'activated_phv', 0) + safe_get(df9, 'resurrected_phv', 0) - safe_get(df9, 'churned_phv', 0)]
-
-    df = df.copy()
-
-    df['rider_ft_all_time_phv'] = [safe_get(df11, 'all_time_phv')]
-    df['rider_unique_book_monthly_phv'] = [safe_get(df12, 'book_monthly_phv')]
-    df['rider_unique_complete_monthly_phv'] = [safe_get(df12, 'completed_monthly_phv')]
-    df['rider_unique_book_daily_phv'] = [safe_get(df12, 'book_daily_phv')]
-    df['rider_unique_complete_daily_phv'] = [safe_get(df12, 'completed_daily_phv')]
-    df['booking_per_user_phv'] = [df['demand_phv'].iloc[0] / df['rider_unique_book_monthly_phv'].iloc[0] if df['rider_unique_book_monthly_phv'].iloc[0] != 0 else 0]
-    df['complete_per_user_phv'] = [df['rides_phv'].iloc[0] / df['rider_unique_complete_monthly_phv'].iloc[0] if df['rider_unique_complete_monthly_phv'].iloc[0] != 0 else 0]
-    df['duplicate_ratio_phv'] = [df['demand_phv'].iloc[0] / safe_get(df2, 'unique_phv', 1) if safe_get(df2, 'unique_phv', 1) != 0 else 0]
-    df['rider_waiting_before_cancel_phv'] = [safe_get(df8, 'avg_waiting_time_cxl_phv')]
-    df['rider_cancellation_rate_phv'] = [safe_get(df1, 'rider_cancel_phv', 0) / df['demand_phv'].iloc[0] if df['demand_phv'].iloc[0] != 0 else 0]
-    df['riders_ft_unique_phv'] = [df['rider_ft_all_time_phv'].iloc[0] / df['rider_unique_complete_monthly_phv'].iloc[0] if df['rider_unique_complete_monthly_phv'].iloc[0] != 0 else 0]
-    df['riders_repeated_phv'] = [safe_get(df13, 'repeated_phv')]
-    df['resurrect_2_month_rider_phv'] = [safe_get(df14, 'resurrect_2_month_phv')]
-    df['resurrect_3_4_month_rider_phv'] = [safe_get(df14, 'resurrect_3_4_month_phv')]
-    df['resurrect_5_12_month_rider_phv'] = [safe_get(df14, 'resurrect_5_12_month_phv')]
-    df['rider_resurrected_phv'] = [safe_get(df13, 'resurrected_phv')]
-    df['rider_resurrected_rate_phv'] = [None]
-    df['rider_churned_phv'] = [safe_get(df13, 'churned_phv')]
-    df['rider_churned_rate_phv'] = [None]
-    df['rider_inflow_phv'] = [safe_get(df13, 'activated_phv', 0) + safe_get(df13, 'resurrected_phv', 0) - safe_get(df13, 'churned_phv', 0)]
-
-    df = df.copy()
-
-    # Start of bike sheet here
-    df['rides_bike'] = [safe_get(df1, 'completed_bike')]
-    df['demand_bike'] = [safe_get(df1, 'demand_bike')]
-    df['match_rate_bike'] = [safe_get(df1, 'matched_bike', 1) / df['demand_bike'].iloc[0] if df['demand_bike'].iloc[0] != 0 else 0]
-    df['completion_rate_bike'] = [df['rides_bike'].iloc[0] / df['demand_bike'].iloc[0] if df['demand_bike'].iloc[0] != 0 else 0]
-    df['daily_rides_bike'] = [df['rides_bike'].iloc[0] / DAYS_IN_MONTH]
-    df['uncompleted_bike'] = [df['demand_bike'].iloc[0] - df['rides_bike'].iloc[0]]
-    df['cater_rate_bike'] = [df['rides_bike'].iloc[0] / safe_get(df2, 'unique_bike', 1) if safe_get(df2, 'unique_bike', 1) != 0 else 0]
-    df['booked_riders_bike'] = [safe_get(df1, 'booked_riders_bike')]
-    df['completed_riders_bike'] = [safe_get(df1, 'completed_riders_bike')]
-    df['daily_median_eta_bike'] = [safe_get(df3, 'median_eta_bike')]
-
-    df['driver_mau_bike'] = [safe_get(bq2, 'online_bike')]
-    df['completed_driver_bike'] = [safe_get(df1, 'completed_drivers_bike')]
-    df['total_approved_bike'] = [safe_get(df4, 'total_approved_bike')]
-    df['driver_online_daily_bike'] = [safe_get(bq2, 'online_daily_bike')]
-    df['pinged_drivers_daily_bike'] = [safe_get(bq3, 'pinged_drivers_daily_bike')]
-    df['completed_driver_daily_bike'] = [safe_get(df5, 'completed_driver_daily_bike')]
-    df['online_mau_bike'] = [df['driver_online_daily_bike'].iloc[0] / df['driver_mau_bike'].iloc[0] if df['driver_mau_bike'].iloc[0] != 0 else 0]
-    df['completed_online_bike'] = [df['completed_driver_daily_bike'].iloc[0] / df['driver_online_daily_bike'].iloc[0] if df['driver_online_daily_bike'].iloc[0] != 0 else 0]
-    df['online_no_complete_bike'] = [df['driver_online_daily_bike'].iloc[0] - df['completed_driver_daily_bike'].iloc[0]]
-    df['ride_per_driver_bike'] = [safe_get(df5, 'ride_per_driver_bike')]
-    df['driver_sign_up_bike'] = [safe_get(df4, 'sign_up_bike')]
-    df['driver_sign_up_daily_bike'] = [df['driver_sign_up_bike'].iloc[0] / DAYS_IN_MONTH]
-    df['driver_ft_all_time_bike'] = [safe_get(df6, 'all_time_bike')]
-    df['driver_ft_same_month_bike'] = [safe_get(df6, 'same_month_bike')]
-    df['driver_sign_up_activation_rate_bike'] = [df['driver_ft_same_month_bike'].iloc[0] / df['driver_sign_up_bike'].iloc[0] if df['driver_sign_up_bike'].iloc[0] != 0 else 0]
-    df['driver_approved_activation_rate_bike'] = [df['driver_ft_same_month_bike'].iloc[0] / safe_get(df4, 'same_month_approved_bike', 1) if safe_get(df4, 'same_month_approved_bike', 1) != 0 else 0]
-    df['driver_approved_bike'] = [safe_get(df4, 'approved_bike')]
-    df['driver_same_month_approved_bike'] = [safe_get(df4, 'same_month_approved_bike')]
-    df['driver_average_online_hours_bike'] = [safe_get(bq4, 'avg_online_hour_bike')]
-    df['driver_average_utilisation_hours_bike'] = [safe_get(df7, 'avg_utilisation_hours_bike')]
-    df['ping_per_driver_daily_bike'] = [safe_get(bq3, 'ping_per_driver_daily_bike')]
-    df['driver_waiting_before_cancel_bike'] = [safe_get(df8, 'avg_waiting_time_cxl_bike')]
-    df['driver_cancellation_rate_bike'] = [safe_get(df1, 'driver_cancel_bike', 0) / safe_get(df1, 'matched_bike', 1) * 100 if safe_get(df1, 'matched_bike', 1) != 0 else 0]
-    df['drivers_ft_unique_bike'] = [df['driver_ft_all_time_bike'].iloc[0] / df['completed_driver_bike'].iloc[0] if df['completed_driver_bike'].iloc[0] != 0 else 0]
-    df['drivers_repeated_bike'] = [safe_get(df9, 'repeated_bike')]
-    df['resurrect_2_month_driver_bike'] = [safe_get(df15, 'resurrect_2_month_bike')]
-    df['resurrect_3_4_month_driver_bike'] = [safe_get(df15, 'resurrect_3_4_month_bike')]
-    df['resurrect_5_12_month_driver_bike'] = [safe_get(df15, 'resurrect_5_12_month_bike')]
-    df['driver_resurrected_bike'] = [safe_get(df9, 'resurrected_bike')]
-    df['driver_resurrected_rate_bike'] = [None]
-    df['driver_churned_bike'] = [safe_get(df9, 'churned_bike')]
-    df['driver_churned_rate_bike'] = [None]
-    df['driver_inflow_bike'] = [safe_get(df9, 'activated_bike', 0) + safe_get(df9, 'resurrected_bike', 0) - safe_get(df9, 'churned_bike', 0)]
-
-    df = df.copy()
-
-    df['rider_ft_all_time_bike'] = [safe_get(df11, 'all_time_bike')]
-    df['rider_unique_book_monthly_bike'] = [safe_get(df12, 'book_monthly_bike')]
-    df['rider_unique_complete_monthly_bike'] = [safe_get(df12, 'completed_monthly_bike')]
-    df['rider_unique_book_daily_bike'] = [safe_get(df12, 'book_daily_bike')]
-    df['rider_unique_complete_daily_bike'] = [safe_get(df12, 'completed_daily_bike')]
-    df['booking_per_user_bike'] = [df['demand_bike'].iloc[0] / df['rider_unique_book_monthly_bike'].iloc[0] if df['rider_unique_book_monthly_bike'].iloc[0] != 0 else 0]
-    df['complete_per_user_bike'] = [df['rides_bike'].iloc[0] / df['rider_unique_complete_monthly_bike'].iloc[0] if df['rider_unique_complete_monthly_bike'].iloc[0] != 0 else 0]
-    df['duplicate_ratio_bike'] = [df['demand_bike'].iloc[0] / safe_get(df2, 'unique_bike', 1) if safe_get(df2, 'unique_bike', 1) != 0 else 0]
-    df['rider_waiting_before_cancel_bike'] = [safe_get(df8, 'avg_waiting_time_cxl_bike')]
-    df['rider_cancellation_rate_bike'] = [safe_get(df1, 'rider_cancel_bike', 0) / df['demand_bike'].iloc[0] if df['demand_bike'].iloc[0] != 0 else 0]
-    df['riders_ft_unique_bike'] = [df['rider_ft_all_time_bike'].iloc[0] / df['rider_unique_complete_monthly_bike'].iloc[0] if df['rider_unique_complete_monthly_bike'].iloc[0] != 0 else 0]
-    df['riders_repeated_bike'] = [safe_get(df13, 'repeated_bike')]
-    df['resurrect_2_month_rider_bike'] = [safe_get(df14, 'resurrect_2_month_bike')]
-    df['resurrect_3_4_month_rider_bike'] = [safe_get(df14, 'resurrect_3_4_month_bike')]
-    df['resurrect_5_12_month_rider_bike'] = [safe_get(df14, 'resurrect_5_12_month_bike')]
-    df['rider_resurrected_bike'] = [safe_get(df13, 'resurrected_bike')]
-    df['rider_resurrected_rate_bike'] = [None]
-    df['rider_churned_bike'] = [safe_get(df13, 'churned_bike')]
-    df['rider_churned_rate_bike'] = [None]
-    df['rider_inflow_bike'] = [safe_get(df13, 'activated_bike', 0) + safe_get(df13, 'resurrected_bike', 0) - safe_get(df13, 'churned_bike', 0)]
-
-    df = df.copy()
-
-    # These metrics are only meaningful at the VN (ALL) level, so drop them from
-    # the per-city (HCM/HAN) sheets rather than showing placeholder 0/None rows.
+    metrics = rides('') + [
+        ('first_try_cater_rate', Col(4750, 'first_try_cater_rate')),
+        ('retry_initiation_rate', Col(4750, 'retry_initiation_rate')),
+        ('retry_success_rate', Col(4750, 'retry_success_rate')),
+        ('daily_median_eta', Col(4566, 'median_eta')),
+        ('median_time_to_match_sec', Col(6077, 'median_time_to_match_sec')),
+        ('median_time_to_expire_sec', Col(6077, 'median_time_to_expire_sec')),
+    ] + drivers('') + [
+        ('rider_mau', Col(4565, 'active_users')),
+        ('rider_mau_demand', lambda m: ratio(m['demand'], m['rider_mau'])),
+        ('rider_mau_rides', lambda m: ratio(m['rides'], m['rider_mau'])),
+        ('r_d_ratio', lambda m: ratio(m['rider_mau'], m['driver_mau'])),
+        ('rider_downloads', None),
+        ('rider_signup', Col(4579, 'rider_signup')),
+        ('rider_signup_daily', lambda m: m['rider_signup'] / days),
+        ('rider_ft_all_time', Col(4580, 'all_time')),
+        ('rider_ft_same_month', Col(4580, 'same_month')),
+        ('rider_same_month_activation', lambda m: ratio(m['rider_ft_same_month'], m['rider_signup'])),
+        ('rider_unique_open_monthly', lambda m: m['rider_mau']),
+        ('rider_unique_search_monthly', Col(6078, 'unique_search_users')),
+        ('rider_unique_book_monthly', Col(6078, 'unique_order_users')),
+        ('rider_unique_complete_monthly', Col(4581, 'completed_monthly_all')),
+        ('rider_unique_open_daily', Col(4565, 'open_daily')),
+        ('rider_unique_search_daily', Col(6078, 'rider_unique_search_daily_avg')),
+        ('rider_unique_book_daily', Col(6078, 'rider_unique_book_daily_avg')),
+        ('rider_unique_complete_daily', Col(4581, 'completed_daily_all')),
+        ('book_search_ratio_daily', Col(6078, 'book_search_ratio_daily')),
+        ('booking_per_user', lambda m: ratio(m['demand'], m['rider_unique_book_monthly'])),
+        ('complete_per_user', lambda m: ratio(m['rides'], m['rider_unique_complete_monthly'])),
+        ('duplicate_ratio', lambda m: ratio(m['demand'], m['unique'])),
+        ('rider_waiting_before_cancel', Col(4577, 'avg_waiting_time_cxl_rider')),
+        ('rider_cancellation_rate', lambda m: ratio(m['rider_cancel'], m['demand'])),
+        ('riders_ft_unique', lambda m: ratio(m['rider_ft_all_time'], m['rider_unique_complete_monthly'])),
+        ('riders_repeated', Col(4582, 'repeated')),
+        ('resurrect_2_month_rider', Col(4594, 'resurrect_2_month')),
+        ('resurrect_3_4_month_rider', Col(4594, 'resurrect_3_4_month')),
+        ('resurrect_5_12_month_rider', Col(4594, 'resurrect_5_12_month')),
+        ('rider_resurrected', Col(4582, 'resurrected')),
+        ('rider_resurrected_rate', None),
+        ('rider_churned', Col(4582, 'churned')),
+        ('rider_churned_rate', None),
+        ('rider_inflow', lambda m: m['rider_activated'] + m['rider_resurrected'] - m['rider_churned']),
+    ]
+
+    # Car and bike sheets
+    for s in ('_phv', '_bike'):
+        metrics += rides(s) + [
+            (f'daily_median_eta{s}', Col(4566, f'median_eta{s}')),
+        ] + drivers(s) + [
+            (f'rider_ft_all_time{s}', Col(4580, f'all_time{s}')),
+            (f'rider_unique_book_monthly{s}', Col(4581, f'book_monthly{s}')),
+            (f'rider_unique_complete_monthly{s}', Col(4581, f'completed_monthly{s}')),
+            (f'rider_unique_book_daily{s}', Col(4581, f'book_daily{s}')),
+            (f'rider_unique_complete_daily{s}', Col(4581, f'completed_daily{s}')),
+            (f'booking_per_user{s}', lambda m, s=s: ratio(m[f'demand{s}'], m[f'rider_unique_book_monthly{s}'])),
+            (f'complete_per_user{s}', lambda m, s=s: ratio(m[f'rides{s}'], m[f'rider_unique_complete_monthly{s}'])),
+            (f'duplicate_ratio{s}', lambda m, s=s: ratio(m[f'demand{s}'], m[f'unique{s}'])),
+            (f'rider_waiting_before_cancel{s}', Col(4577, f'avg_waiting_time_cxl{s}')),
+            (f'rider_cancellation_rate{s}', lambda m, s=s: ratio(m[f'rider_cancel{s}'], m[f'demand{s}'])),
+            (f'riders_ft_unique{s}', lambda m, s=s: ratio(m[f'rider_ft_all_time{s}'], m[f'rider_unique_complete_monthly{s}'])),
+            (f'riders_repeated{s}', Col(4582, f'repeated{s}')),
+            (f'resurrect_2_month_rider{s}', Col(4594, f'resurrect_2_month{s}')),
+            (f'resurrect_3_4_month_rider{s}', Col(4594, f'resurrect_3_4_month{s}')),
+            (f'resurrect_5_12_month_rider{s}', Col(4594, f'resurrect_5_12_month{s}')),
+            (f'rider_resurrected{s}', Col(4582, f'resurrected{s}')),
+            (f'rider_resurrected_rate{s}', None),
+            (f'rider_churned{s}', Col(4582, f'churned{s}')),
+            (f'rider_churned_rate{s}', None),
+            (f'rider_inflow{s}', lambda m, s=s: m[f'rider_activated{s}'] + m[f'rider_resurrected{s}'] - m[f'rider_churned{s}']),
+        ]
+
+    return Spec(metrics, inputs=INPUTS)
+
+
+# These metrics are only meaningful at the VN (ALL) level, so they are dropped
+# from the per-city (HCM/HAN) sheets rather than shown as placeholder 0/None rows.
+ALL_ONLY = ['driver_downloads', 'rider_downloads', 'rider_signup', 'rider_signup_daily', 'rider_same_month_activation']
+
+
+def city_sheet(monthly, output_date, city):
+    """One city's sheet from the evaluated monthly frame"""
+    df = monthly[[city]]
     if city != "ALL":
-        df = df.drop(columns=[
-            'driver_downloads',
-            'rider_downloads',
-            'rider_signup',
-            'rider_signup_daily',
-            'rider_same_month_activation',
-        ], errors='ignore')
-
-    df = df.T
+        df = df.drop(index=ALL_ONLY)
     df.columns = [f"{output_date}"]
-
     return df
 
 
 def main():
     load_dotenv()
 
-    redash = Redash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
+    redash = AsyncRedash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
 
     start_date, end_date, DAYS_IN_MONTH, output_date = previous_month()
     output_file = f"VN_{output_date}.xlsx"
 
+    # Every city's variant of the queries goes out as one batch
+    cities = ["ALL", "HCM", "HAN"]
+    redash.run_queries([
+        query for city in cities
+        for query in city_queries(start_date, end_date, city).values()
+    ])
+
+    spec = monthly_spec(DAYS_IN_MONTH)
+
     # Create an Excel writer
     with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
         # Process data for each city and save to separate sheets
-        cities = ["ALL", "HCM", "HAN"]
-        
         for city in cities:
             print(f"Processing data for {city}...")
             
             try:
-                # Process data for this city
-                df = process_city_data(redash, start_date, end_date, DAYS_IN_MONTH, output_date, city)
+                # Process data for this city; a bad value only fails its own sheet
+                results = {qid: redash.get_result(query) for qid, query in city_queries(start_date, end_date, city).items()
+                           if qid in spec.sources}
+                monthly = spec.evaluate({city: results}, missing=0)
+                df = city_sheet(monthly, output_date, city)
                 
                 # Save to Excel sheet with city name
                 sheet_name = f"VN_{city}"
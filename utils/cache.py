@@ -0,0 +1,100 @@
+"""On-disk cache of Redash query results.
+
+Re-running a report for the same period (after a Slack failure, a layout fix,
+or during a backfill) otherwise re-executes every warehouse query. With a
+cache attached, the Redash client serves any query instance it has already
+downloaded straight from disk and skips the job queue for it.
+
+Entries are content-addressed by query id + canonicalised params (Query.key)
+together with the result format and declared dtypes the frame was read with
+(Redash.cache_key), so a frame is only served to a call that would have read
+it the same way. They are stored as Parquet, expire after `ttl` seconds and
+are evicted least-recently used first once the directory grows past
+`max_bytes`.
+
+Opt in with `Redash(..., cache=ResultCache("path"))`, or by setting the
+REDASH_CACHE_DIR environment variable.
+"""
+import hashlib
+import os
+import time
+
+import pandas as pd
+
+SUFFIX = ".parquet"
+
+
+class ResultCache:
+  def __init__(self, path, ttl=24 * 3600, max_bytes=512 * 1024 * 1024):
+    self.path = path
+    self.ttl = ttl
+    self.max_bytes = max_bytes
+    os.makedirs(path, exist_ok=True)
+
+  def file(self, key):
+    """Path of the entry for a Query.key tuple ((id, params_json))."""
+    query_id, params = key
+    digest = hashlib.sha256(params.encode()).hexdigest()[:24]
+    return os.path.join(self.path, f"{query_id}-{digest}{SUFFIX}")
+
+  def get(self, key):
+    """Return the cached DataFrame for `key`, or None if missing/expired."""
+    path = self.file(key)
+    try:
+      st = os.stat(path)
+    except FileNotFoundError:
+      return None
+    if time.time() - st.st_mtime > self.ttl:
+      self.__remove(path)
+      return None
+    try:
+      df = pd.read_parquet(path)
+    except Exception:
+      # Half-written or unreadable entry; treat as a miss.
+      self.__remove(path)
+      return None
+    # atime marks the last hit for LRU eviction; mtime keeps the write time for the TTL.
+    os.utime(path, (time.time(), st.st_mtime))
+    return df
+
+  def put(self, key, df):
+    path = self.file(key)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+      df.to_parquet(tmp, index=False)
+      os.replace(tmp, path)
+    except Exception:
+      # Results that Parquet can't represent just aren't cached.
+      self.__remove(tmp)
+      return
+    self.evict()
+
+  def evict(self):
+    """Drop expired entries, then the least recently used until under max_bytes."""
+    now = time.time()
+    entries = []
+    for name in os.listdir(self.path):
+      if not name.endswith(SUFFIX):
+        continue
+      path = os.path.join(self.path, name)
+      try:
+        st = os.stat(path)
+      except FileNotFoundError:
+        continue
+      if now - st.st_mtime > self.ttl:
+        self.__remove(path)
+      else:
+        entries.append((st.st_atime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+      if total <= self.max_bytes:
+        break
+      self.__remove(path)
+      total -= size
+
+  def __remove(self, path):
+    try:
+      os.remove(path)
+    except OSError:
+      pass
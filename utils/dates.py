@@ -48,3 +48,30 @@ def previous_week_start(utc_offset_hours, now=None):
   start_date = (local_now - timedelta(days=local_now.weekday() + 7)).strftime(DATE_FORMAT)
   output_date = datetime.strptime(start_date, DATE_FORMAT).strftime("%d_%b_%Y")
   return start_date, output_date
+
+
+def week_before(start_date):
+  """Monday ("%Y-%m-%d") of the week before the week starting `start_date`."""
+  return (datetime.strptime(start_date, DATE_FORMAT) - timedelta(days=7)).strftime(DATE_FORMAT)
+
+
+def week_starts(first, last):
+  """Mondays ("%Y-%m-%d") of every week from the one holding `first` to the one holding `last`."""
+  day = datetime.strptime(first, DATE_FORMAT)
+  day -= timedelta(days=day.weekday())
+  end = datetime.strptime(last, DATE_FORMAT)
+  weeks = []
+  while day <= end:
+    weeks.append(day.strftime(DATE_FORMAT))
+    day += timedelta(days=7)
+  return weeks
+
+
+def month_starts(first, last):
+  """Months ("%Y-%m") from `first` to `last` inclusive; both "%Y-%m" or "%Y-%m-%d"."""
+  year, month = int(first[:4]), int(first[5:7])
+  months = []
+  while f"{year:04d}-{month:02d}" <= last[:7]:
+    months.append(f"{year:04d}-{month:02d}")
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+  return months
@@ -0,0 +1,295 @@
+"""Local stand-in for the Redash API, for offline benchmarking and testing.
+
+Serves the endpoints utils/helpers.Redash calls, so a client (or a whole report
+script) can run against it with no credentials or network:
+
+  GET  /api/queries/{id}                          query metadata (data_source_id)
+  POST /api/queries/{id}/results                  submit; answers with a job, or
+                                                  with a result within max_age
+  GET  /api/jobs/{id}                             job status, 1-2 running, 3 done, 4 failed
+  GET  /api/queries/{id}/results/{rid}.csv|json   download a result
+  GET  /api/queries/{id}/results.csv|json         download the latest result
+
+Jobs finish after their query's runtime. Results are read from `fixtures`
+({query_id}.csv) when there is one, otherwise a small generated frame that
+echoes the query id and parameters. Failures are injected per query id:
+`failing` jobs end in status 4, `http_errors` answer the submit with that
+HTTP status, and `throttle` answers that fraction of all requests with 429
+and a Retry-After, as a busy Redash does.
+
+  with FakeRedash(runtimes={6152: 2.0}, failing={4607}, fixtures="fixtures") as server:
+    redash = AsyncRedash("key", server.url)
+    redash.run_queries([Query(6152), Query(4607)])
+    print(server.stats)
+
+or standalone, for the report scripts (point REDASH_BASE_URL at it):
+
+  python -m utils.fake_redash --port 5000 --runtime 6152=2 --fail 4607 --throttle 0.05
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+ROUTES = [
+  ("GET", re.compile(r"^/api/queries/(\d+)$"), "query"),
+  ("POST", re.compile(r"^/api/queries/(\d+)/results$"), "submit"),
+  ("GET", re.compile(r"^/api/jobs/(\w+)$"), "job"),
+  ("GET", re.compile(r"^/api/queries/(\d+)/results(?:/(\d+))?\.(csv|json)$"), "result"),
+]
+
+
+class FakeRedash:
+  def __init__(self, host="127.0.0.1", port=0, fixtures=None, runtimes=None, default_runtime=0.3,
+               failing=(), http_errors=None, throttle=0.0, retry_after=1, data_sources=None, rows=3,
+               columns=(), seed=0):
+    self.fixtures = fixtures
+    self.rows = rows                          # rows in a generated (non-fixture) result
+    self.columns = list(columns)              # extra numeric columns in generated results
+    self.runtimes = dict(runtimes or {})      # query id -> seconds until the job finishes
+    self.default_runtime = default_runtime
+    self.failing = set(failing)               # query ids whose jobs end in status 4
+    self.http_errors = dict(http_errors or {})  # query id -> HTTP status for the submit
+    self.throttle = throttle                  # fraction of requests answered with 429
+    self.retry_after = retry_after
+    self.data_sources = dict(data_sources or {})  # query id -> data_source_id
+    self.random = random.Random(seed)
+    self.lock = threading.Lock()
+    self.ids = itertools.count(1)
+    self.jobs = {}     # job id -> {query_id, key, submitted, result_id}
+    self.results = {}  # result id -> (query id, parameters, retrieved_at)
+    self.latest = {}   # (query id, parameters json) -> result id
+    self.stats = Counter()
+    self.httpd = ThreadingHTTPServer((host, port), handler(self))
+    self.httpd.daemon_threads = True
+    self.thread = None
+
+  @property
+  def url(self):
+    host, port = self.httpd.server_address[:2]
+    return f"http://{host}:{port}"
+
+  def start(self):
+    self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+    self.thread.start()
+    return self
+
+  def stop(self):
+    self.httpd.shutdown()
+    self.httpd.server_close()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *exc):
+    self.stop()
+
+  def count(self, name, n=1):
+    with self.lock:
+      self.stats[name] += n
+
+  def throttled(self):
+    with self.lock:
+      return self.throttle > 0 and self.random.random() < self.throttle
+
+  def submit(self, query_id, body):
+    params = body.get("parameters") or {}
+    key = (query_id, json.dumps(params, sort_keys=True, default=str))
+    max_age = body.get("max_age") or 0
+    with self.lock:
+      self.stats[f"submit:{query_id}"] += 1
+      cached = self.latest.get(key)
+      if cached and max_age > 0 and time.time() - self.results[cached][2] <= max_age:
+        return {"query_result": {"id": cached, "query_id": query_id}}
+      job_id = str(next(self.ids))
+      self.jobs[job_id] = dict(query_id=query_id, key=key, submitted=time.time(), result_id=None)
+    return {"job": {"id": job_id, "status": 1}}
+
+  def job(self, job_id):
+    with self.lock:
+      job = self.jobs.get(job_id)
+      if job is None:
+        return None
+      query_id = job["query_id"]
+      elapsed = time.time() - job["submitted"]
+      if elapsed < self.runtimes.get(query_id, self.default_runtime):
+        return {"id": job_id, "status": 2 if elapsed > 0.05 else 1, "error": "", "query_result_id": None}
+      if query_id in self.failing:
+        return {"id": job_id, "status": 4, "error": f"Query {query_id} failed (simulated).", "query_result_id": None}
+      if job["result_id"] is None:
+        job["result_id"] = next(self.ids)
+        self.results[job["result_id"]] = (query_id, json.loads(job["key"][1]), time.time())
+        self.latest[job["key"]] = job["result_id"]
+      return {"id": job_id, "status": 3, "error": "", "query_result_id": job["result_id"]}
+
+  def result(self, query_id, result_id=None):
+    """Result frame for a result id (or the query's latest result); None if unknown."""
+    with self.lock:
+      if result_id is None:
+        ids = [rid for (qid, _), rid in self.latest.items() if qid == query_id]
+        result_id = max(ids) if ids else None
+      if result_id not in self.results or self.results[result_id][0] != query_id:
+        return None
+      params = self.results[result_id][1]
+    path = os.path.join(self.fixtures, f"{query_id}.csv") if self.fixtures else None
+    if path and os.path.exists(path):
+      return pd.read_csv(path)
+    return generated(query_id, params, self.rows, self.columns)
+
+
+def generated(query_id, params, rows=3, columns=()):
+  """Default result: `rows` rows tagged with the query id and its parameters,
+  plus a numeric column for each of `columns`."""
+  index = pd.RangeIndex(rows)
+  df = pd.DataFrame({
+    "query_id": query_id,
+    "parameters": json.dumps(params, sort_keys=True),
+    "city": pd.Series(["HCM", "HAN", "BKK"]).take(index % 3).values,
+    "day": (pd.Timestamp("2026-06-01") + pd.to_timedelta(index % 28, unit="D")).strftime("%Y-%m-%d"),
+    "value": index * 0.25 + 1.5,
+    "count": index * 10 + 10,
+  }, index=index)
+  extra = [column for column in dict.fromkeys(columns) if column not in df.columns]
+  if extra:
+    values = [(index + i % 7 + 1) * 10.0 for i in range(len(extra))]
+    df = pd.concat([df, pd.DataFrame(dict(zip(extra, values)), index=index)], axis=1)
+  return df
+
+
+def json_payload(result_id, query_id, df, runtime=None):
+  """A result in Redash's JSON shape, with a column type per column."""
+  columns = [{"name": name, "friendly_name": name, "type": column_type(df[name])} for name in df.columns]
+  rows = json.loads(df.to_json(orient="records", date_format="iso"))
+  return {"query_result": {"id": result_id, "query_id": query_id, "runtime": runtime,
+                           "data": {"columns": columns, "rows": rows}}}
+
+
+def column_type(values):
+  if pd.api.types.is_bool_dtype(values):
+    return "boolean"
+  if pd.api.types.is_integer_dtype(values):
+    return "integer"
+  if pd.api.types.is_float_dtype(values):
+    return "float"
+  if pd.api.types.is_datetime64_any_dtype(values):
+    return "datetime"
+  sample = values.dropna().astype(str)
+  if len(sample) and sample.str.fullmatch(r"\d{4}-\d{2}-\d{2}").all():
+    return "date"
+  return "string"
+
+
+def handler(server):
+  class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+      pass
+
+    def send(self, status, body, content_type="application/json", headers=None):
+      data = (body if isinstance(body, str) else json.dumps(body)).encode()
+      self.send_response(status)
+      self.send_header("Content-Type", content_type)
+      self.send_header("Content-Length", str(len(data)))
+      for name, value in (headers or {}).items():
+        self.send_header(name, value)
+      self.end_headers()
+      self.wfile.write(data)
+      server.count("bytes_sent", len(data))
+
+    def route(self, method):
+      path = urlparse(self.path).path
+      for route_method, pattern, name in ROUTES:
+        match = pattern.match(path)
+        if route_method == method and match:
+          return name, match.groups()
+      return None, ()
+
+    def handle_request(self, method):
+      name, args = self.route(method)
+      server.count("requests")
+      server.count(name or "not_found")
+      if name is None:
+        return self.send(404, {"message": "Not found"})
+      if "api_key" not in parse_qs(urlparse(self.path).query):
+        return self.send(403, {"message": "Couldn't find resource. Please login and try again."})
+      if server.throttled():
+        server.count("throttled")
+        return self.send(429, {"message": "Rate limit exceeded"}, headers={"Retry-After": str(server.retry_after)})
+      getattr(self, name)(*args)
+
+    def do_GET(self):
+      self.handle_request("GET")
+
+    def do_POST(self):
+      self.handle_request("POST")
+
+    def query(self, query_id):
+      query_id = int(query_id)
+      self.send(200, {"id": query_id, "data_source_id": server.data_sources.get(query_id, 1)})
+
+    def submit(self, query_id):
+      query_id = int(query_id)
+      length = int(self.headers.get("Content-Length", 0))
+      body = json.loads(self.rfile.read(length) or b"{}")
+      if query_id in server.http_errors:
+        return self.send(server.http_errors[query_id], {"message": f"Query {query_id} refused (simulated)."})
+      self.send(200, server.submit(query_id, body))
+
+    def job(self, job_id):
+      job = server.job(job_id)
+      if job is None:
+        return self.send(404, {"message": "Job not found"})
+      self.send(200, {"job": job})
+
+    def result(self, query_id, result_id, fmt):
+      query_id = int(query_id)
+      result_id = int(result_id) if result_id else None
+      df = server.result(query_id, result_id)
+      if df is None:
+        return self.send(404, {"message": "No cached result found for this query."})
+      if fmt == "json":
+        runtime = server.runtimes.get(query_id, server.default_runtime)
+        return self.send(200, json_payload(result_id, query_id, df, runtime))
+      out = StringIO()
+      df.to_csv(out, index=False)
+      self.send(200, out.getvalue(), content_type="text/csv; charset=UTF-8")
+
+  return Handler
+
+
+def pairs(values, cast):
+  return {int(query_id): cast(value) for query_id, value in (item.split("=") for item in values)}
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Serve a fake Redash API for offline runs.")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=5000)
+  parser.add_argument("--fixtures", help="directory of {query_id}.csv results")
+  parser.add_argument("--default-runtime", type=float, default=0.3, help="seconds each job runs")
+  parser.add_argument("--runtime", nargs="*", default=[], help="per-query runtimes, QUERY_ID=SECONDS")
+  parser.add_argument("--fail", nargs="*", type=int, default=[], help="query ids whose jobs fail (status 4)")
+  parser.add_argument("--http-error", nargs="*", default=[], help="submit errors, QUERY_ID=STATUS")
+  parser.add_argument("--throttle", type=float, default=0.0, help="fraction of requests answered with 429")
+  parser.add_argument("--rows", type=int, default=3, help="rows in each generated result")
+  args = parser.parse_args()
+
+  server = FakeRedash(args.host, args.port, fixtures=args.fixtures, default_runtime=args.default_runtime,
+                      runtimes=pairs(args.runtime, float), failing=args.fail,
+                      http_errors=pairs(args.http_error, int), throttle=args.throttle,
+                      rows=args.rows)
+  print(f"Fake Redash on {server.url}")
+  try:
+    server.httpd.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  print(dict(server.stats))
@@ -0,0 +1,73 @@
+"""Keyed lookups into region-wide query results.
+
+Several report queries (6152, 6144, 4509, 6148, 6189, 6030, ...) return every
+city x vehicle type x month of a region, and the scripts pick one row out per
+city and vehicle. Filtering with `df[col].astype(str).str.upper() == value`
+rebuilds a full-length mask on every call, a dozen times per vehicle per city.
+
+IndexedResult normalises each key column once (str + upper, the same
+case-insensitive match the filters used) and groups row positions by the
+requested key columns once, so each later pick is a dict lookup.
+
+  q6152 = IndexedResult(redash.get_result(query))
+  q6152.first(city="HCM", vehicle_type="2W")   # 1-row DataFrame, or empty
+  q6152.rows(city="HCM")                       # every matching row
+  q7666.rows(months={"ride_month": "2026-06"}, city="HCM")   # by the month of a date column
+"""
+import threading
+
+import pandas as pd
+
+
+class IndexedResult:
+  def __init__(self, df):
+    self.df = df if isinstance(df, pd.DataFrame) else pd.DataFrame()
+    self.normalised = {}  # (column, kind) -> upper-cased strings, or "%Y-%m" months
+    self.groups = {}      # ((column, kind), ...) -> {key: row positions}
+    self.lock = threading.Lock()
+
+  @property
+  def columns(self):
+    return self.df.columns
+
+  @property
+  def empty(self):
+    return self.df.empty
+
+  def normalise(self, column, kind):
+    values = self.df[column]
+    if kind == "month":
+      return pd.to_datetime(values, errors="coerce").dt.strftime("%Y-%m").values
+    return values.astype(str).str.upper().values
+
+  def positions(self, keys):
+    with self.lock:
+      if keys not in self.groups:
+        for key in keys:
+          if key not in self.normalised:
+            self.normalised[key] = self.normalise(*key)
+        frame = pd.DataFrame({i: self.normalised[key] for i, key in enumerate(keys)})
+        by = 0 if len(keys) == 1 else list(range(len(keys)))
+        self.groups[keys] = frame.groupby(by, sort=False).indices
+      return self.groups[keys]
+
+  def rows(self, months=None, **filters):
+    """Rows where every filter column equals its value (case-insensitive), and
+    every `months` date column falls in its "%Y-%m" month.
+
+    Filters on columns the result does not have are ignored.
+    """
+    wanted = {(column, "str"): str(value).upper() for column, value in filters.items()}
+    wanted.update({(column, "month"): month for column, month in (months or {}).items()})
+    wanted = {key: value for key, value in wanted.items() if key[0] in self.df.columns}
+    if self.df.empty or not wanted:
+      return self.df
+    keys = tuple(sorted(wanted))
+    values = tuple(wanted[key] for key in keys)
+    found = self.positions(keys).get(values[0] if len(values) == 1 else values)
+    return self.df.iloc[found] if found is not None else self.df.iloc[:0]
+
+  def first(self, **filters):
+    """First matching row as a 1-row DataFrame, or an empty DataFrame."""
+    out = self.rows(**filters)
+    return out.head(1) if not out.empty else pd.DataFrame()
@@ -1,93 +1,457 @@
+import asyncio
+import atexit
 import json
 import logging
 import os
+import threading
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
 from typing import Union
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils import replay as replays
+from utils.cache import ResultCache
+from utils.telemetry import Telemetry
+from utils.tracing import traced
 
 
 class Query:
-  def __init__(self, id:int, params:dict=None):
+  def __init__(self, id:int, params:dict=None, max_age:int=None, dtypes:dict=None):
     self.id = id
     self.params = params or {}
+    # Accept a Redash-cached result up to this many seconds old; None uses
+    # the client's max_age.
+    self.max_age = max_age
+    # Optional column -> dtype for the result (e.g. "category" for low
+    # cardinality labels); undeclared columns are inferred as before.
+    self.dtypes = dtypes
+
+  def __repr__(self) -> str:
+    return f'Query({self.id}, {self.params})'
+
+  @property
+  def key(self) -> tuple:
+    # Identifies one query instance: the same id with different params is a
+    # different job, the same id with equal params is the same job.
+    return (self.id, json.dumps(self.params, sort_keys=True, default=str))
+
+def make_session(pool_size:int=10, retries:int=3, backoff:float=0.5) -> requests.Session:
+  """Return a requests.Session with keep-alive connection pooling and retries.
+
+  Reusing one session avoids a fresh TCP+TLS handshake on every call.
+  `pool_size` is the number of connections kept open per host and should be
+  at least the number of requests expected to run at once. GETs that hit a
+  connection error or a 502/504 are retried up to `retries` times with
+  exponential backoff; POSTs are not, since a retried submit could queue a
+  second job. 429 and 503 are left to the Redash client, which backs off on
+  them once for every thread.
+  """
+  retry = Retry(
+    total=retries,
+    backoff_factor=backoff,
+    status_forcelist=(502, 504),
+    allowed_methods=frozenset({'GET'}),
+    raise_on_status=False,
+  )
+  adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+  session = requests.Session()
+  session.mount('https://', adapter)
+  session.mount('http://', adapter)
+  return session
+
+def once(fn):
+  """Wrap `fn` so it runs at most once, however many threads call it.
+
+  Every caller gets the result of that one call, and callers arriving while
+  it runs wait for it. If it raised, every caller gets the same exception:
+  a failed shared fetch is not run again for the next sheet. Used where
+  several sheets fan out from one shared fetch.
+  """
+  lock = threading.Lock()
+  outcome = []  # [(result, exception)] once fn has run
+
+  def call():
+    with lock:
+      if not outcome:
+        try:
+          outcome.append((fn(), None))
+        except Exception as e:
+          outcome.append((None, e))
+      result, error = outcome[0]
+    if error is not None:
+      raise error
+    return result
+  return call
+
+class PollSchedule:
+  """Decides how long to wait before checking a running job again.
+
+  Each job backs off on its own: the first check comes `initial` seconds
+  after submit and every further gap grows by `factor`, capped at
+  `max_interval`. Short jobs are therefore noticed quickly while long ones
+  are checked a handful of times instead of once a second.
+
+  `hints` maps a query id to its typical runtime in seconds. While a job is
+  younger than its hint there is no point checking, so the wait stretches
+  to the expected finish; the fast early checks then start from there.
+  Runtimes seen during the run are folded into the hints, and with
+  `hints_path` they are loaded from / saved to a JSON file between runs.
+  """
+  def __init__(self, initial:float=0.5, factor:float=1.5, max_interval:float=10, hints:dict=None, hints_path:str=None) -> None:
+    self.initial = initial
+    self.factor = factor
+    self.max_interval = max_interval
+    self.hints_path = hints_path
+    # observe/save may be called from several run_queries threads at once
+    self.lock = threading.Lock()
+    self.hints = {}
+    if hints_path and os.path.exists(hints_path):
+      with open(hints_path) as f:
+        self.hints = {int(k): v for k, v in json.load(f).items()}
+    self.hints.update(hints or {})
+
+  def delay(self, query_id:int, elapsed:float, polls:int) -> float:
+    interval = min(self.initial * self.factor ** polls, self.max_interval)
+    expected = self.hints.get(query_id)
+    if expected and elapsed + interval < expected:
+      interval = min(expected - elapsed, self.max_interval)
+    return interval
+
+  def observe(self, query_id:int, runtime:float) -> None:
+    # Moving average, so one slow run doesn't stretch every later wait.
+    with self.lock:
+      previous = self.hints.get(query_id)
+      self.hints[query_id] = runtime if previous is None else (previous + runtime) / 2
+
+  def save(self) -> None:
+    if self.hints_path:
+      with self.lock, open(self.hints_path, 'w') as f:
+        json.dump(self.hints, f, indent=2, sort_keys=True)
+
+class TokenBucket:
+  """Paces every request a client sends to Redash.
+
+  Requests spend a token each; tokens refill at `rate` per second up to
+  `burst`. When Redash answers 429 or 503 the rate is halved (down to
+  `min_rate`) and the bucket is emptied for the Retry-After period, so all
+  threads back off together; every success then wins back a little of the
+  rate, up to `rate`. The client thus settles near the most the shared
+  Redash will take without tripping its queue.
+
+  With no `rate` (the default) requests go out unpaced until Redash first
+  throttles; the bucket then engages at the rate the client was sending at,
+  halved, and recovers towards that rate as above.
+  """
+  def __init__(self, rate:float=None, burst:int=20, min_rate:float=0.5) -> None:
+    self.max_rate = self.rate = rate
+    self.burst = burst
+    self.min_rate = min_rate
+    self.tokens = burst
+    self.updated = time.monotonic()
+    self.lock = threading.Lock()
+    # request times over the last second while unpaced, to engage from
+    self.sent = deque()
+    self.started = None
+
+  def take(self) -> None:
+    # Reserve a token, sleeping until it is due if the bucket is in debt.
+    with self.lock:
+      now = time.monotonic()
+      if self.rate is None:
+        self.started = self.started or now
+        self.sent.append(now)
+        while self.sent[0] < now - 1:
+          self.sent.popleft()
+        return
+      self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+      self.updated = now
+      self.tokens -= 1
+      wait = -self.tokens / self.rate if self.tokens < 0 else 0
+    time.sleep(wait)
+
+  def throttled(self, retry_after:float=None) -> None:
+    with self.lock:
+      if self.rate is None:
+        now = time.monotonic()
+        window = min(1, max(now - (self.started or now), 0.1))
+        self.max_rate = self.rate = max(self.min_rate, len(self.sent) / window)
+        self.tokens, self.updated = 0, now
+        self.sent.clear()
+      self.rate = max(self.min_rate, self.rate / 2)
+      self.tokens = min(self.tokens, 0) - (retry_after or 1) * self.rate
+
+  def ok(self) -> None:
+    with self.lock:
+      if self.rate is not None:
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
 
 # Class definition to use Redash API
 class Redash:
-  def __init__(self, key:str, base_url:str) -> None:
+  def __init__(self, key:str, base_url:str, session:requests.Session=None, pool_size:int=10, retries:int=3, poll:PollSchedule=None, cache:ResultCache=None, max_age:int=None, reuse:bool=False, result_format:str=None, bucket:TokenBucket=None, throttle_retries:int=5, record:str=None, replay:str=None, replay_speed:float=None, telemetry:Telemetry=None) -> None:
+    # Record this run's Redash traffic to an archive, or answer from one
+    # without a network (REDASH_RECORD / REDASH_REPLAY, see utils/replay.py).
+    record = record or os.getenv('REDASH_RECORD')
+    replay = replay or os.getenv('REDASH_REPLAY')
+    if replay and not base_url:
+      base_url = 'http://redash.replay'
     self.__API_KEY = key
     self.__BASE_URL = base_url
+    # One pooled session for every call this client makes; pass `session`
+    # to share connections with other clients in the same run.
+    if session is not None and (replay or record):
+      # The replay/record adapter goes on a private session, so other clients
+      # sharing `session` keep talking to Redash; its adapters (and their
+      # connection pools) are still shared.
+      private = requests.Session()
+      private.headers.update(session.headers)
+      for prefix, adapter in session.adapters.items():
+        private.mount(prefix, adapter)
+      session = private
+    self.session = session or make_session(pool_size, retries)
+    if replay:
+      speed = replay_speed if replay_speed is not None else float(os.getenv('REDASH_REPLAY_SPEED', 1))
+      self.session.mount(base_url, replays.player(replay, speed))
+      if bucket is not None and bucket.max_rate and speed != 1:
+        # pace the replay like the recorded run, sped up with it (0: unpaced)
+        bucket = TokenBucket(rate=bucket.max_rate * speed if speed else 1e6, burst=bucket.burst)
+    elif record:
+      self.session.mount(base_url, replays.recorder(record).adapter(self.session.get_adapter(base_url)))
+    # job / resultId / status are keyed by Query.key
     self.job = defaultdict(lambda: None)
     self.resultId = defaultdict(lambda: None)
     # status -> 1: running, 2: completed, 3: failed
     self.status = defaultdict(lambda: None)
+    # query id -> key of the last instance run, for get_result(<int>)
+    self.latest = {}
+    # declared result dtypes per instance, for get_result(<int>)
+    self.dtypes = {}
+    # per-instance locks for submitting/settling from several threads
+    self.locks = {}
+    self.poll = poll or PollSchedule()
+    # submit time and number of status requests per job, for the schedule
+    self.submitted = {}
+    self.polls = defaultdict(int)
+    # Optional on-disk result cache (opt in here or with REDASH_CACHE_DIR);
+    # results it served are kept in `frames` for get_result.
+    if cache is None and os.getenv('REDASH_CACHE_DIR'):
+      cache = ResultCache(os.getenv('REDASH_CACHE_DIR'))
+    self.cache = cache
+    self.frames = {}
+    # Freshness policy for the run: how old (seconds) a result Redash already
+    # has for the same query+params may be. 0 always executes the query;
+    # REDASH_MAX_AGE sets it without touching the scripts.
+    self.max_age = max_age if max_age is not None else int(os.getenv('REDASH_MAX_AGE', 0))
+    # Share results across several reports in one process: a query instance
+    # that already completed is not run again and its download is kept in
+    # `frames`, so each report can run_queries/get_result as if it were alone.
+    self.reuse = reuse
+    # 'csv' (default) re-infers column types from text; 'json' downloads the
+    # result with Redash's column types and builds the frame from those.
+    # REDASH_RESULT_FORMAT sets it without touching the scripts.
+    self.result_format = result_format or os.getenv('REDASH_RESULT_FORMAT', 'csv')
+    if self.result_format not in ('csv', 'json'):
+      raise ValueError(f'Unknown result format: {self.result_format}')
+    # Optional request pacing shared by every thread using this client
+    # (AsyncRedash paces once Redash throttles). A 429/503 is retried up to
+    # `throttle_retries` times, after the bucket backs off or, without one,
+    # after the Retry-After period.
+    self.bucket = bucket
+    self.throttle_retries = throttle_retries
+    # query id -> Redash data source id, looked up on demand
+    self.data_sources = {}
+    # Per-query timings and sizes, reported when the script exits (see
+    # utils/telemetry.py; REDASH_TELEMETRY=off to disable the report file).
+    self.telemetry = telemetry or Telemetry()
+    atexit.register(self.telemetry.report)
 
+  @traced('run_queries')
   def run_queries(self, queries:'list[Query]') -> None:
+    started = time.monotonic()
     for query in queries:
       self.run_query(query, batch=True)
-    while any(self.status[query.id] == 1 for query in queries):
-      for query in queries:
-        if self.status[query.id] == 1:
+
+    # Each job is checked when its own schedule says so, rather than the
+    # whole batch on a fixed tick.
+    due = {query.key: time.monotonic() + self.poll_delay(query) for query in queries}
+    pending = [query for query in queries if self.status[query.key] == 1]
+    while pending:
+      for query in pending:
+        if due[query.key] <= time.monotonic():
           self.poll_job(query)
-      # Only wait if queries are still in flight; skips a wasted trailing
-      # sleep once the batch has fully completed.
-      if any(self.status[query.id] == 1 for query in queries):
-        time.sleep(1)
+          due[query.key] = time.monotonic() + self.poll_delay(query)
+      pending = [query for query in pending if self.status[query.key] == 1]
+      if pending:
+        time.sleep(max(0, min(due[query.key] for query in pending) - time.monotonic()))
 
-    # clear job dictonary when completed
-    self.job = defaultdict(lambda: None)
+    # clear this batch's jobs when completed; other threads may still be
+    # polling theirs on the same client
+    for query in queries:
+      self.job.pop(query.key, None)
+    self.poll.save()
+    self.telemetry.batch('run_queries', [query.key for query in queries], time.monotonic() - started)
+
+  def run_blocks(self, blocks:dict) -> dict:
+    """Run each block's queries and call the block on their results.
+
+    `blocks` maps a name to (queries, fn); fn is called with one DataFrame
+    per query, in the order listed, and its return value is stored under the
+    block's name in the dict returned. Here every query runs first and the
+    blocks follow in order; AsyncRedash starts each block as soon as its own
+    inputs are in.
+    """
+    batch = list({query.key: query for needs, _ in blocks.values() for query in needs}.values())
+    self.run_queries(batch)
+    # each result is downloaded once; blocks sharing a query get their own copy
+    frames = {query.key: self.get_result(query) for query in batch}
+    return {name: fn(*(frames[query.key].copy() if frames[query.key] is not None else None for query in needs))
+            for name, (needs, fn) in blocks.items()}
+
+  def __request(self, method:str, url:str, **kwargs) -> requests.Response:
+    for attempt in range(self.throttle_retries + 1):
+      if self.bucket:
+        self.bucket.take()
+      res = self.session.request(method, url, **kwargs)
+      if res.status_code not in (429, 503):
+        if self.bucket:
+          self.bucket.ok()
+        return res
+      if attempt < self.throttle_retries:
+        retry_after = res.headers.get('Retry-After', '')
+        retry_after = float(retry_after) if retry_after.isdigit() else None
+        res.close()
+        if self.bucket:
+          self.bucket.throttled(retry_after)
+        else:
+          time.sleep(retry_after if retry_after is not None else 2 ** attempt)
+    return res
+
+  def data_source(self, query_id:int) -> int:
+    if query_id not in self.data_sources:
+      res = self.__request('GET', f'{self.__BASE_URL}/api/queries/{query_id}?api_key={self.__API_KEY}', timeout=60)
+      self.data_sources[query_id] = res.json().get('data_source_id') if res.status_code == 200 else None
+    return self.data_sources[query_id]
 
   def run_query(self, query:Query, batch=False) -> None:
-    payload = dict(max_age=0, parameters=query.params)
+    self.latest[query.id] = query.key
+    self.dtypes[query.key] = query.dtypes
+
+    # Batches may run on several threads and share query instances (e.g. a
+    # region-wide query used by two cities), so check-and-submit is atomic
+    # per instance: one that is still running is waited on, not resubmitted.
+    with self.__lock(query.key):
+      if self.status[query.key] != 1:
+        self.__submit(query)
+
+    if not batch:
+      while self.status[query.key] == 1:
+        time.sleep(self.poll_delay(query))
+        self.poll_job(query)
 
-    res = requests.post(f'{self.__BASE_URL}/api/queries/{query.id}/results?api_key={self.__API_KEY}', data=json.dumps(payload), timeout=60)
+  def __lock(self, key) -> threading.Lock:
+    return self.locks.setdefault(key, threading.Lock())
+
+  def __submit(self, query:Query) -> None:
+    max_age = query.max_age if query.max_age is not None else self.max_age
+    payload = dict(max_age=max_age, parameters=query.params)
+
+    if self.reuse and self.status[query.key] == 2:
+      return
+
+    if self.cache is not None:
+      df = self.cache.get(self.cache_key(query.key, query.dtypes))
+      if df is not None:
+        self.frames[query.key] = df
+        self.status[query.key] = 2
+        self.telemetry.submitted(query.key, 'cache', 0)
+        print(f'Query {query.id}: Loaded from cache.')
+        return
+
+    started = time.monotonic()
+    res = self.__request('POST', f'{self.__BASE_URL}/api/queries/{query.id}/results?api_key={self.__API_KEY}', data=json.dumps(payload), timeout=60)
+    elapsed = time.monotonic() - started
 
     if res.status_code != 200:
       logging.warning(res.json())
       logging.warning(f'Refresh failed.')
-      self.status[query.id] = 3
+      self.status[query.key] = 3
+      self.telemetry.submitted(query.key, 'refused', elapsed)
+    elif 'query_result' in res.json():
+      # Redash had a result within max_age and answered with it directly;
+      # there is no job to queue or poll.
+      self.resultId[query.key] = res.json()['query_result']['id']
+      self.status[query.key] = 2
+      self.telemetry.submitted(query.key, 'reused', elapsed)
+      print(f'Query {query.id}: Reused cached result.')
     else:
-      self.status[query.id] = 1
-      self.job[query.id] = res.json()['job']
+      self.submitted[query.key] = time.monotonic()
+      self.polls[query.key] = 0
+      self.job[query.key] = res.json()['job']
+      self.status[query.key] = 1
+      self.telemetry.submitted(query.key, 'job', elapsed)
 
-    if not batch:
-      while self.status[query.id] == 1:
-        self.poll_job(query)
+  def cache_key(self, key:tuple, dtypes:dict=None) -> tuple:
+    # A cached frame is only reused with the format and dtypes it was read
+    # with; a csv download's inferred types must not answer a json or typed call.
+    query_id, params = key
+    return (query_id, json.dumps([params, self.result_format, dtypes or {}], sort_keys=True, default=str))
+
+  def poll_delay(self, query:Query) -> float:
+    # Seconds to wait before the next poll_job call; none once the job has
+    # reached a final state, as poll_job then settles it without a request.
+    job = self.job[query.key]
+    if job is None or job['status'] in (3,4):
+      return 0
+    elapsed = time.monotonic() - self.submitted[query.key]
+    return self.poll.delay(query.id, elapsed, self.polls[query.key])
   
   def __get_job(self, job_id, attempts=3):
     # GET a job's status, retrying briefly on transient network errors.
     # A hard failure after all attempts is re-raised (unchanged behaviour).
     for attempt in range(1, attempts + 1):
       try:
-        return requests.get(f"{self.__BASE_URL}/api/jobs/{job_id}?api_key={self.__API_KEY}", timeout=60)
+        return self.__request('GET', f"{self.__BASE_URL}/api/jobs/{job_id}?api_key={self.__API_KEY}", timeout=60)
       except requests.RequestException:
         if attempt == attempts:
           raise
         time.sleep(1)
 
   def poll_job(self, query:Query) -> None:
-    job = self.job[query.id]
+    job = self.job[query.key]
 
     if job is None:
-      # No job recorded (e.g. the submit POST failed); nothing to poll.
-      self.status[query.id] = 3
+      # No job recorded: the submit POST failed, or another batch sharing
+      # this instance already settled and cleared it.
+      if self.status[query.key] == 1:
+        self.status[query.key] = 3
       return
 
     if job['status'] not in (3,4):
       response = self.__get_job(job['id'])
-      self.job[query.id] = response.json()['job']
+      self.job[query.key] = response.json()['job']
+      self.polls[query.key] += 1
+      self.telemetry.polled(query.key, self.job[query.key])
 
-    elif job['status'] == 3:
-      self.resultId[query.id] = job['query_result_id']
-      self.status[query.id] = 2
-      print(f'Query {query.id}: Completed.')
-
-    elif job['status'] == 4:
-      print(f'Query {query.id}: Execution failed.')
-      self.status[query.id] = 3
+    else:
+      # Settle once, whichever batch polling this job gets here first.
+      with self.__lock(query.key):
+        if self.status[query.key] != 1:
+          return
+        if job['status'] == 3:
+          self.resultId[query.key] = job['query_result_id']
+          self.status[query.key] = 2
+          self.poll.observe(query.id, time.monotonic() - self.submitted[query.key])
+          self.telemetry.settled(query.key, True)
+          print(f'Query {query.id}: Completed.')
+        else:
+          print(f'Query {query.id}: Execution failed.')
+          self.status[query.key] = 3
+          self.telemetry.settled(query.key, False)
 
   def read_csv_string(self, string:str) -> pd.DataFrame:
     # Convert string into StringIO
@@ -96,16 +460,194 @@ class Redash:
     # Load CSV string and return DataFrame
     return pd.read_csv(csvStringIO, sep=",")
 
+  def read_csv_stream(self, res:requests.Response, dtypes:dict=None) -> pd.DataFrame:
+    # Parse the body as it arrives instead of holding the whole text (and a
+    # StringIO copy of it) in memory first.
+    res.raw.decode_content = True
+    return pd.read_csv(res.raw, sep=",", dtype=dtypes)
+
+  def read_json_result(self, payload:dict, dtypes:dict=None) -> pd.DataFrame:
+    # Build the frame from the rows and type each column from Redash's
+    # metadata instead of guessing from text.
+    data = payload['query_result']['data']
+    df = pd.DataFrame.from_records(data['rows'], columns=[column['name'] for column in data['columns']])
+    for column in data['columns']:
+      name, kind = column['name'], column.get('type')
+      if kind in ('date', 'datetime'):
+        df[name] = pd.to_datetime(df[name], errors='coerce')
+      elif kind == 'integer':
+        # int64, or float64 when the column has nulls (as read_csv would)
+        df[name] = pd.to_numeric(df[name], errors='coerce')
+      elif kind == 'float':
+        df[name] = pd.to_numeric(df[name], errors='coerce').astype('float64')
+    if dtypes:
+      df = df.astype({name: dtype for name, dtype in dtypes.items() if name in df.columns})
+    return df
+
+  @traced('get_result', args=('query',))
   def get_result(self, query: Union[int,Query]) -> pd.DataFrame:
-    queryId = query.id if type(query) is Query else query
-    
-    if queryId not in self.resultId:
-      print(f'Query {queryId}: status {self.status[queryId]}')
+    # A bare id resolves to the last instance of that query that was run;
+    # pass the Query itself when the same id ran with several params.
+    if type(query) is Query:
+      queryId, key = query.id, query.key
     else:
-      resultId = f'results/{self.resultId[queryId]}' if self.resultId[queryId] else 'results'
-      res = requests.get(f'{self.__BASE_URL}/api/queries/{queryId}/{resultId}.csv?api_key={self.__API_KEY}', timeout=60)
-      if res.status_code != 200:
-        logging.warning(f'Failed getting results for Query {queryId}.')
-      return self.read_csv_string(res.text)
+      queryId, key = query, self.latest.get(query)
+
+    if key in self.frames:
+      return self.frames[key].copy()
+
+    if key not in self.resultId:
+      print(f'Query {queryId}: status {self.status[key]}')
+    else:
+      resultId = f'results/{self.resultId[key]}' if self.resultId[key] else 'results'
+      dtypes = query.dtypes if type(query) is Query else self.dtypes.get(key)
+      url = f'{self.__BASE_URL}/api/queries/{queryId}/{resultId}.{self.result_format}?api_key={self.__API_KEY}'
+      started = time.monotonic()
+      runtime = None
+      if self.result_format == 'json':
+        res = self.__request('GET', url, timeout=60)
+        if res.status_code != 200:
+          logging.warning(f'Failed getting results for Query {queryId}.')
+          return pd.DataFrame()
+        downloaded, size = time.monotonic(), len(res.content)
+        payload = res.json()
+        runtime = payload['query_result'].get('runtime')
+        df = self.read_json_result(payload, dtypes)
+      else:
+        with self.__request('GET', url, timeout=60, stream=True) as res:
+          if res.status_code != 200:
+            logging.warning(f'Failed getting results for Query {queryId}.')
+            return pd.DataFrame()
+          downloaded = time.monotonic()
+          df = self.read_csv_stream(res, dtypes)
+          size = res.raw.tell()
+      self.telemetry.downloaded(key, len(df), size, downloaded - started, time.monotonic() - downloaded, runtime)
+      if self.cache is not None:
+        self.cache.put(self.cache_key(key, dtypes), df)
+      if self.reuse:
+        self.frames[key] = df
+        return df.copy()
+      return df
+
 
+# Redash client that submits and polls a whole batch concurrently
+class AsyncRedash(Redash):
+  """Drop-in replacement for Redash whose run_queries() works on the batch at once.
+
+  Every query is submitted and then polled on its own asyncio task, so the
+  batch takes roughly as long as its slowest query instead of the sum of all
+  submit/poll round trips. At most `max_concurrency` jobs are in flight at a
+  time, each polled on the client's PollSchedule. run_queries() still blocks
+  until the batch settles and get_result() is unchanged, so report scripts
+  only need to swap the class.
+
+  run_blocks() drops the barrier: each result is downloaded as soon as its
+  job finishes, while others are still running, and each block runs once
+  the queries it declared have landed.
+
+  `max_concurrency` bounds one batch. When several threads run batches on
+  the same client, `max_in_flight` (or REDASH_MAX_IN_FLIGHT) bounds the
+  jobs they have running in total, and `data_source_limits` maps a Redash
+  data source id to the most jobs allowed on it at once (e.g. fewer for a
+  Postgres replica than for BigQuery). Requests share a TokenBucket across
+  those threads unless another `bucket` is passed; it leaves them unpaced
+  until Redash first throttles, or caps them at REDASH_RATE requests/s from
+  the start.
+  """
+  def __init__(self, key:str, base_url:str, max_concurrency:int=8, max_in_flight:int=None, data_source_limits:dict=None, **kwargs) -> None:
+    # Keep a pooled connection per in-flight job so they never queue for one.
+    kwargs.setdefault('pool_size', max_concurrency)
+    rate = os.getenv('REDASH_RATE')
+    kwargs.setdefault('bucket', TokenBucket(rate=float(rate) if rate else None))
+    super().__init__(key, base_url, **kwargs)
+    self.max_concurrency = max_concurrency
+    max_in_flight = max_in_flight or int(os.getenv('REDASH_MAX_IN_FLIGHT', 0))
+    self.in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+    self.source_slots = {source: threading.BoundedSemaphore(limit) for source, limit in (data_source_limits or {}).items()}
+
+  @traced('run_queries')
+  def run_queries(self, queries:'list[Query]') -> None:
+    # The same query instance listed twice is one job; submitting it twice
+    # would race on the same job slot.
+    started = time.monotonic()
+    batch = list({query.key: query for query in queries}.values())
+    asyncio.run(self.__run_batch(batch))
+
+    # clear this batch's jobs when completed; other threads may still be
+    # polling theirs on the same client
+    for query in batch:
+      self.job.pop(query.key, None)
+    self.poll.save()
+    self.telemetry.batch('run_queries', [query.key for query in batch], time.monotonic() - started)
+
+  @traced('run_blocks')
+  def run_blocks(self, blocks:dict) -> dict:
+    started = time.monotonic()
+    batch = list({query.key: query for needs, _ in blocks.values() for query in needs}.values())
+    results = asyncio.run(self.__run_blocks(batch, blocks))
+
+    for query in batch:
+      self.job.pop(query.key, None)
+    self.poll.save()
+    self.telemetry.batch('run_blocks', [query.key for query in batch], time.monotonic() - started)
+    return results
+
+  async def __run_blocks(self, queries:'list[Query]', blocks:dict) -> dict:
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=self.max_concurrency))
+    limit = asyncio.Semaphore(self.max_concurrency)
+    frames = {query.key: asyncio.create_task(self.__fetch(query, limit)) for query in queries}
+
+    async def run_block(needs, fn):
+      inputs = [await frames[query.key] for query in needs]
+      # blocks can share a query; each gets its own copy to work on
+      inputs = [df.copy() if df is not None else None for df in inputs]
+      return await asyncio.to_thread(fn, *inputs)
+
+    outputs = await asyncio.gather(*(run_block(needs, fn) for needs, fn in blocks.values()))
+    return dict(zip(blocks, outputs))
+
+  async def __fetch(self, query:Query, limit:asyncio.Semaphore) -> pd.DataFrame:
+    # The download happens outside the in-flight limit, so it overlaps with
+    # the jobs still running.
+    await self.__run_job(query, limit)
+    return await asyncio.to_thread(self.get_result, query)
+
+  async def __run_batch(self, queries:'list[Query]') -> None:
+    # The blocking HTTP calls run on worker threads; size the pool so every
+    # in-flight job can have a request outstanding.
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=self.max_concurrency))
+    limit = asyncio.Semaphore(self.max_concurrency)
+    await asyncio.gather(*(self.__run_job(query, limit) for query in queries))
+
+  async def __run_job(self, query:Query, limit:asyncio.Semaphore) -> None:
+    async with limit:
+      slots = await self.__acquire_slots(query)
+      try:
+        await asyncio.to_thread(self.run_query, query, True)
+        while self.status[query.key] == 1:
+          await asyncio.sleep(self.poll_delay(query))
+          await asyncio.to_thread(self.poll_job, query)
+      finally:
+        for slot in slots:
+          slot.release()
 
+  async def __acquire_slots(self, query:Query) -> list:
+    # A query another batch is running, or one reused from earlier, submits
+    # nothing and takes no slot.
+    if self.status[query.key] == 1 or (self.reuse and self.status[query.key] == 2):
+      return []
+    slots = []
+    if self.source_slots:
+      source = await asyncio.to_thread(self.data_source, query.id)
+      if source in self.source_slots:
+        slots.append(self.source_slots[source])
+    if self.in_flight is not None:
+      slots.append(self.in_flight)
+    # The semaphores are shared with other threads' event loops, so poll
+    # them rather than block this loop (or a worker its jobs need).
+    for slot in slots:
+      while not slot.acquire(blocking=False):
+        await asyncio.sleep(0.05)
+    return slots
@@ -0,0 +1,81 @@
+"""Local, append-only history of the metric columns the reports publish.
+
+Week-over-week rows (% Growth, % Resurrect, % Churn) need last week's
+numbers. Rather than re-query Redash for older weeks, or leave the rows for
+someone to fill in from last week's sheet, each run appends its final metric
+column here and reads the previous period back.
+
+Rows are keyed by region, segment (city, product segment or "ALL") and
+period (the week's start date). Nothing is updated in place: a re-run for
+the same period appends again, and reads take the latest value recorded.
+
+The store is a SQLite file at `path`, or METRICS_DB, or ./metrics.sqlite.
+"""
+import math
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+  region      TEXT NOT NULL,
+  segment     TEXT NOT NULL,
+  period      TEXT NOT NULL,
+  metric      TEXT NOT NULL,
+  value       REAL,
+  recorded_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS metrics_key ON metrics (region, segment, period, metric);
+"""
+
+
+class MetricStore:
+  def __init__(self, path=None):
+    self.path = path or os.getenv("METRICS_DB", "metrics.sqlite")
+    with self.connect() as db:
+      db.executescript(SCHEMA)
+
+  def connect(self):
+    return sqlite3.connect(self.path)
+
+  def append(self, region, segment, period, values):
+    """Record one period's metrics ({metric: value}); non-numeric values are skipped."""
+    recorded_at = datetime.now(timezone.utc).isoformat()
+    rows = [(region, segment, period, str(metric), number(value), recorded_at)
+            for metric, value in values.items() if number(value) is not None]
+    with self.connect() as db:
+      db.executemany("INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+  def get(self, region, segment, period):
+    """Latest recorded value of each metric for the period; {} if never recorded."""
+    with self.connect() as db:
+      rows = db.execute(
+        "SELECT metric, value FROM metrics WHERE region = ? AND segment = ? AND period = ? "
+        "ORDER BY recorded_at",
+        (region, segment, period),
+      ).fetchall()
+    return dict(rows)
+
+
+def number(value):
+  try:
+    value = float(value)
+  except (TypeError, ValueError):
+    return None
+  return None if math.isnan(value) else value
+
+
+def growth(current, previous):
+  """current / previous - 1, or None without both (or with a zero base)."""
+  current, previous = number(current), number(previous)
+  if current is None or not previous:
+    return None
+  return current / previous - 1
+
+
+def rate(count, base):
+  """count / base, or None without both (or with a zero base)."""
+  count, base = number(count), number(base)
+  if count is None or not base:
+    return None
+  return count / base
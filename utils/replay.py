@@ -0,0 +1,272 @@
+"""Record a run's Redash traffic, and replay it offline.
+
+Recording saves every exchange the client has with Redash (submits with their
+parameters, job polls, query lookups and result downloads) with its timing, to
+a gzipped JSON-lines archive. The api_key is stripped from every URL, and only
+the Content-Type and Retry-After headers are kept.
+
+Replaying serves those responses back without a network. Submits and downloads
+are matched by method, path and body. A job's status follows the clock: a poll
+gets the status the recorded job had at the same time after its submit, so the
+job finishes after its recorded runtime. Each response also takes as long as
+its recorded request did. `speed` scales both: 1 is the original timing, 10 is
+ten times faster, and 0 answers at once with every job already finished (and
+skips the 429s the recorded run was throttled with). The client's request
+pacing is scaled the same way.
+
+Both hook into the client as a requests transport adapter mounted on the base
+URL, so the client code runs unchanged:
+
+  REDASH_RECORD=kpi_2026_06.jsonl.gz python "kpi tracking/kpi.py"
+  REDASH_REPLAY=kpi_2026_06.jsonl.gz REDASH_REPLAY_SPEED=0 python "kpi tracking/kpi.py"
+
+or Redash(key, url, record=...) / Redash(key, url, replay=..., replay_speed=...).
+"""
+import atexit
+import base64
+import gzip
+import io
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3.response import HTTPResponse
+
+KEEP_HEADERS = ("Content-Type", "Retry-After")
+RESULT_PATH = re.compile(r"^/api/queries/\d+/results/(\d+)\.(\w+)$")
+
+# one recorder / player per archive, shared by every client in the process
+recorders = {}
+players = {}
+registry_lock = threading.Lock()
+
+
+def recorder(path):
+  with registry_lock:
+    if path not in recorders:
+      recorders[path] = Recorder(path)
+    return recorders[path]
+
+
+def player(path, speed=1.0):
+  with registry_lock:
+    if (path, speed) not in players:
+      players[(path, speed)] = Player(path, speed)
+    return players[(path, speed)]
+
+
+def stats():
+  """Requests and bytes served by every player in this process."""
+  total = Counter()
+  for replayer in players.values():
+    total.update(replayer.stats)
+  return dict(total)
+
+
+def request_path(url):
+  # path and query without the scheme, host or api_key
+  parts = urlsplit(url)
+  query = [(key, value) for key, value in parse_qsl(parts.query) if key != "api_key"]
+  return parts.path + ("?" + urlencode(query) if query else "")
+
+
+def request_body(body):
+  if not body:
+    return None
+  try:
+    return json.loads(body)
+  except ValueError:
+    return body.decode() if isinstance(body, bytes) else body
+
+
+def exchange_key(method, path, body):
+  return (method, path, json.dumps(body, sort_keys=True, default=str))
+
+
+def build(adapter, request, status, headers, body):
+  raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=status, preload_content=False, decode_content=False)
+  return adapter.build_response(request, raw)
+
+
+class Recorder:
+  def __init__(self, path):
+    self.path = path
+    self.start = time.monotonic()
+    self.lock = threading.Lock()
+    self.file = gzip.open(path, "wt", encoding="utf-8")
+    self.write({"version": 1, "recorded_at": datetime.now(timezone.utc).isoformat()})
+    atexit.register(self.close)
+
+  def write(self, entry):
+    with self.lock:
+      if not self.file.closed:
+        self.file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+  def close(self):
+    with self.lock:
+      if not self.file.closed:
+        self.file.close()
+
+  def adapter(self, inner):
+    # a session shared by several clients is only wrapped once
+    return inner if isinstance(inner, RecordingAdapter) else RecordingAdapter(self, inner)
+
+
+class RecordingAdapter(BaseAdapter):
+  """Sends through the session's own adapter and records each exchange."""
+  def __init__(self, recorder, inner):
+    super().__init__()
+    self.recorder = recorder
+    self.inner = inner
+
+  def send(self, request, **kwargs):
+    started = time.monotonic()
+    response = self.inner.send(request, **kwargs)
+    body = response.content
+    entry = {
+      "t": round(started - self.recorder.start, 4),
+      "duration": round(time.monotonic() - started, 4),
+      "method": request.method,
+      "path": request_path(request.url),
+      "body": request_body(request.body),
+      "status": response.status_code,
+      "headers": {name: response.headers[name] for name in KEEP_HEADERS if name in response.headers},
+    }
+    try:
+      entry["text"] = body.decode("utf-8")
+    except UnicodeDecodeError:
+      entry["b64"] = base64.b64encode(body).decode()
+    self.recorder.write(entry)
+    # The body was read to record it; hand the client a fresh stream of it.
+    return build(self.inner, request, response.status_code, dict(response.headers), body)
+
+  def close(self):
+    self.inner.close()
+
+
+class Player(HTTPAdapter):
+  """Answers the client's requests from a recorded archive."""
+  def __init__(self, path, speed=1.0):
+    super().__init__()
+    self.speed = speed
+    self.lock = threading.Lock()
+    self.stats = Counter()
+    self.exchanges = defaultdict(list)  # (method, path, body) -> entries, in recorded order
+    self.served = Counter()             # (method, path, body) -> entries served so far
+    self.jobs = defaultdict(list)       # job id -> poll entries, in recorded order
+    self.submitted = {}                 # job id -> (recorded submit time, replayed submit time)
+    self.downloads = {}                 # (submit key, format) -> key of a recorded download
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+      header = json.loads(next(f))
+      if header.get("version") != 1:
+        raise ValueError(f"Unsupported replay archive version: {header.get('version')}")
+      for line in f:
+        entry = json.loads(line)
+        if entry["path"].startswith("/api/jobs/"):
+          self.jobs[entry["path"]].append(entry)
+        else:
+          self.exchanges[exchange_key(entry["method"], entry["path"], entry["body"])].append(entry)
+    # A status change happened somewhere after the previous poll returned;
+    # take that as when it becomes visible, rather than the later poll that saw it.
+    for polls in self.jobs.values():
+      for previous, entry in zip([None] + polls, polls):
+        entry["from"] = previous["t"] + previous["duration"] if previous else entry["t"]
+    self.index_downloads()
+
+  def index_downloads(self):
+    # Jobs for the same query and parameters can finish in a different order
+    # than they did when recorded, so the client may ask for a result id that
+    # was never downloaded. Any recorded download of the same submit stands in.
+    submits = {}  # result id -> submit key
+    for key, entries in self.exchanges.items():
+      if key[0] != "POST":
+        continue
+      for entry in entries:
+        payload = json.loads(entry.get("text") or "null") if entry["status"] == 200 else None
+        if not payload:
+          continue
+        if "query_result" in payload:
+          submits[payload["query_result"]["id"]] = key
+        elif "job" in payload:
+          for poll in self.jobs.get(f"/api/jobs/{payload['job']['id']}", []):
+            result_id = (json.loads(poll.get("text") or "{}").get("job") or {}).get("query_result_id")
+            if result_id:
+              submits[result_id] = key
+    self.result_submits = submits
+    for key in self.exchanges:
+      match = RESULT_PATH.match(key[1].split("?")[0])
+      if match and int(match.group(1)) in submits:
+        self.downloads.setdefault((submits[int(match.group(1))], match.group(2)), key)
+
+  def stand_in(self, path):
+    match = RESULT_PATH.match(path.split("?")[0])
+    if not match:
+      return None
+    submit = self.result_submits.get(int(match.group(1)))
+    return self.downloads.get((submit, match.group(2)))
+
+  def wait(self, seconds):
+    if self.speed and seconds > 0:
+      time.sleep(seconds / self.speed)
+
+  def send(self, request, **kwargs):
+    path = request_path(request.url)
+    if path.startswith("/api/jobs/"):
+      entry = self.poll(path.split("?")[0])
+    else:
+      key = exchange_key(request.method, path, request_body(request.body))
+      if key not in self.exchanges and self.stand_in(path):
+        key = self.stand_in(path)
+      entry = self.next(key)
+
+    if entry is None:
+      logging.warning(f"Replay: no recorded response for {request.method} {path}")
+      return build(self, request, 404, {"Content-Type": "application/json"}, b'{"message": "Not recorded"}')
+
+    self.wait(entry["duration"])
+    body = base64.b64decode(entry["b64"]) if "b64" in entry else entry["text"].encode("utf-8")
+    if request.method == "POST" and entry["status"] == 200:
+      job = json.loads(body).get("job")
+      if job:
+        with self.lock:
+          self.submitted[f"/api/jobs/{job['id']}"] = (entry["t"], time.monotonic())
+    with self.lock:
+      self.stats["requests"] += 1
+      self.stats["bytes"] += len(body)
+    return build(self, request, entry["status"], entry["headers"], body)
+
+  def next(self, key):
+    # Requests repeated in the recording are answered in the recorded order;
+    # past the end, the last one again.
+    with self.lock:
+      entries = self.exchanges.get(key)
+      if not entries:
+        return None
+      if not self.speed:
+        # no waiting: skip the throttled attempts and answer with what followed
+        entries = [entry for entry in entries if entry["status"] not in (429, 503)] or entries
+      entry = entries[min(self.served[key], len(entries) - 1)]
+      self.served[key] += 1
+      return entry
+
+  def poll(self, path):
+    # The job's recorded status at the same (scaled) time after its submit.
+    with self.lock:
+      polls = self.jobs.get(path)
+      if not polls:
+        return None
+      if not self.speed or path not in self.submitted:
+        return polls[-1]
+      recorded, replayed = self.submitted[path]
+      now = recorded + (time.monotonic() - replayed) * self.speed
+      earlier = [entry for entry in polls if entry["from"] <= now]
+      return earlier[-1] if earlier else polls[0]
+
+  def close(self):
+    pass
@@ -5,12 +5,17 @@ import requests
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
+from utils.tracing import traced
+
 
 class SlackBot:
-  def __init__(self):
+  def __init__(self, session: requests.Session = None):
     self.client = WebClient(token=os.getenv('SLACK_TOKEN'))
     self.logger = Logger('SlackBot')
+    # Reused for the raw upload POST so it doesn't open its own connection.
+    self.session = session or requests.Session()
 
+  @traced('SlackBot.uploadFile', args=('file',))
   def uploadFile(self, file: str, channel: str, comment: str) -> None:
     filename = os.path.basename(file)
     filesize = os.path.getsize(file)
@@ -24,7 +29,7 @@ class SlackBot:
       file_id = ticket["file_id"]
 
       with open(file, "rb") as f:
-        resp = requests.post(upload_url, files={"file": (filename, f)})
+        resp = self.session.post(upload_url, files={"file": (filename, f)})
         resp.raise_for_status()
 
       result = self.client.files_completeUploadExternal(
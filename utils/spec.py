@@ -0,0 +1,97 @@
+"""Declarative metric specs for the report scripts.
+
+A report column is an ordered list of metrics, each declared as one of:
+
+  Col(query_id, column)  the first-row value of a query result column
+  a function             a formula over the metrics declared above it,
+                         e.g. lambda m: m["completed_trips"] / m["unique_completed_riders"]
+  None                   a blank row kept for the sheet layout
+
+optionally followed by a number format for the writer. Formulas can also
+read `inputs`, result columns that feed a formula without being a row of
+their own (e.g. the matched count behind a match rate).
+
+Spec compiles the list once: sources are grouped by query, so each result is
+read with a single reindex, and formulas run as column operations over every
+entity (city, region, period) at once. Evaluating three cities is the same
+Python-level work as evaluating one, and there is no per-cell DataFrame
+insertion (or the df.copy() calls that keep it from fragmenting).
+
+  WEEKLY = Spec([
+    ("completed_trips", Col(4607, "total_completed_trip")),
+    ("unique_completed_riders", Col(4607, "rider_weekly_complete")),
+    ("avg_completed_trip_per_rider", lambda m: m["completed_trips"] / m["unique_completed_riders"], "dec"),
+  ])
+  sheet = WEEKLY.evaluate({city: {qid: redash.get_result(...)} for city in cities})
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+Col = namedtuple("Col", ["query_id", "column"])
+
+
+class Spec:
+  def __init__(self, metrics, inputs=None):
+    self.names = []
+    self.formats = {}
+    self.sources = {}   # query id -> ([metric or input names], [result columns])
+    self.formulas = []  # (metric name, function), in declaration order
+    for metric in metrics:
+      name, source, fmt = (tuple(metric) + (None,))[:3]
+      if name in self.formats:
+        raise ValueError(f"Metric {name!r} is declared twice")
+      self.names.append(name)
+      self.formats[name] = fmt
+      if isinstance(source, Col):
+        self.add_source(name, source)
+      elif callable(source):
+        self.formulas.append((name, source))
+      elif source is not None:
+        raise TypeError(f"Metric {name!r}: expected a Col, a function or None, got {source!r}")
+    for name, source in (inputs or {}).items():
+      if name in self.formats:
+        raise ValueError(f"Input {name!r} is also declared as a metric")
+      if not isinstance(source, Col):
+        raise TypeError(f"Input {name!r}: expected a Col, got {source!r}")
+      self.add_source(name, source)
+
+  def add_source(self, name, source):
+    names, columns = self.sources.setdefault(source.query_id, ([], []))
+    names.append(name)
+    columns.append(source.column)
+
+  @property
+  def query_ids(self):
+    return list(self.sources)
+
+  def evaluate(self, results, missing=np.nan):
+    """Evaluate every entity at once.
+
+    `results` maps each entity to its {query_id: DataFrame}. Returns a DataFrame
+    with a row per metric (in declaration order) and a column per entity. Missing
+    results, empty results and missing columns evaluate to `missing` (NaN).
+    """
+    entities = list(results)
+    values = {}
+    for query_id, (names, columns) in self.sources.items():
+      rows = [first_row(results[entity].get(query_id), columns, missing) for entity in entities]
+      frame = pd.DataFrame(rows, index=entities, columns=range(len(columns)))
+      for i, name in enumerate(names):
+        values[name] = frame[i]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+      for name, formula in self.formulas:
+        values[name] = formula(values)
+
+    sheet = pd.DataFrame(values, index=entities, columns=self.names)
+    return sheet.T
+
+
+def first_row(df, columns, missing=np.nan):
+  """First-row values of `columns` in a result; `missing` for anything missing."""
+  if df is None or len(df) == 0:
+    return [missing] * len(columns)
+  row = df.iloc[0]
+  return [row[column] if column in row.index else missing for column in columns]
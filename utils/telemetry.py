@@ -0,0 +1,151 @@
+"""Per-query timing and cost telemetry for the Redash client.
+
+For every query instance a run touches, the client notes when it was
+submitted, how long its job queued and ran, how many status polls it took,
+and how many rows and bytes its result had and how long they took to download
+and parse. Each run_queries/run_blocks batch is timed as well.
+
+At exit the run is appended to a JSON-lines report (one line per query
+instance and per batch, tagged with a run id and the script) and the slowest
+queries and batches are printed:
+
+  REDASH_TELEMETRY=redash_telemetry.jsonl   report path ("off" to disable)
+  REDASH_TELEMETRY_TOP=10                   rows in the printed summary
+
+Times are as the client sees them: the queue and run split comes from when a
+poll first saw the job started (status 2) and finished, so each is accurate to
+a poll interval. With JSON results, `runtime` is Redash's own execution time.
+For CSV results the body streams into the parser, so `parse_s` includes the
+transfer and `download_s` is the wait for the response headers.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+DEFAULT_PATH = "redash_telemetry.jsonl"
+
+
+class Telemetry:
+  def __init__(self, path=None, top=None):
+    path = path or os.getenv("REDASH_TELEMETRY", DEFAULT_PATH)
+    self.path = None if path == "off" else path
+    self.top = top if top is not None else int(os.getenv("REDASH_TELEMETRY_TOP", 10))
+    self.run = uuid.uuid4().hex[:12]
+    self.queries = {}  # Query.key -> fields
+    self.batches = []
+    self.lock = threading.Lock()
+    self.reported = False
+
+  def query(self, key):
+    with self.lock:
+      if key not in self.queries:
+        query_id, params = key
+        self.queries[key] = dict(query_id=query_id, params=json.loads(params), source=None, status=None,
+                                 submitted_at=None, submit_s=None, queue_s=None, run_s=None, wait_s=None,
+                                 runtime=None, submits=0, polls=0, rows=None, bytes=0, downloads=0,
+                                 download_s=0.0, parse_s=0.0)
+      return self.queries[key]
+
+  def submitted(self, key, source, seconds):
+    # source: "job" (queued), "reused" (Redash answered with a result within
+    # max_age), "cache" (ResultCache hit) or "refused" (the submit failed).
+    # An instance submitted again adds to its times; the source is the latest.
+    entry = self.query(key)
+    entry["submits"] += 1
+    entry.update(source=source, submit_s=round((entry["submit_s"] or 0) + seconds, 4))
+    entry["submitted_at"] = entry["submitted_at"] or datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+    for mark in ("_started", "_finished"):
+      entry.pop(mark, None)
+    entry["_submitted"] = time.monotonic()
+    if source != "job":
+      entry["status"] = "failed" if source == "refused" else "completed"
+
+  def polled(self, key, job):
+    entry = self.query(key)
+    entry["polls"] += 1
+    now = time.monotonic()
+    if job["status"] in (2, 3, 4) and "_started" not in entry:
+      entry["_started"] = now
+    if job["status"] in (3, 4) and "_finished" not in entry:
+      entry["_finished"] = now
+
+  def settled(self, key, completed):
+    entry = self.query(key)
+    entry["status"] = "completed" if completed else "failed"
+    submitted, finished = entry.get("_submitted"), entry.get("_finished")
+    if submitted is None or finished is None:
+      return
+    started = entry["_started"]
+    add(entry, "wait_s", finished - submitted)
+    # A job first seen already finished never showed its queue/run split.
+    if started < finished:
+      add(entry, "queue_s", started - submitted)
+      add(entry, "run_s", finished - started)
+
+  def downloaded(self, key, rows, size, download_s, parse_s, runtime=None):
+    entry = self.query(key)
+    entry["downloads"] += 1
+    entry["rows"] = rows
+    entry["bytes"] += size or 0
+    entry["download_s"] = round(entry["download_s"] + download_s, 4)
+    entry["parse_s"] = round(entry["parse_s"] + parse_s, 4)
+    if runtime is not None:
+      entry["runtime"] = runtime
+
+  def batch(self, kind, keys, seconds):
+    with self.lock:
+      self.batches.append(dict(kind=kind, queries=len(keys), query_ids=sorted({key[0] for key in keys}), wall_s=round(seconds, 4)))
+
+  def rows(self):
+    script = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None
+    base = dict(run=self.run, script=script)
+    with self.lock:
+      queries = [dict(base, type="query", **{k: v for k, v in entry.items() if not k.startswith("_")})
+                 for entry in self.queries.values()]
+      batches = [dict(base, type="batch", **batch) for batch in self.batches]
+    return queries, batches
+
+  def report(self):
+    """Append this run to the report file and print the slowest queries and batches (once)."""
+    if self.reported or not self.queries:
+      return
+    self.reported = True
+    queries, batches = self.rows()
+    if self.path:
+      with open(self.path, "a") as f:
+        for row in queries + batches:
+          f.write(json.dumps(row, default=str) + "\n")
+    if self.top:
+      print(summary(queries, batches, self.top))
+
+
+def add(entry, field, seconds):
+  entry[field] = round((entry[field] or 0) + seconds, 4)
+
+
+def total(row):
+  return (row["wait_s"] or 0) + (row["submit_s"] or 0) + row["download_s"] + row["parse_s"]
+
+
+def summary(queries, batches, top=10):
+  lines = [f"\nSlowest Redash queries ({min(top, len(queries))} of {len(queries)}):",
+           f"  {'query':>7} {'total_s':>8} {'queue_s':>8} {'run_s':>8} {'download_s':>10} {'parse_s':>8} {'polls':>5} {'rows':>8} {'bytes':>10}  status"]
+
+  def cell(value, width, fmt=".2f"):
+    return f"{value:>{width}{fmt}}" if value is not None else f"{'-':>{width}}"
+
+  for row in sorted(queries, key=total, reverse=True)[:top]:
+    lines.append(f"  {row['query_id']:>7} {total(row):>8.2f} {cell(row['queue_s'], 8)} {cell(row['run_s'], 8)} "
+                 f"{row['download_s']:>10.2f} {row['parse_s']:>8.2f} {row['polls']:>5} {cell(row['rows'], 8, 'd')} "
+                 f"{row['bytes']:>10}  {row['status'] or '-'}{'' if row['source'] in ('job', None) else ' (' + row['source'] + ')'}")
+  if batches:
+    lines.append(f"Slowest batches ({min(top, len(batches))} of {len(batches)}):")
+    for batch in sorted(batches, key=lambda batch: batch["wall_s"], reverse=True)[:top]:
+      ids = ", ".join(str(query_id) for query_id in batch["query_ids"][:8])
+      more = f", ... (+{len(batch['query_ids']) - 8})" if len(batch["query_ids"]) > 8 else ""
+      lines.append(f"  {batch['wall_s']:>8.2f}s  {batch['kind']:<11} {batch['queries']:>3} queries: {ids}{more}")
+  return "\n".join(lines)
@@ -0,0 +1,187 @@
+"""Lightweight tracing spans for the report scripts.
+
+Wrap a stage in a span to get its duration, nested under whatever span was
+open when it started:
+
+  @traced()
+  def fetch_sg(redash, ...): ...
+
+  @traced(args=("city",))        # record these arguments as attributes
+  def fetch_kh_city(redash, start_date, end_date, churn_start, city): ...
+
+  with span("render", sheets=8): ...
+
+Tracing is off unless TRACE is set, and then costs nothing beyond a check per
+call. TRACE takes one or more comma-separated exporters, run at exit:
+
+  TRACE=console        an indented tree of span durations on stdout
+  TRACE=trace.json     Chrome trace events: open in https://ui.perfetto.dev or
+                       chrome://tracing for a flame-style timeline, one row
+                       per thread
+  TRACE=spans.jsonl    one span per line in the OpenTelemetry SDK's JSON shape
+                       (trace/span/parent ids, start/end time, attributes,
+                       status), for tools that read OTel spans
+
+Every run has a root span named after the script. Spans opened on threads
+that did not inherit a context (ThreadPoolExecutor workers) hang off the
+root; asyncio.to_thread copies the context, so the client's calls nest.
+"""
+import atexit
+import contextvars
+import inspect
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from functools import wraps
+
+current = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+  def __init__(self, name, trace_id, parent, attributes):
+    self.name = name
+    self.trace_id = trace_id
+    self.span_id = secrets.token_hex(8)
+    self.parent_id = parent.span_id if parent else None
+    self.attributes = attributes
+    self.thread = threading.current_thread()
+    self.start_ns = time.time_ns()
+    self.end_ns = None
+    self.error = None
+
+  @property
+  def duration_ms(self):
+    return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Tracer:
+  def __init__(self, exporters):
+    self.exporters = exporters
+    self.trace_id = secrets.token_hex(16)
+    self.spans = []
+    self.lock = threading.Lock()
+    script = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else "python"
+    self.root = Span(script, self.trace_id, None, {"argv": " ".join(sys.argv[1:])})
+    atexit.register(self.export)
+
+  @contextmanager
+  def span(self, name, /, **attributes):
+    parent = current.get() or self.root
+    item = Span(name, self.trace_id, parent, attributes)
+    token = current.set(item)
+    try:
+      yield item
+    except BaseException as e:
+      item.error = f"{type(e).__name__}: {e}"
+      raise
+    finally:
+      item.end_ns = time.time_ns()
+      current.reset(token)
+      with self.lock:
+        self.spans.append(item)
+
+  def export(self):
+    if self.root.end_ns is not None:
+      return
+    self.root.end_ns = time.time_ns()
+    with self.lock:
+      spans = [self.root] + sorted(self.spans, key=lambda item: item.start_ns)
+    for exporter in self.exporters:
+      if exporter == "console":
+        print(console(spans))
+      elif exporter.endswith(".jsonl"):
+        with open(exporter, "w") as f:
+          f.writelines(json.dumps(otel(item)) + "\n" for item in spans)
+      else:
+        with open(exporter, "w") as f:
+          json.dump(chrome(spans), f)
+
+
+def from_env():
+  exporters = [item.strip() for item in os.getenv("TRACE", "").split(",") if item.strip()]
+  return Tracer(exporters) if exporters else None
+
+
+TRACER = from_env()
+
+
+def span(name, /, **attributes):
+  """Context manager timing its block as a span (a no-op with tracing off)."""
+  return TRACER.span(name, **attributes) if TRACER else nullcontext()
+
+
+def traced(name=None, args=()):
+  """Decorator running each call in a span named after the function."""
+  def decorate(fn):
+    label = name or fn.__qualname__
+    signature = inspect.signature(fn) if args else None
+
+    @wraps(fn)
+    def call(*a, **kw):
+      if TRACER is None:
+        return fn(*a, **kw)
+      attributes = {}
+      if signature:
+        bound = signature.bind_partial(*a, **kw).arguments
+        attributes = {arg: bound[arg] for arg in args if arg in bound}
+      with TRACER.span(label, **attributes):
+        return fn(*a, **kw)
+    return call
+  return decorate
+
+
+def console(spans):
+  children = {}
+  for item in spans[1:]:
+    children.setdefault(item.parent_id, []).append(item)
+  lines = [f"\nTrace {spans[0].trace_id}:"]
+
+  def walk(item, depth):
+    attributes = " ".join(f"{key}={value}" for key, value in item.attributes.items() if value != "")
+    failed = f"  FAILED {item.error}" if item.error else ""
+    lines.append(f"  {item.duration_ms:>10.1f} ms  {'  ' * depth}{item.name}"
+                 f"{'  ' + attributes if attributes else ''}  [{item.thread.name}]{failed}")
+    for child in children.get(item.span_id, []):
+      walk(child, depth + 1)
+
+  walk(spans[0], 0)
+  return "\n".join(lines)
+
+
+def chrome(spans):
+  pid = os.getpid()
+  threads = {item.thread.ident: item.thread.name for item in spans}
+  events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}}
+            for tid, thread in threads.items()]
+  for item in spans:
+    args = {key: str(value) for key, value in item.attributes.items()}
+    if item.error:
+      args["error"] = item.error
+    events.append({"name": item.name, "cat": "report", "ph": "X", "pid": pid, "tid": item.thread.ident,
+                   "ts": item.start_ns / 1000, "dur": (item.end_ns - item.start_ns) / 1000, "args": args})
+  return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def otel(item):
+  def iso(ns):
+    return datetime.fromtimestamp(ns / 1e9, timezone.utc).isoformat().replace("+00:00", "Z")
+
+  return {
+    "name": item.name,
+    "context": {"trace_id": f"0x{item.trace_id}", "span_id": f"0x{item.span_id}", "trace_state": "[]"},
+    "kind": "SpanKind.INTERNAL",
+    "parent_id": f"0x{item.parent_id}" if item.parent_id else None,
+    "start_time": iso(item.start_ns),
+    "end_time": iso(item.end_ns),
+    "status": {"status_code": "ERROR", "description": item.error} if item.error else {"status_code": "UNSET"},
+    "attributes": {key: value if isinstance(value, (str, int, float, bool)) else str(value)
+                   for key, value in item.attributes.items()},
+    "events": [],
+    "links": [],
+    "resource": {"attributes": {"service.name": "perf-automation", "thread.name": item.thread.name}, "schema_url": ""},
+  }
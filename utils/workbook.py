@@ -0,0 +1,57 @@
+"""Streaming xlsx writer for the report workbooks.
+
+openpyxl keeps every cell (and a Font/PatternFill object per styled cell) in
+memory until save. xlsxwriter writes cells as they come, and with
+`constant_memory` flushes each row once the next one starts, so a workbook's
+memory no longer grows with its size. Formats are created once per distinct
+style and reused, as weekly/ny.py's build_workbook does.
+
+  book = WorkbookWriter("KPI.xlsx", constant_memory=True)
+  ws = book.add_sheet("SG", widths=[10, 18, 45, 22], freeze=(1, 3))
+  header = book.format(bold=True, bg="#1F3864", color="#FFFFFF")
+  ws.write(0, 0, "Type", header)
+  book.close()
+
+With `constant_memory`, rows must be written top to bottom within a sheet.
+"""
+import xlsxwriter
+
+FONT = {"font_name": "Calibri", "font_size": 10}
+
+
+class WorkbookWriter:
+  def __init__(self, path, constant_memory=False):
+    self.path = path
+    self.wb = xlsxwriter.Workbook(path, {"constant_memory": constant_memory, "nan_inf_to_errors": True})
+    self.formats = {}
+
+  def format(self, bold=False, bg=None, color=None, align=None, numfmt=None):
+    """Calibri 10 format with the given style, created once and cached."""
+    key = (bold, bg, color, align, numfmt)
+    if key not in self.formats:
+      props = dict(FONT)
+      if bold:
+        props["bold"] = True
+      if bg:
+        props["bg_color"] = bg
+        props["pattern"] = 1
+      if color:
+        props["font_color"] = color
+      if align:
+        props["align"] = align
+      if numfmt:
+        props["num_format"] = numfmt
+      self.formats[key] = self.wb.add_format(props)
+    return self.formats[key]
+
+  def add_sheet(self, name, widths=(), freeze=None):
+    """New worksheet; `widths` are column widths from A, `freeze` a (row, col) split."""
+    ws = self.wb.add_worksheet(name)
+    for col, width in enumerate(widths):
+      ws.set_column(col, col, width)
+    if freeze:
+      ws.freeze_panes(*freeze)
+    return ws
+
+  def close(self):
+    self.wb.close()
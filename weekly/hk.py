@@ -4,14 +4,14 @@ import pandas as pd
 from dotenv import load_dotenv
 
 from utils.dates import previous_week_start
-from utils.helpers import Query, Redash
+from utils.helpers import AsyncRedash, Query
 from utils.slack import SlackBot
 
 
 def main():
   load_dotenv()
 
-  redash = Redash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
+  redash = AsyncRedash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
 
   start_date, output_date = previous_week_start(8)
 
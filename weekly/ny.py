@@ -11,8 +11,10 @@ the Average Rider Fare / Average Driver Earn rows are shown per segment. Everyth
 are not segmented — they read the 'Overall' totals.
 
 Backfill a past week:  python weekly/ny.py 2026-06-08   (defaults to last complete week)
+Backfill a range:      python weekly/ny.py 2026-04-06 2026-06-29   (one workbook, a column per week)
 Env: REDASH_API_KEY, REDASH_BASE_URL, SLACK_TOKEN, SLACK_CHANNEL_NY (or SLACK_CHANNEL)
 """
+import logging
 import os
 import sys
 from datetime import datetime, timedelta
@@ -27,8 +29,11 @@ except Exception:                      # pragma: no cover
     NY_TZ = None
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.helpers import Query, Redash  # noqa: E402
+from utils.dates import week_before, week_starts  # noqa: E402
+from utils.helpers import AsyncRedash, Query  # noqa: E402
+from utils.history import MetricStore, growth  # noqa: E402
 from utils.slack import SlackBot          # noqa: E402
+from utils.tracing import traced          # noqa: E402
 
 # Logical name -> Redash query id
 QIDS = {
@@ -56,7 +61,7 @@ OP_METRICS = [
     ("Complete Rate", "complete_rate", "pct", "val"),
     ("Expire Rate", "expire_rate", "pct", "val"),
     ("Avg Daily Completed", "daily_completed", "int", "val"),
-    ("% Growth", None, "pct", "blankval"),
+    ("% Growth", "growth", "pct", "val"),
     ("Avg Completed Trip Per Rider", "avg_trip_per_rider", "dec", "val"),
     ("Avg Completed Trip Per Driver", "avg_trip_per_driver", "dec", "val"),
     ("Rider Cancel Rate", "rider_cancel_rate", "pct", "val"),
@@ -85,9 +90,9 @@ SPEC += [
     ("blank", None, None, None, None, None),
     ("val", "Driver", None, "New Driver Activated", "driver_first", "int"),
     ("val", "Driver", None, "Resurrected Driver", "driver_resurrect", "int"),
-    ("blankval", "Driver", None, "% Resurrect", None, "pct"),
+    ("val", "Driver", None, "% Resurrect", "driver_resurrect_pct", "pct"),
     ("val", "Driver", None, "Churn Driver", "driver_churn", "int"),
-    ("blankval", "Driver", None, "% Churn", None, "pct"),
+    ("val", "Driver", None, "% Churn", "driver_churn_pct", "pct"),
     ("val", "Driver", None, "Net New Driver", "net_new_driver", "int"),
 
     ("val", "Rider", None, "Retained Rider Pct", "retained_rider_pct", "pct"),
@@ -97,9 +102,9 @@ SPEC += [
     ("blank", None, None, None, None, None),
     ("val", "Rider", None, "New Rider Activated", "rider_first", "int"),
     ("val", "Rider", None, "Resurrected Rider", "rider_resurrect", "int"),
-    ("blankval", "Rider", None, "% Resurrect", None, "pct"),
+    ("val", "Rider", None, "% Resurrect", "rider_resurrect_pct", "pct"),
     ("val", "Rider", None, "Churn Rider", "rider_churn", "int"),
-    ("blankval", "Rider", None, "% Churn", None, "pct"),
+    ("val", "Rider", None, "% Churn", "rider_churn_pct", "pct"),
     ("val", "Rider", None, "Net New Rider", "net_new_rider", "int"),
     ("val", "Rider", None, "R:D Ratio", "rd_ratio", "dec4"),
     ("blank", None, None, None, None, None),
@@ -196,6 +201,7 @@ def _safe_div(a, b):
 # ---------------------------------------------------------------------------
 # Extract + derive
 # ---------------------------------------------------------------------------
+@traced()
 def extract_values(res):
     v = {}
     tseg = _seg_rows(res["trips"])
@@ -265,6 +271,7 @@ def extract_values(res):
     return v
 
 
+@traced()
 def compute_derived(v):
     z = lambda k: (_num(v.get(k)) or 0)
     d = {}
@@ -289,6 +296,18 @@ def compute_derived(v):
     return d
 
 
+def compute_trends(v, prev):
+    """Week-over-week rows, from this week's values and last week's (from the metric store)."""
+    d = {}
+    for seg, _disp in SEGMENTS:
+        d[f"{seg}_growth"] = growth(v.get(f"{seg}_completed"), prev.get(f"{seg}_completed"))
+    d["driver_resurrect_pct"] = _safe_div(v.get("driver_resurrect"), prev.get("driver_weekly_complete"))
+    d["driver_churn_pct"] = _safe_div(v.get("driver_churn"), prev.get("driver_weekly_complete"))
+    d["rider_resurrect_pct"] = _safe_div(v.get("rider_resurrect"), prev.get("rider_weekly_complete"))
+    d["rider_churn_pct"] = _safe_div(v.get("rider_churn"), prev.get("rider_weekly_complete"))
+    return d
+
+
 def extract_payment(res):
     pm = res["pm"]
     return {
@@ -305,7 +324,9 @@ def extract_payment(res):
 NUMFMT = {"int": "#,##0", "dec": "#,##0.00", "dec4": "#,##0.0000", "pct": "0.00%", "money": "$#,##0.00"}
 
 
-def build_workbook(path, start_date, values, payment):
+@traced()
+def build_workbook(path, columns):
+    """columns: [(start_date, values, payment), ...] — one value column per week, in order."""
     import xlsxwriter
 
     wb = xlsxwriter.Workbook(path, {"nan_inf_to_errors": True})
@@ -313,7 +334,7 @@ def build_workbook(path, start_date, values, payment):
     ws.set_column(0, 0, 12)
     ws.set_column(1, 1, 18)
     ws.set_column(2, 2, 34)
-    ws.set_column(3, 3, 14)
+    ws.set_column(3, 2 + len(columns), 14)
 
     fmt_cache = {}
 
@@ -340,10 +361,12 @@ def build_workbook(path, start_date, values, payment):
                              "align": "center", "border": 1})
     ws.write(0, 2, "NY Weekly Report", wb.add_format({"bold": True, "font_size": 14}))
     ws.write(1, 2, "Monday Start Date", wb.add_format({"bold": True}))
-    ws.write(1, 3, start_date, wb.add_format({"bold": True}))
     HDR = 2
-    for col, txt in ((0, "Section"), (1, "Segment"), (2, "Metric"), (3, start_date)):
+    for col, txt in ((0, "Section"), (1, "Segment"), (2, "Metric")):
         ws.write(HDR, col, txt, hdr_fmt)
+    for j, (start_date, _values, _payment) in enumerate(columns):
+        ws.write(1, 3 + j, start_date, wb.add_format({"bold": True}))
+        ws.write(HDR, 3 + j, start_date, hdr_fmt)
     DATA = HDR + 1
 
     # Pass 1: row ranges for the merged section (A) and segment (B) labels.
@@ -358,7 +381,7 @@ def build_workbook(path, start_date, values, payment):
             lo, hi = seg_range.get(sk, (r0, r0))
             seg_range[sk] = (min(lo, r0), max(hi, r0))
 
-    # Pass 2: metric (C) + value (D). Column B is filled per-row only where there's no
+    # Pass 2: metric (C) + a value per week (D onwards). Column B is filled per-row only where there's no
     # segment label (segment cells are written by the merge loop below).
     for i, (kind, section, segment, label, key, nf) in enumerate(SPEC):
         r0 = DATA + i
@@ -368,10 +391,11 @@ def build_workbook(path, start_date, values, payment):
         if segment is None:
             ws.write_blank(r0, 1, None, fmt(bg=bg))
         ws.write(r0, 2, label, fmt(bg=bg))
-        if kind == "val":
-            ws.write(r0, 3, _num(values.get(key)), fmt(numfmt=nf, bg="#FFF8E1"))
-        else:
-            ws.write_blank(r0, 3, None, fmt(numfmt=nf, bg="#FFF8E1"))
+        for j, (_start_date, values, _payment) in enumerate(columns):
+            if kind == "val":
+                ws.write(r0, 3 + j, _num(values.get(key)), fmt(numfmt=nf, bg="#FFF8E1"))
+            else:
+                ws.write_blank(r0, 3 + j, None, fmt(numfmt=nf, bg="#FFF8E1"))
 
     def label_fmt(section):
         return fmt(bg=SECTION_FILL.get(section), bold=True, rotation=90, align="center", valign="vcenter")
@@ -390,12 +414,13 @@ def build_workbook(path, start_date, values, payment):
     # Payment Method sheet
     pm_ws = wb.add_worksheet("Payment Method")
     pm_ws.set_column(0, 0, 24)
-    pm_ws.set_column(1, 1, 16)
+    pm_ws.set_column(1, len(columns), 16)
     pm_ws.write(0, 0, "Metric", hdr_fmt)
-    pm_ws.write(0, 1, start_date, hdr_fmt)
-    for i, (label, (val, nf)) in enumerate(payment.items()):
-        pm_ws.write(i + 1, 0, label, fmt())
-        pm_ws.write(i + 1, 1, _num(val), fmt(numfmt=nf))
+    for j, (start_date, _values, payment) in enumerate(columns):
+        pm_ws.write(0, 1 + j, start_date, hdr_fmt)
+        for i, (label, (val, nf)) in enumerate(payment.items()):
+            pm_ws.write(i + 1, 0, label, fmt())
+            pm_ws.write(i + 1, 1 + j, _num(val), fmt(numfmt=nf))
 
     wb.close()
 
@@ -409,33 +434,56 @@ def last_complete_monday():
     return this_monday - timedelta(days=7)
 
 
+def week_queries(start_date):
+    """Logical name -> Query for the week starting `start_date`."""
+    return {name: Query(qid, params={"week_start_date": start_date}) for name, qid in QIDS.items()}
+
+
+def week_start(arg):
+    # Must be a Monday (queries bucket on week-start); a non-Monday snaps back.
+    d = datetime.strptime(arg, "%Y-%m-%d").date()
+    if d.weekday() != 0:
+        d = d - timedelta(days=d.weekday())
+        print(f"Note: snapped to week-start Monday {d}")
+    return d.strftime("%Y-%m-%d")
+
+
 def main():
     load_dotenv()
-    redash = Redash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
-
-    # Optional override: `python weekly/ny.py 2026-06-08` to backfill a specific week.
-    # Must be a Monday (queries bucket on week-start); a non-Monday snaps back. No arg = last week.
-    if len(sys.argv) > 1:
-        d = datetime.strptime(sys.argv[1], "%Y-%m-%d").date()
-        if d.weekday() != 0:
-            d = d - timedelta(days=d.weekday())
-            print(f"Note: snapped to week-start Monday {d}")
-        start_date = d.strftime("%Y-%m-%d")
+    redash = AsyncRedash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
+
+    # Optional override: `python weekly/ny.py 2026-06-08` to backfill a specific week, or
+    # `python weekly/ny.py 2026-04-06 2026-06-29` for every week in a range. No arg = last week.
+    if len(sys.argv) > 2:
+        weeks = week_starts(week_start(sys.argv[1]), week_start(sys.argv[2]))
+    elif len(sys.argv) > 1:
+        weeks = [week_start(sys.argv[1])]
     else:
-        start_date = last_complete_monday().strftime("%Y-%m-%d")
-    output_date = datetime.strptime(start_date, "%Y-%m-%d").strftime("%d_%b_%Y")
-    print(f"NY weekly for week starting {start_date}")
-
-    queries = [Query(qid, params={"week_start_date": start_date}) for qid in QIDS.values()]
-    redash.run_queries(queries)
-    res = {name: redash.get_result(qid) for name, qid in QIDS.items()}
-
-    values = extract_values(res)
-    values.update(compute_derived(values))
-    payment = extract_payment(res)
+        weeks = [last_complete_monday().strftime("%Y-%m-%d")]
+    output_dates = [datetime.strptime(w, "%Y-%m-%d").strftime("%d_%b_%Y") for w in weeks]
+    output_date = output_dates[0] if len(weeks) == 1 else f"{output_dates[0]}_to_{output_dates[-1]}"
+    print(f"NY weekly for week(s) starting {', '.join(weeks)}")
+
+    # Every week's queries go out as one batch.
+    queries = {start_date: week_queries(start_date) for start_date in weeks}
+    redash.run_queries([query for week in queries.values() for query in week.values()])
+
+    # Oldest week first, so each week's trends read the week before from the store.
+    store = MetricStore()
+    columns = []
+    for start_date in weeks:
+        res = {name: redash.get_result(query) for name, query in queries[start_date].items()}
+        values = extract_values(res)
+        values.update(compute_derived(values))
+        previous = store.get("NY", "ALL", week_before(start_date))
+        if not previous:
+            logging.warning(f"No NY metrics for week {week_before(start_date)} in {store.path}; week-over-week rows left blank.")
+        values.update(compute_trends(values, previous))
+        store.append("NY", "ALL", start_date, values)
+        columns.append((start_date, values, extract_payment(res)))
 
     output_file = f"NY_Weekly_{output_date}.xlsx"
-    build_workbook(output_file, start_date, values, payment)
+    build_workbook(output_file, columns)
     print(f"Wrote {output_file}")
 
     try:
@@ -1,163 +1,152 @@
+import logging
 import os
 
-import pandas as pd
 from dotenv import load_dotenv
 
-from utils.dates import previous_week_start
-from utils.helpers import Query, Redash
+from utils.dates import previous_week_start, week_before
+from utils.helpers import AsyncRedash, Query
+from utils.history import MetricStore, growth, rate
 from utils.slack import SlackBot
+from utils.spec import Col, Spec
 
 
-def main():
-  load_dotenv()
-
-  redash = Redash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
-
-  start_date, output_date = previous_week_start(7)
+# 5067 Driver FT, Resurrect, Churn    5221 Incentive Spending
+# 5062 Completed Trips                 5065 Active Rider Weekly
+# 4933 Completed Trips (ซ้ำกับ 5062 ใช่ไหม?)
+# 5071 Avg Online Drivers              5074 Platform Fees Weekly
+# 5068 Rider FT, Resurrect, Churn      5073 Promotion Spending Weekly
+# 5072 Average Fares Weekly
+QIDS = [5067, 5221, 5062, 5065, 4933, 5071, 5074, 5068, 5073, 5072]
 
-  queries = [
-              [
-                  Query(5067, params={"week_start_date": start_date}),  # TH Weekly PS | Driver FT, Resurrect, Churn
-                  Query(5221, params={"week_start_date": start_date}),  # TH Weekly PS | Incentive Spending
-                  Query(5062, params={"week_start_date": start_date}),  # TH Weekly PS | Completed Trips
-                  Query(5065, params={"week_start_date": start_date}),  # TH Weekly PS | Active Rider Weekly
-                  Query(4933, params={"week_start_date": start_date}),  # TH Weekly PS | Completed Trips (ซ้ำกับ 5062 ใช่ไหม?)
-                  Query(5071, params={"week_start_date": start_date}),  # TH Weekly PS | Avg Online Drivers
-                  Query(5074, params={"week_start_date": start_date}),  # TH Weekly PS | Platform Fees Weekly
-                  Query(5068, params={"week_start_date": start_date}),  # TH Weekly PS | Rider FT, Resurrect, Churn
-                  Query(5073, params={"week_start_date": start_date}),  # TH Weekly PS | Promotion Spending Weekly
-                  Query(5072, params={"week_start_date": start_date}), # TH Weekly PS | Average Fares Weekly
-              ]
-          ]
-
-  for query_list in queries:
-      redash.run_queries(query_list)
-
-  # Fetch results
-  df1 = redash.get_result(5067)  # TH Weekly PS | Driver FT, Resurrect, Churn
-  df2 = redash.get_result(5221)  # TH Weekly PS | Incentive Spending
-  df3 = redash.get_result(5062)  # TH Weekly PS | Completed Trips
-  df4 = redash.get_result(5065)  # TH Weekly PS | Active Rider Weekly
-  df5 = redash.get_result(4933)  # TH Weekly PS | Completed Trips (อาจซ้ำกับ 5062)
-  df6 = redash.get_result(5071)  # TH Weekly PS | Avg Online Drivers
-  df7 = redash.get_result(5074)  # TH Weekly PS | Platform Fees Weekly
-  df8 = redash.get_result(5068)  # TH Weekly PS | Rider FT, Resurrect, Churn
-  df9 = redash.get_result(5073)  # TH Weekly PS | Promotion Spending Weekly
-  df10 = redash.get_result(5072) # TH Weekly PS | Average Fares Weekly
-
-
-  # Construct weekly dataFrame
-  df = pd.DataFrame()
-  df["Completed Trips"] = df3.total_completed_trip
-  df["Daily Completed"] = df3.daily_completed_trip
-  df["Percentage Growth"] = None
+WEEKLY = Spec([
+  ("Completed Trips", Col(5062, "total_completed_trip")),
+  ("Daily Completed", Col(5062, "daily_completed_trip")),
+  ("Percentage Growth", None),
 
   # Rider weekly active users
-  df["Rider WAU"] = df4.active_users
-  df["Unique Completed Riders"] = df3.rider_weekly_complete
-  df["Completed Riders / WAU"] = df['Unique Completed Riders'] / df['Rider WAU']
-  df["Daily Average Online Driver"] = df6.avg_online_drivers
-  df["Daily Average Completed Driver"] = df3.daily_avg_completed_drivers
-  df["CD / OD"] = None
-  df["Driver Weekly Complete"] = df3.driver_weekly_complete
-  df["DAC/WC Drivers"] = df['Daily Average Completed Driver'] / df['Driver Weekly Complete']
-  df["Average Completed Trip Per Rider"] = df['Completed Trips'] / df['Unique Completed Riders']
-  df["Average Completed Trip Per Driver"] = df['Daily Completed'] / df['Driver Weekly Complete']
+  ("Rider WAU", Col(5065, "active_users")),
+  ("Unique Completed Riders", Col(5062, "rider_weekly_complete")),
+  ("Completed Riders / WAU", lambda m: m['Unique Completed Riders'] / m['Rider WAU']),
+  ("Daily Average Online Driver", Col(5071, "avg_online_drivers")),
+  ("Daily Average Completed Driver", Col(5062, "daily_avg_completed_drivers")),
+  ("CD / OD", None),
+  ("Driver Weekly Complete", Col(5062, "driver_weekly_complete")),
+  ("DAC/WC Drivers", lambda m: m['Daily Average Completed Driver'] / m['Driver Weekly Complete']),
+  ("Average Completed Trip Per Rider", lambda m: m['Completed Trips'] / m['Unique Completed Riders']),
+  ("Average Completed Trip Per Driver", lambda m: m['Daily Completed'] / m['Driver Weekly Complete']),
 
   # Driver
-  df["New Driver Activated"] = df1.first_timers
-  df["Resurrected Driver"] = df1.resurrect
-  df["% Resurrect"] = None
-  df["Churn Driver"] = df1.churn
-  df["% Churn"] = None
-  df["Net New Driver"] = df['New Driver Activated'] + df['Resurrected Driver'] - df['Churn Driver']
-
+  ("New Driver Activated", Col(5067, "first_timers")),
+  ("Resurrected Driver", Col(5067, "resurrect")),
+  ("% Resurrect", None),
+  ("Churn Driver", Col(5067, "churn")),
+  ("% Churn", None),
+  ("Net New Driver", lambda m: m['New Driver Activated'] + m['Resurrected Driver'] - m['Churn Driver']),
 
   # Rider
-  df["New Rider Activated"] = df8.first_timers
-  df["Resurrected Rider"] = df8.resurrect
-  df["% Resurrect rider"] = None
-  df["Churn Rider"] = df8.churn
-  df["% Churn rider"] = None
-  df["Net New Rider"] = df['New Rider Activated'] + df['Resurrected Rider'] - df['Churn Rider']
-  df["R:D Ratio"] = df['Unique Completed Riders'] / df['Driver Weekly Complete']
-  df["blank_1"] = None
-
-  df = df.copy()
+  ("New Rider Activated", Col(5068, "first_timers")),
+  ("Resurrected Rider", Col(5068, "resurrect")),
+  ("% Resurrect rider", None),
+  ("Churn Rider", Col(5068, "churn")),
+  ("% Churn rider", None),
+  ("Net New Rider", lambda m: m['New Rider Activated'] + m['Resurrected Rider'] - m['Churn Rider']),
+  ("R:D Ratio", lambda m: m['Unique Completed Riders'] / m['Driver Weekly Complete']),
+  ("blank_1", None),
 
   # fare and discount
-  df["Average Fare"] = df10.average_fare
-  df["blank_2"] = None
-  df["Promo Spend (THB)"] = df9.discount
-  df["Promo Spend (SGD)"] = None
-  df["Promotion Trips"] = df9.discount_trips
-  df["Promotion Trips / Completed Trips"] = df['Promotion Trips'] / df['Completed Trips']
-  df["Average Promotion Value (THB)"] = df9.average_discount
-  df["Average Promotion Value (SGD)"] = None
-  df["Promo per completed ride (THB)"] = df['Promotion Trips'] / df['Completed Trips']
-  df["Promo per completed ride (SGD)"] = None
-  df["Promo per completed rider (SGD)"] = None
-  df["Promo per completed trip/Average Fare"] = df['Promo per completed ride (THB)'] / df['Average Fare']
-  df["blank_3"] = None
-
-  df["Incentive Spend (THB)"] = df2.incentive_amount
-  df["Incentive Spend (SGD)"] = None
-  df["Incentive per completed driver"] = df['Incentive Spend (THB)'] / df['Driver Weekly Complete']
-  df["Incentive per completed trip"] = df['Incentive Spend (THB)'] / df['Completed Trips']
-  df["blank_4"] = None
-
-  df["Total Spending (THB)"] = df['Promo Spend (THB)'] + df['Incentive Spend (THB)']
-  df["Total Spending (SGD)"] = None
-  df["blank_5"] = None
-  df["Bike Revenue"] = df7.bike_total_system_fee
-  df["Car Revenue"] = df7.car_total_system_fee
-  df["Total Revenue"] = df['Bike Revenue'] + df['Car Revenue']
-  df["blank_6"] = None
-  df["blank_7"] = None
-
-  df = df.copy()
+  ("Average Fare", Col(5072, "average_fare")),
+  ("blank_2", None),
+  ("Promo Spend (THB)", Col(5073, "discount")),
+  ("Promo Spend (SGD)", None),
+  ("Promotion Trips", Col(5073, "discount_trips")),
+  ("Promotion Trips / Completed Trips", lambda m: m['Promotion Trips'] / m['Completed Trips']),
+  ("Average Promotion Value (THB)", Col(5073, "average_discount")),
+  ("Average Promotion Value (SGD)", None),
+  ("Promo per completed ride (THB)", lambda m: m['Promotion Trips'] / m['Completed Trips']),
+  ("Promo per completed ride (SGD)", None),
+  ("Promo per completed rider (SGD)", None),
+  ("Promo per completed trip/Average Fare", lambda m: m['Promo per completed ride (THB)'] / m['Average Fare']),
+  ("blank_3", None),
+
+  ("Incentive Spend (THB)", Col(5221, "incentive_amount")),
+  ("Incentive Spend (SGD)", None),
+  ("Incentive per completed driver", lambda m: m['Incentive Spend (THB)'] / m['Driver Weekly Complete']),
+  ("Incentive per completed trip", lambda m: m['Incentive Spend (THB)'] / m['Completed Trips']),
+  ("blank_4", None),
+
+  ("Total Spending (THB)", lambda m: m['Promo Spend (THB)'] + m['Incentive Spend (THB)']),
+  ("Total Spending (SGD)", None),
+  ("blank_5", None),
+  ("Bike Revenue", Col(5074, "bike_total_system_fee")),
+  ("Car Revenue", Col(5074, "car_total_system_fee")),
+  ("Total Revenue", lambda m: m['Bike Revenue'] + m['Car Revenue']),
+  ("blank_6", None),
+  ("blank_7", None),
 
   # CAR
-  df["Completed Trips (Car)"] = df3.car_completed_trip
-  df["Car Complete/Total Complete"] = df['Completed Trips (Car)'] / df['Completed Trips']
-  df["Daily Car Trips"] = df['Completed Trips (Car)'] / 7
-  df["Completed Users"] = df5.rider_weekly_complete_car
-  df["First Trip Users"] = df8.first_timers_car
-  df["Resurrect Users"] = df8.resurrect_car
-  df["Churned Users"] = df8.churn_car
-  df["Average Fare (Car)"] = df10.car_average_fare
-  df["Car Promo Spend (THB)"] = df9.car_discount
-  df["Number of Promotion Trips (Car)"] = df9.car_discount_trips
-  df["Average Promo Value (Car)"] = df9.average_car_discount
-  df["Promo Per completed Ride (Car)"] = df['Car Promo Spend (THB)'] / df['Completed Trips (Car)']
-  df["Promo per completed trip/Average Fare (Car)"] = df['Promo Per completed Ride (Car)'] / df['Average Fare (Car)']
-  df["Promo Trips/Completed Trips (Car)"] = df['Number of Promotion Trips (Car)'] / df['Completed Trips (Car)']
+  ("Completed Trips (Car)", Col(5062, "car_completed_trip")),
+  ("Car Complete/Total Complete", lambda m: m['Completed Trips (Car)'] / m['Completed Trips']),
+  ("Daily Car Trips", lambda m: m['Completed Trips (Car)'] / 7),
+  ("Completed Users", Col(4933, "rider_weekly_complete_car")),
+  ("First Trip Users", Col(5068, "first_timers_car")),
+  ("Resurrect Users", Col(5068, "resurrect_car")),
+  ("Churned Users", Col(5068, "churn_car")),
+  ("Average Fare (Car)", Col(5072, "car_average_fare")),
+  ("Car Promo Spend (THB)", Col(5073, "car_discount")),
+  ("Number of Promotion Trips (Car)", Col(5073, "car_discount_trips")),
+  ("Average Promo Value (Car)", Col(5073, "average_car_discount")),
+  ("Promo Per completed Ride (Car)", lambda m: m['Car Promo Spend (THB)'] / m['Completed Trips (Car)']),
+  ("Promo per completed trip/Average Fare (Car)", lambda m: m['Promo Per completed Ride (Car)'] / m['Average Fare (Car)']),
+  ("Promo Trips/Completed Trips (Car)", lambda m: m['Number of Promotion Trips (Car)'] / m['Completed Trips (Car)']),
 
   # BIKE
-  df["blank_8"] = None
-  df["Completed Trips (Bike)"] = df3.bike_completed_trip
-  df["Bike Complete/Total Complete"] = df['Completed Trips (Bike)'] / df['Completed Trips']
-  df["Daily Bike Trips"] = df['Completed Trips (Bike)'] / 7
-  df["Bike Completed Users"] = df5.rider_weekly_complete_bike
-  df["Bike First Trip Users"] = df8.first_timers_bike
-  df["Bike Resurrect Users"] = df8.resurrect_bike
-  df["Bike Churned Users"] = df8.churn_bike
-  df["Average Fare (Bike)"] = df10.bike_average_fare
-  df["Bike Promo Spend (THB)"] = df9.bike_discount
-  df["Number of Promotion Trips (Bike)"] = df9.bike_discount_trips
-  df["Average Promo Value (Bike)"] = df9.average_bike_discount
-  df["Promo Per completed Ride (Bike)"] = df['Bike Promo Spend (THB)'] / df['Completed Trips (Bike)']
-  df["Promo per completed trip/Average Fare (Bike)"] = df['Promo Per completed Ride (Bike)'] / df['Average Fare (Bike)']
-  df["Promo Trips/Completed Trips (Bike)"] = df['Number of Promotion Trips (Bike)'] / df['Completed Trips (Bike)']
-
-  df["blank_9"] = None
-  df["Spend per trip"] = df['Total Spending (THB)'] / df['Completed Trips']
-  df["Earn per trip"] = df['Total Revenue'] / df['Completed Trips']
-  df["P/L"] = (df['Earn per trip'] / df['Spend per trip']) - 1
-
-  df = df.copy()
-
-  df = df.T
+  ("blank_8", None),
+  ("Completed Trips (Bike)", Col(5062, "bike_completed_trip")),
+  ("Bike Complete/Total Complete", lambda m: m['Completed Trips (Bike)'] / m['Completed Trips']),
+  ("Daily Bike Trips", lambda m: m['Completed Trips (Bike)'] / 7),
+  ("Bike Completed Users", Col(4933, "rider_weekly_complete_bike")),
+  ("Bike First Trip Users", Col(5068, "first_timers_bike")),
+  ("Bike Resurrect Users", Col(5068, "resurrect_bike")),
+  ("Bike Churned Users", Col(5068, "churn_bike")),
+  ("Average Fare (Bike)", Col(5072, "bike_average_fare")),
+  ("Bike Promo Spend (THB)", Col(5073, "bike_discount")),
+  ("Number of Promotion Trips (Bike)", Col(5073, "bike_discount_trips")),
+  ("Average Promo Value (Bike)", Col(5073, "average_bike_discount")),
+  ("Promo Per completed Ride (Bike)", lambda m: m['Bike Promo Spend (THB)'] / m['Completed Trips (Bike)']),
+  ("Promo per completed trip/Average Fare (Bike)", lambda m: m['Promo Per completed Ride (Bike)'] / m['Average Fare (Bike)']),
+  ("Promo Trips/Completed Trips (Bike)", lambda m: m['Number of Promotion Trips (Bike)'] / m['Completed Trips (Bike)']),
+
+  ("blank_9", None),
+  ("Spend per trip", lambda m: m['Total Spending (THB)'] / m['Completed Trips']),
+  ("Earn per trip", lambda m: m['Total Revenue'] / m['Completed Trips']),
+  ("P/L", lambda m: (m['Earn per trip'] / m['Spend per trip']) - 1),
+])
+
+
+def main():
+  load_dotenv()
+
+  redash = AsyncRedash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
+
+  start_date, output_date = previous_week_start(7)
+
+  queries = [Query(qid, params={"week_start_date": start_date}) for qid in QIDS]
+  redash.run_queries(queries)
+
+  df = WEEKLY.evaluate({"TH": {query.id: redash.get_result(query) for query in queries}})
+
+  # Week-over-week rows, against last week's run in the metric store
+  store = MetricStore()
+  current, previous = df["TH"], store.get("TH", "ALL", week_before(start_date))
+  if not previous:
+    logging.warning(f"No TH metrics for week {week_before(start_date)} in {store.path}; week-over-week rows left blank.")
+  df.loc["Percentage Growth", "TH"] = growth(current['Completed Trips'], previous.get('Completed Trips'))
+  df.loc["% Resurrect", "TH"] = rate(current['Resurrected Driver'], previous.get('Driver Weekly Complete'))
+  df.loc["% Churn", "TH"] = rate(current['Churn Driver'], previous.get('Driver Weekly Complete'))
+  df.loc["% Resurrect rider", "TH"] = rate(current['Resurrected Rider'], previous.get('Unique Completed Riders'))
+  df.loc["% Churn rider", "TH"] = rate(current['Churn Rider'], previous.get('Unique Completed Riders'))
+  store.append("TH", "ALL", start_date, df["TH"].to_dict())
+
   df.columns = [f"{output_date}"]
 
   output_file = f"TH_Weekly_{output_date}.csv"
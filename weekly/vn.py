@@ -1,218 +1,155 @@
+import logging
 import os
 
 import pandas as pd
 from dotenv import load_dotenv
 
-from utils.dates import previous_week_start
-from utils.helpers import Query, Redash
+from utils.dates import previous_week_start, week_before
+from utils.helpers import AsyncRedash, Query
+from utils.history import MetricStore, growth, rate
 from utils.slack import SlackBot
+from utils.spec import Col, Spec
+
+
+CITY_QIDS = [4607, 4611, 4612, 4613, 4614, 4615, 4616, 4617, 5212]
+
+# 4607 VN - Completed trips          4611 VN - Active Rider Weekly
+# 4612 VN - Driver FT R C            4613 VN - Rider FT R C
+# 4614 VN - Online                   4615 VN - Average Fare
+# 4616 VN - Promotion Spending Weekly
+# 4617 VN - Platform Fees Weekly     5212 VN - Payment Method Weekly
+WEEKLY = Spec([
+    ('completed_trips', Col(4607, 'total_completed_trip')),
+    ('daily_completed', Col(4607, 'daily_completed_trip')),
+    ('%_growth', None),
+
+    ('weekly_active_user', Col(4611, 'active_users')),
+    ('unique_completed_riders', Col(4607, 'rider_weekly_complete')),
+    ('Completed Riders / WAU', lambda m: m['unique_completed_riders'] / m['weekly_active_user']),
+
+    ('daily_avg_online_drivers', Col(4614, 'avg_online_drivers')),
+
+    ('daily_avg_completed_drivers', Col(4607, 'daily_avg_completed_drivers')),
+    ('completed / online', lambda m: m['daily_avg_completed_drivers'] / m['daily_avg_online_drivers']),
+    ('driver_weekly_complete', Col(4607, 'driver_weekly_complete')),
+    ('daily_avg / weekly_driver', lambda m: m['daily_avg_completed_drivers'] / m['driver_weekly_complete']),
+
+    ('avg_completed_trip_per_rider', lambda m: m['completed_trips'] / m['unique_completed_riders']),
+    ('avg_completed_trip_per_driver', lambda m: m['daily_completed'] / m['daily_avg_completed_drivers']),
+
+    ('new_driver_activated', Col(4612, 'first_timers')),
+    ('resurrect_driver', Col(4612, 'resurrect')),
+    ('%_resurrect', None),
+    ('churn_driver', Col(4612, 'churn')),
+    ('%_churn', None),
+    ('net_new_driver', lambda m: m['new_driver_activated'] + m['resurrect_driver'] - m['churn_driver']),
+
+    ('new_rider_activated', Col(4613, 'first_timers')),
+    ('resurrect_rider', Col(4613, 'resurrect')),
+    ('%_resurrect_rider', None),
+    ('churn_rider', Col(4613, 'churn')),
+    ('%_churn_rider', None),
+    ('net_new_rider', lambda m: m['new_rider_activated'] + m['resurrect_rider'] - m['churn_rider']),
+
+    ('R:D Ratio', lambda m: m['unique_completed_riders'] / m['driver_weekly_complete']),
+
+    ('blank_1', None),
+
+    ('average_fare_vnd', Col(4615, 'average_fare')),
+    ('average_fare_usd', None),
+    ('promo_spend_vnd', Col(4616, 'discount')),
+    ('promo_spend_usd', None),
+    ('promotion_trips', Col(4616, 'discount_trips')),
+    ('non_promotion_trips', lambda m: m['completed_trips'] - m['promotion_trips']),
+    ('promotion/completed', lambda m: m['promotion_trips'] / m['completed_trips']),
+
+    ('average_promotion_value', None),
+    ('promo_per_completed_ride', None),
+    ('promo_per_completed_rider', None),
+    ('promo / average_fare', None),
+    ('platform_fee_vnd', Col(4617, 'total_system_fee')),
+    ('platform_fee_usd', None),
+    ('platform_fee_per_completed_ride', None),
+
+    ('blank_2', None),
+] + [
+    metric
+    for vehicle, blank in (('car', 'blank_3'), ('bike', None))
+    for metric in [
+        (f'completed_trips_{vehicle}', Col(4607, f'{vehicle}_completed_trip')),
+        (f'{vehicle}_complete / total_complete', lambda m, v=vehicle: m[f'completed_trips_{v}'] / m['completed_trips']),
+        (f'daily_trips_{vehicle}', lambda m, v=vehicle: m[f'completed_trips_{v}'] / 7),
+        (f'completed_users_{vehicle}', Col(4607, f'rider_weekly_complete_{vehicle}')),
+        (f'first_trip_users_{vehicle}', Col(4613, f'first_timers_{vehicle}')),
+        (f'resurrect_users_{vehicle}', Col(4613, f'resurrect_{vehicle}')),
+        (f'churned_users_{vehicle}', Col(4613, f'churn_{vehicle}')),
+        (f'average_fare_vnd_{vehicle}', Col(4615, f'{vehicle}_average_fare')),
+        (f'average_fare_usd_{vehicle}', None),
+        (f'promo_spend_vnd_{vehicle}', Col(4616, f'{vehicle}_discount')),
+        (f'promo_spend_usd_{vehicle}', None),
+        (f'promotion_trips_{vehicle}', Col(4616, f'{vehicle}_discount_trips')),
+        (f'average_promotion_value_{vehicle}', None),
+        (f'promo_per_completed_ride_{vehicle}', None),
+        (f'promo / average_fare {vehicle}', None),
+        (f'promo / completed_trips {vehicle}', lambda m, v=vehicle: m[f'promotion_trips_{v}'] / m[f'completed_trips_{v}']),
+        (f'platform_fee_vnd_{vehicle}', Col(4617, f'{vehicle}_total_system_fee')),
+        (f'platform_fee_usd_{vehicle}', None),
+        (f'platform_fee_per_completed_ride_{vehicle}', None),
+    ] + ([(blank, None)] if blank else [])
+])
+
+PAYMENT = Spec([
+    (f'{prefix}_{method}_{measure}', Col(5212, f'{column}{method}_{measure}'))
+    for prefix, column in (('total', ''), ('bike', 'bike_'), ('car', 'car_'))
+    for method in ('cash', 'momo', 'card')
+    for measure in ('trips', 'gmv')
+])
+
+
+def city_queries(start_date, city):
+    """Queries for a specific city, keyed by query id"""
+    return {qid: Query(qid, params={"week_start_date": start_date, "city": city}) for qid in CITY_QIDS}
+
+
+def add_trends(weekly, start_date, store):
+    """Fill the week-over-week rows of every city against last week's run in the metric store"""
+    for city in weekly.columns:
+        current, previous = weekly[city], store.get("VN", city, week_before(start_date))
+        if not previous:
+            logging.warning(f"No VN {city} metrics for week {week_before(start_date)} in {store.path}; week-over-week rows left blank.")
+        weekly.loc['%_growth', city] = growth(current['completed_trips'], previous.get('completed_trips'))
+        weekly.loc['%_resurrect', city] = rate(current['resurrect_driver'], previous.get('driver_weekly_complete'))
+        weekly.loc['%_churn', city] = rate(current['churn_driver'], previous.get('driver_weekly_complete'))
+        weekly.loc['%_resurrect_rider', city] = rate(current['resurrect_rider'], previous.get('unique_completed_riders'))
+        weekly.loc['%_churn_rider', city] = rate(current['churn_rider'], previous.get('unique_completed_riders'))
+        store.append("VN", city, start_date, weekly[city].to_dict())
 
 
-def process_city_data(redash, start_date, city):
-    """Process data for a specific city"""
-    
-    # Run queries with city parameter
-    queries = [
-        Query(4607, params={"week_start_date": start_date, "city": city}),
-        Query(4611, params={"week_start_date": start_date, "city": city}),
-        Query(4612, params={"week_start_date": start_date, "city": city}),
-        Query(4613, params={"week_start_date": start_date, "city": city}),
-        Query(4614, params={"week_start_date": start_date, "city": city}),
-        Query(4615, params={"week_start_date": start_date, "city": city}),
-        Query(4616, params={"week_start_date": start_date, "city": city}),
-        Query(4617, params={"week_start_date": start_date, "city": city}),
-        Query(5212, params={"week_start_date": start_date, "city": city}),
-    ]
-
-    redash.run_queries(queries)
-
-    # Fetch results
-    df1 = redash.get_result(4607) # VN - Completed trips
-    df2 = redash.get_result(4611) # VN - Active Rider Weekly
-    df3 = redash.get_result(4612) # VN - Driver FT R C
-    df4 = redash.get_result(4613) # VN - Rider FT R C
-    df5 = redash.get_result(4614) # VN - Online
-    df6 = redash.get_result(4615) # VN - Average Fare
-    df7 = redash.get_result(4616) # VN - Promotion Spending Weekly
-    df8 = redash.get_result(4617) # VN - Platform Fees Weekly
-    df9 = redash.get_result(5212) # VN - Payment Method Weekly
-
-    # Construct weekly dataFrame
-    df = pd.DataFrame()
-
-    df['completed_trips'] = df1.total_completed_trip
-    df['daily_completed'] = df1.daily_completed_trip
-    df['%_growth'] = None
-
-    df['weekly_active_user'] = df2.active_users
-    df['unique_completed_riders'] = df1.rider_weekly_complete
-    df['Completed Riders / WAU'] = df.unique_completed_riders / df.weekly_active_user
-
-    df['daily_avg_online_drivers'] = df5.avg_online_drivers
-
-    df['daily_avg_completed_drivers'] = df1.daily_avg_completed_drivers
-    df['completed / online'] = df1.daily_avg_completed_drivers / df.daily_avg_online_drivers
-    df['driver_weekly_complete'] = df1.driver_weekly_complete
-    df['daily_avg / weekly_driver'] = df.daily_avg_completed_drivers / df.driver_weekly_complete
-
-    df['avg_completed_trip_per_rider'] = df.completed_trips / df.unique_completed_riders
-    df['avg_completed_trip_per_driver'] = df.daily_completed / df.daily_avg_completed_drivers
-
-    df = df.copy()
-
-    df['new_driver_activated'] = df3.first_timers
-    df['resurrect_driver'] = df3.resurrect
-    df['%_resurrect'] = None
-    df['churn_driver'] = df3.churn
-    df['%_churn'] = None
-    df['net_new_driver'] = df.new_driver_activated + df.resurrect_driver - df.churn_driver
-
-    df['new_rider_activated'] = df4.first_timers
-    df['resurrect_rider'] = df4.resurrect
-    df['%_resurrect_rider'] = None
-    df['churn_rider'] = df4.churn
-    df['%_churn_rider'] = None
-    df['net_new_rider'] = df.new_rider_activated + df.resurrect_rider - df.churn_rider
-
-    df['R:D Ratio'] = df.unique_completed_riders / df.driver_weekly_complete
-    
-    df['blank_1'] = None
-
-    df = df.copy()
-
-    df['average_fare_vnd'] = df6.average_fare
-    df['average_fare_usd'] = None
-    df['promo_spend_vnd'] = df7.discount
-    df['promo_spend_usd'] = None
-    df['promotion_trips'] = df7.discount_trips
-    df['non_promotion_trips'] = df.completed_trips - df7.discount_trips
-    df['promotion/completed'] = df.promotion_trips / df.completed_trips
-
-    df['average_promotion_value'] = None
-    df['promo_per_completed_ride'] = None
-    df['promo_per_completed_rider'] = None
-    df['promo / average_fare'] = None
-    df['platform_fee_vnd'] = df8.total_system_fee
-    df['platform_fee_usd'] = None
-    df['platform_fee_per_completed_ride'] = None
-
-    df['blank_2'] = None
-
-    df = df.copy()
-
-    df['completed_trips_car'] = df1.car_completed_trip
-    df['car_complete / total_complete'] = df.completed_trips_car / df.completed_trips
-    df['daily_trips_car'] = df.completed_trips_car / 7
-    df['completed_users_car'] = df1.rider_weekly_complete_car
-    df['first_trip_users_car'] = df4.first_timers_car
-    df['resurrect_users_car'] = df4.resurrect_car
-    df['churned_users_car'] = df4.churn_car
-    df['average_fare_vnd_car'] = df6.car_average_fare
-    df['average_fare_usd_car'] = None
-    df['promo_spend_vnd_car'] = df7.car_discount
-    df['promo_spend_usd_car'] = None
-    df['promotion_trips_car'] = df7.car_discount_trips
-    df['average_promotion_value_car'] = None
-    df['promo_per_completed_ride_car'] = None
-    df['promo / average_fare car'] = None
-    df['promo / completed_trips car'] = df.promotion_trips_car / df.completed_trips_car
-    df['platform_fee_vnd_car'] = df8.car_total_system_fee
-    df['platform_fee_usd_car'] = None
-    df['platform_fee_per_completed_ride_car'] = None
-
-    df['blank_3'] = None
-
-    df = df.copy()
-
-    df['completed_trips_bike'] = df1.bike_completed_trip
-    df['bike_complete / total_complete'] = df.completed_trips_bike / df.completed_trips
-    df['daily_trips_bike'] = df.completed_trips_bike / 7
-    df['completed_users_bike'] = df1.rider_weekly_complete_bike
-    df['first_trip_users_bike'] = df4.first_timers_bike
-    df['resurrect_users_bike'] = df4.resurrect_bike
-    df['churned_users_bike'] = df4.churn_bike
-    df['average_fare_vnd_bike'] = df6.bike_average_fare
-    df['average_fare_usd_bike'] = None
-    df['promo_spend_vnd_bike'] = df7.bike_discount
-    df['promo_spend_usd_bike'] = None
-    df['promotion_trips_bike'] = df7.bike_discount_trips
-    df['average_promotion_value_bike'] = None
-    df['promo_per_completed_ride_bike'] = None
-    df['promo / average_fare bike'] = None
-    df['promo / completed_trips bike'] = df.promotion_trips_bike / df.completed_trips_bike
-    df['platform_fee_vnd_bike'] = df8.bike_total_system_fee
-    df['platform_fee_usd_bike'] = None
-    df['platform_fee_per_completed_ride_bike'] = None
-
-    df = df.copy()
-
-    df = df.T
-    df.columns = [f"{start_date}"]
-    
-    # Payment Method sheet
-    pm = pd.DataFrame()
-    
-    pm['total_cash_trips'] = df9.cash_trips
-    pm['total_cash_gmv'] = df9.cash_gmv
-    pm['total_momo_trips'] = df9.momo_trips
-    pm['total_momo_gmv'] = df9.momo_gmv
-    pm['total_card_trips'] = df9.card_trips
-    pm['total_card_gmv'] = df9.card_gmv
-    pm['bike_cash_trips'] = df9.bike_cash_trips
-    pm['bike_cash_gmv'] = df9.bike_cash_gmv
-    pm['bike_momo_trips'] = df9.bike_momo_trips
-    pm['bike_momo_gmv'] = df9.bike_momo_gmv
-    pm['bike_card_trips'] = df9.bike_card_trips
-    pm['bike_card_gmv'] = df9.bike_card_gmv
-    pm['car_cash_trips'] = df9.car_cash_trips
-    pm['car_cash_gmv'] = df9.car_cash_gmv
-    pm['car_momo_trips'] = df9.car_momo_trips
-    pm['car_momo_gmv'] = df9.car_momo_gmv
-    pm['car_card_trips'] = df9.car_card_trips
-    pm['car_card_gmv'] = df9.car_card_gmv
-    
-    pm = pm.T
-    pm.columns = [f"{start_date}"]
-    pm.fillna(0, inplace=True)
-    
-    return df, pm
-
 def main():
     load_dotenv()
 
-    redash = Redash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
+    redash = AsyncRedash(key=os.getenv("REDASH_API_KEY"), base_url=os.getenv("REDASH_BASE_URL"))
 
     start_date, output_date = previous_week_start(7)
 
     # Process data for each city
     cities = ["ALL", "HCM", "HAN"]
     
-    # Store all data
-    weekly_reports = {}
-    payment_methods = {}
-    
-    for city in cities:
-        print(f"Processing data for {city}...")
-        df, pm = process_city_data(redash, start_date, city)
-        weekly_reports[city] = df
-        payment_methods[city] = pm
-    
-    # Create combined sheets
-    combined_weekly = pd.DataFrame()
-    metrics = weekly_reports["ALL"].index
-    combined_weekly["Metric"] = metrics
-    
-    for city in cities:
-        city_data = weekly_reports[city][start_date]
-        combined_weekly[city] = city_data.values
-    
-    combined_pm = pd.DataFrame()
-    pm_metrics = payment_methods["ALL"].index
-    combined_pm["Metric"] = pm_metrics
-    
-    for city in cities:
-        city_pm_data = payment_methods[city][start_date]
-        combined_pm[city] = city_pm_data.values
+    # Every city's variant of the queries goes out as one batch
+    redash.run_queries([query for city in cities for query in city_queries(start_date, city).values()])
+
+    results = {
+        city: {qid: redash.get_result(query) for qid, query in city_queries(start_date, city).items()}
+        for city in cities
+    }
+
+    # One column per city, every city evaluated at once
+    weekly = WEEKLY.evaluate(results)
+    add_trends(weekly, start_date, MetricStore())
+    payment = PAYMENT.evaluate(results).fillna(0)
+
+    combined_weekly = weekly.rename_axis("Metric").reset_index()
+    combined_pm = payment.rename_axis("Metric").reset_index()
     
     # Create output filename
     output_file = f"VN_Weekly_{output_date}.xlsx"